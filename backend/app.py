@@ -1,19 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import asyncio
 import logging
+import math
+import re
+import time
 import traceback
-import json
 from services.pdf_service import pdf_service
-from services.flashcard_service import flashcard_service
-from services.enhanced_learning_service import enhanced_learning_service
+from services.document_cache import document_cache, hash_bytes, hash_source
+from services.document_store import DocumentStoreFullError, document_store
+from services.completion_cache import bypass_completion_cache, completion_cache
 from services.copilot_service import copilot_client
+from services.flashcard_service import flashcard_service
+from services.hedging import completion_hedger
+from services.llm_scheduler import RateLimitError, llm_scheduler
+from services.generation import GENERATION_TASKS, GenerationTask, iter_document_pages
+from services.job_queue import JobQueueFullError, job_queue
+from services.resilience import CircuitOpenError, UpstreamError, upstream_breaker, upstream_retry
+from services.single_flight import completion_flights, generation_flights
+from services.upload_store import UploadAbortedError, UploadDigestError, UploadRangeError, upload_store
+from PyPDF2.errors import PdfReadError
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
-from utils.logger_config import setup_logger
-import PyPDF2
-import requests
+from utils import fast_json
+from utils.deadline import DeadlineExceeded, deadline_after
+from utils.event_loop import shared_loop
+from utils.logger_config import logging_stats, setup_logger
+from utils.metrics import (HASH, ITEMS_RETURNED, REQUEST_SECONDS, SERIALIZE, UPLOAD, current_request,
+                           render_prometheus, start_request, timed)
 
 # Set up main application logger
 logger = setup_logger('app', 'app.log')
@@ -22,7 +38,26 @@ logger = setup_logger('app', 'app.log')
 logger.info("Loading environment variables...")
 load_dotenv(override=True)
 
-app = Flask(__name__)
+# Off only to measure Flask's stock per-request event loops (benchmarks/bench_concurrency.py)
+SHARED_EVENT_LOOP = os.getenv('SHARED_EVENT_LOOP', 'true').lower() not in ('0', 'false', 'no')
+
+class SharedLoopFlask(Flask):
+    """Flask app whose async views run on the process-wide event loop."""
+
+    def async_to_sync(self, func):
+        # Flask's default starts a fresh event loop per request. Running every
+        # view on one shared loop lets all in-flight Cohere calls in the
+        # process be multiplexed on it, together with the pooled HTTP session.
+        if not SHARED_EVENT_LOOP:
+            return super().async_to_sync(func)
+
+        def run_on_shared_loop(*args, **kwargs):
+            return shared_loop.call(func(*args, **kwargs))
+        return run_on_shared_loop
+
+app = SharedLoopFlask(__name__)
+# Generated items are result models; serialize them directly with the fast backend
+app.json = fast_json.FastJSONProvider(app)
 
 # Configure CORS with specific settings
 CORS(app, resources={
@@ -35,387 +70,583 @@ CORS(app, resources={
             "http://192.168.31.10:8080",
             "http://192.168.31.10:8081"
         ],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept", "X-Chunk-Number", "X-Total-Chunks"],
+        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        "expose_headers": ["Server-Timing"],
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "X-Chunk-Number", "X-Total-Chunks", "X-Cache-Bypass", "X-Request-Timeout", "Content-Range"],
         "supports_credentials": False,
         "max_age": 3600
     }
 })
 
 # Configure upload settings
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB per request; larger PDFs go through /api/uploads in ranges
 app.config['UPLOAD_FOLDER'] = 'uploads'
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
-LARGE_FILE_THRESHOLD = 5 * 1024 * 1024  # 5MB in bytes
+# Seconds a generation request may take, including every nested LLM call and retry
+GENERATION_TIMEOUT = float(os.getenv('GENERATION_TIMEOUT', 300))
+# Shortest X-Request-Timeout honoured, so a client cannot ask for a deadline that has already passed
+MIN_REQUEST_TIMEOUT = 1.0
 
-def get_pdf_metadata(filepath: str) -> dict:
-    """Get metadata about the PDF file."""
-    try:
-        with open(filepath, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            return {
-                'total_pages': len(pdf_reader.pages),
-                'file_size': os.path.getsize(filepath)
-            }
-    except Exception as e:
-        logger.error(f"Error getting PDF metadata: {str(e)}")
-        raise
+@app.before_request
+def start_request_timings():
+    # Stages the request's work records are summed into its Server-Timing header
+    start_request()
 
-def extract_text_chunk(filepath: str, chunk_number: int, total_chunks: int) -> str:
-    """Extract text from a specific chunk of the PDF."""
-    try:
-        with open(filepath, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            total_pages = len(pdf_reader.pages)
-            pages_per_chunk = max(1, total_pages // total_chunks)
-            start_page = (chunk_number - 1) * pages_per_chunk
-            end_page = min(start_page + pages_per_chunk, total_pages)
-            
-            text = ""
-            for page_num in range(start_page, end_page):
-                page_text = pdf_reader.pages[page_num].extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            
-            return text.strip()
-    except Exception as e:
-        logger.error(f"Error extracting text chunk: {str(e)}")
-        raise
+@app.after_request
+def add_server_timing(response):
+    timings = current_request()
+    if timings is not None:
+        # For streams this covers the work done before the first byte
+        response.headers['Server-Timing'] = timings.server_timing()
+        REQUEST_SECONDS.observe(request.endpoint or 'unknown', time.monotonic() - timings.started)
+    return response
 
-def extract_full_text(filepath: str) -> str:
-    """Extract text from the entire PDF."""
+@app.before_request
+def read_cache_bypass():
+    # Set on every request: gthread workers reuse threads, and so their context
+    bypass = request.headers.get('X-Cache-Bypass', '').lower() in ('1', 'true', 'yes')
+    bypass = bypass or 'no-cache' in request.headers.get('Cache-Control', '')
+    bypass_completion_cache.set(bypass)
+
+def load_request_pdf():
+    """
+    Resolve the PDF a request refers to.
+
+    Requests either reference a stored document session by 'document_id'
+    (form field or JSON body) or upload the PDF as the multipart 'file' part.
+
+    Returns:
+        tuple: (pdf_bytes, digest, error) where digest is None unless the
+        document session already knows it, and error is a response tuple to
+        return when the request is invalid.
+    """
+    payload = request.get_json(silent=True) or {}
+    document_id = request.form.get('document_id') or payload.get('document_id')
+    if document_id:
+        session = document_store.get(document_id)
+        if session is None:
+            return None, None, (jsonify({'error': 'Unknown or expired document_id'}), 404)
+        return session.pdf_bytes, session.digest, None
+
+    if 'file' not in request.files:
+        return None, None, (jsonify({'error': 'No file part'}), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return None, None, (jsonify({'error': 'No selected file'}), 400)
+
+    if not file.filename.lower().endswith('.pdf'):
+        return None, None, (jsonify({'error': 'Only PDF files are allowed'}), 400)
+
+    return read_upload(file), None, None
+
+def read_upload(file) -> bytes:
+    """
+    Take an uploaded PDF off the request without a save-and-reopen round trip.
+
+    Werkzeug has already spooled the part (in memory, or in an anonymous
+    temporary file when large), so it is read straight into bytes.
+    Parsing needs the whole PDF in memory anyway, and MAX_CONTENT_LENGTH
+    bounds its size; PDFs beyond that go through /api/uploads.
+    """
+    file.stream.seek(0)
+    return file.stream.read()
+
+def get_pdf_metadata(source, digest: str = None) -> dict:
+    """Get metadata about the PDF file."""
     try:
-        with open(filepath, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            return text.strip()
+        document = document_cache.get_or_extract(source, digest)
+        return {
+            'total_pages': document.page_count,
+            'file_size': document.file_size
+        }
     except Exception as e:
-        logger.error(f"Error extracting full text: {str(e)}")
+        logger.error(f"Error getting PDF metadata: {str(e)}")
         raise
 
-@app.route('/api/metadata', methods=['POST'])
-async def get_metadata():
+@app.route('/api/documents', methods=['POST'])
+def create_document():
+    """Upload a PDF once and get a document_id for the feature endpoints."""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
-            
+
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
-            
+
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'error': 'Only PDF files are allowed'}), 400
 
-        # Save the file temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with timed(UPLOAD):
+            pdf_bytes = file.read()
+        with timed(HASH):
+            digest = hash_bytes(pdf_bytes)
 
+        # Extract up front so the first feature call does not pay for parsing, and
+        # before storing, so an unreadable PDF never holds a session
         try:
-            metadata = get_pdf_metadata(filepath)
-            return jsonify(metadata)
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            metadata = get_pdf_metadata(pdf_bytes, digest)
+        except PdfReadError as e:
+            return jsonify({'error': f'Invalid PDF: {str(e)}'}), 400
+
+        try:
+            session = document_store.create(pdf_bytes, secure_filename(file.filename), digest)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 503
+
+        response = session.to_dict(document_store.ttl)
+        response.update(metadata)
+        return jsonify(response), 201
 
     except Exception as e:
-        logger.error(f"Error in metadata endpoint: {str(e)}")
+        logger.error(f"Error in document upload endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/flashcards/generate', methods=['POST'])
-async def generate_flashcards():
+@app.route('/api/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    session = document_store.get(document_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired document_id'}), 404
+    response = session.to_dict(document_store.ttl)
+    response.update(get_pdf_metadata(session.pdf_bytes, session.digest))
+    return jsonify(response)
+
+@app.route('/api/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    if not document_store.delete(document_id):
+        return jsonify({'error': 'Unknown or expired document_id'}), 404
+    return jsonify({'message': 'Document deleted'})
+
+def parse_content_range(header: str):
+    """Parse 'bytes start-end/total' into (start, end, total), or None if malformed."""
+    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', (header or '').strip())
+    if match is None:
+        return None
+    start, end, total = (int(group) for group in match.groups())
+    if start > end or end >= total:
+        return None
+    return start, end, total
+
+def finished_upload_response(upload, session):
+    """The 201 a finished upload gets: its document session plus metadata, as from POST /api/documents."""
+    if session is None:
+        return jsonify({'error': 'Unknown or expired document_id'}), 404
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'}), 400
-            
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
+        metadata = get_pdf_metadata(session.pdf_bytes, session.digest)
+    except PdfReadError as e:
+        # The bytes arrived intact but are not a PDF; do not keep them
+        document_store.delete(session.document_id)
+        return jsonify({'error': f'Invalid PDF: {str(e)}'}), 400
+    response = session.to_dict(document_store.ttl)
+    response.update(metadata)
+    response['upload_id'] = upload.upload_id
+    response['deduplicated'] = upload.deduplicated
+    return jsonify(response), 201
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload for PDFs too large to send in one request.
+
+    Takes JSON {filename, size, sha256?}. Send the file as byte ranges with
+    PUT /api/uploads/<upload_id> and a 'Content-Range: bytes start-end/size'
+    header, in order, each at most 'chunk_size' bytes. If sha256 is given and
+    the same PDF is already stored, the upload completes at once and the
+    response is the new document instead.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        filename = payload.get('filename') or ''
+        if filename == '':
+            return jsonify({'error': 'No filename'}), 400
+        if not filename.lower().endswith('.pdf'):
             return jsonify({'error': 'Only PDF files are allowed'}), 400
-
-        # Save the file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        try:
+            size = int(payload.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'size must be an integer'}), 400
 
         try:
-            # Check if we need to process in chunks
-            chunk_number = request.headers.get('X-Chunk-Number')
-            total_chunks = request.headers.get('X-Total-Chunks')
-            
-            if chunk_number and total_chunks:
-                # Process chunk
-                text = extract_text_chunk(filepath, int(chunk_number), int(total_chunks))
-            else:
-                # Process entire file
-                text = extract_full_text(filepath)
-            
-            if len(text) > 5000:  # Limit text length
-                text = text[:5000]
-
-            # Generate flashcards
-            flashcards = await asyncio.wait_for(
-                flashcard_service.generate_flashcards(text),
-                timeout=60
-            )
-
-            return jsonify({
-                'flashcards': flashcards,
-                'message': 'Generated flashcards successfully'
-            })
+            upload = upload_store.create(secure_filename(filename), size, payload.get('sha256'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if upload.complete:
+            return finished_upload_response(upload, document_store.get(upload.document_id))
+        response = upload.to_dict(upload_store.ttl)
+        response['chunk_size'] = upload_store.chunk_size
+        response = jsonify(response)
+        response.status_code = 201
+        response.headers['Location'] = f"/api/uploads/{upload.upload_id}"
+        return response
 
-        finally:
-            # Clean up the file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+    except Exception as e:
+        logger.error(f"Error creating upload: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Append one byte range to an upload.
+
+    Returns 200 with the bytes received so far, or 201 with the document once
+    the last byte is in. A range that starts past 'received' gets a 409 with
+    the offset to resume from; bytes already received are skipped.
+    """
+    try:
+        upload = upload_store.get(upload_id)
+        if upload is None:
+            return jsonify({'error': 'Unknown or expired upload_id'}), 404
+
+        content_range = parse_content_range(request.headers.get('Content-Range'))
+        if content_range is None:
+            return jsonify({'error': 'Content-Range must be "bytes start-end/total"',
+                            'received': upload.received}), 416
+        start, end, total = content_range
+        if request.content_length != end - start + 1:
+            return jsonify({'error': 'Body length does not match Content-Range',
+                            'received': upload.received}), 400
+
+        try:
+            with timed(UPLOAD):
+                session = upload_store.write(upload, start, total, request.stream, request.content_length)
+        except UploadRangeError as e:
+            return jsonify({'error': str(e), 'received': e.received}), 409
+        except UploadDigestError as e:
+            return jsonify({'error': str(e)}), 422
+        except UploadAbortedError:
+            return jsonify({'error': 'Unknown or expired upload_id'}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e), 'received': upload.received}), 503
+        except ClientDisconnected:
+            logger.warning(f"Upload {upload_id} interrupted at byte {upload.received}")
+            return jsonify({'error': 'Upload interrupted', 'received': upload.received}), 400
+
+        if not upload.complete:
+            return jsonify(upload.to_dict(upload_store.ttl))
+        return finished_upload_response(upload, session)
 
     except Exception as e:
-        logger.error(f"Error in flashcard generation: {str(e)}")
+        logger.error(f"Error in upload chunk endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/learning/enhanced', methods=['POST'])
-async def generate_enhanced_learning():
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Progress of an upload: resume from 'received', or use 'document_id' once complete."""
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown or expired upload_id'}), 404
+    return jsonify(upload.to_dict(upload_store.ttl))
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    if not upload_store.delete(upload_id):
+        return jsonify({'error': 'Unknown or expired upload_id'}), 404
+    return jsonify({'message': 'Upload deleted'})
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Cache and scheduler counters, for checking hit rates in production."""
+    return jsonify({
+        'completion_cache': completion_cache.stats(),
+        'document_cache': document_cache.stats(),
+        'single_flight': {
+            'generation': generation_flights.stats(),
+            'completion': completion_flights.stats()
+        },
+        'jobs': job_queue.stats(),
+        'llm_scheduler': llm_scheduler.stats(),
+        'hedging': completion_hedger.stats(),
+        'retries': upstream_retry.stats(),
+        'circuit_breaker': upstream_breaker.stats(),
+        'flashcards': flashcard_service.stats(),
+        'uploads': upload_store.stats(),
+        'logging': logging_stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Per-stage latency histograms and throughput counters in the Prometheus text format."""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metadata', methods=['POST'])
+async def get_metadata():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'}), 400
-            
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files are allowed'}), 400
+        # Form parsing and reading the upload must not block the shared loop
+        with timed(UPLOAD):
+            source, digest, error = await asyncio.to_thread(load_request_pdf)
+        if error:
+            return error
 
-        # Save the file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        metadata = await asyncio.to_thread(get_pdf_metadata, source, digest)
+        return jsonify(metadata)
 
-        try:
-            # Check if we need to process in chunks
-            chunk_number = request.headers.get('X-Chunk-Number')
-            total_chunks = request.headers.get('X-Total-Chunks')
-            
-            if chunk_number and total_chunks:
-                # Process chunk
-                text = extract_text_chunk(filepath, int(chunk_number), int(total_chunks))
-            else:
-                # Process entire file
-                text = extract_full_text(filepath)
-            
-            # Instead of truncating, we'll process the text in overlapping segments
-            # to ensure we don't miss concepts that might span across the 5000 character limit
-            if len(text) > 5000:
-                # Process the first 5000 characters
-                first_segment = text[:5000]
-                # Process the next 5000 characters with 1000 character overlap
-                second_segment = text[4000:9000] if len(text) > 9000 else text[4000:]
-                
-                # Generate content for both segments
-                first_content = await asyncio.wait_for(
-                    enhanced_learning_service.generate_learning_content(first_segment),
-                    timeout=60
-                )
-                
-                second_content = []
-                if len(text) > 5000:
-                    second_content = await asyncio.wait_for(
-                        enhanced_learning_service.generate_learning_content(second_segment),
-                        timeout=60
-                    )
-                
-                # Combine and deduplicate content
-                all_content = first_content + second_content
-                unique_content = []
-                seen_concepts = set()
-                
-                for content in all_content:
-                    if content['concept'] not in seen_concepts:
-                        seen_concepts.add(content['concept'])
-                        unique_content.append(content)
-                
-                learning_content = unique_content
-            else:
-                # Process the entire text if it's under 5000 characters
-                learning_content = await asyncio.wait_for(
-                    enhanced_learning_service.generate_learning_content(text),
-                    timeout=60
-                )
-
-            return jsonify({
-                'learning_content': learning_content,
-                'message': 'Generated learning content successfully'
-            })
+    except Exception as e:
+        logger.error(f"Error in metadata endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
+def request_chunk():
+    """(chunk_number, total_chunks) from the X-Chunk-Number/X-Total-Chunks headers, or None for the whole document."""
+    chunk_number = request.headers.get('X-Chunk-Number')
+    total_chunks = request.headers.get('X-Total-Chunks')
+    if chunk_number and total_chunks:
+        return int(chunk_number), int(total_chunks)
+    return None
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {fast_json.dumps(data)}\n\n"
+
+
+def wants_event_stream(data: dict) -> bool:
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def requested_stream_format():
+    """
+    How a generation endpoint should answer: None for one JSON body, 'ndjson' or 'sse' to stream.
+
+    Clients opt in with an Accept header (application/x-ndjson or
+    text/event-stream) or a 'stream' form field, query parameter or JSON key
+    set to 'ndjson', 'sse' or true (which means SSE).
+    """
+    accept = request.headers.get('Accept', '')
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    if 'text/event-stream' in accept:
+        return 'sse'
+    payload = request.get_json(silent=True) or {}
+    value = request.form.get('stream') or request.args.get('stream') or payload.get('stream')
+    if isinstance(value, str):
+        value = value.lower()
+        if value == 'ndjson':
+            return 'ndjson'
+        return 'sse' if value in ('1', 'true', 'yes', 'sse') else None
+    return 'sse' if value else None
+
+def generation_stream_response(events, stream_format: str) -> Response:
+    """
+    Stream generation events as NDJSON lines or Server-Sent Events.
+
+    The async event generator runs on the shared loop and is closed once the
+    stream finishes or the client goes away.
+    """
+    def encode(event: str, data: dict) -> str:
+        if event == 'items':
+            for field, value in data.items():
+                if isinstance(value, list):
+                    ITEMS_RETURNED.inc(len(value), field)
+        with timed(SERIALIZE):
+            if stream_format == 'sse':
+                return sse_event(data, event=event)
+            return fast_json.dumps({'event': event, **data}) + "\n"
+
+    def generate():
+        stream = shared_loop.iterate(events)
+        try:
+            for event, data in stream:
+                yield encode(event, data)
+        except Exception as e:
+            logger.error(f"Error while streaming generated items: {str(e)}")
+            yield encode('error', {'error': str(e)})
         finally:
-            # Clean up the file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            stream.close()
 
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def request_deadline():
+    """
+    Deadline for the current request: GENERATION_TIMEOUT from now, or sooner
+    if the client sends a shorter X-Request-Timeout (seconds). The header is
+    clamped to at least MIN_REQUEST_TIMEOUT; malformed or non-finite values
+    are ignored.
+    """
+    timeout = GENERATION_TIMEOUT
+    try:
+        requested = float(request.headers.get('X-Request-Timeout', timeout))
+    except ValueError:
+        requested = timeout
+    if math.isfinite(requested):
+        timeout = min(timeout, max(MIN_REQUEST_TIMEOUT, requested))
+    return deadline_after(timeout)
+
+def generation_error_response(error: Exception):
+    """Error response for a failed generation request."""
+    if isinstance(error, CircuitOpenError):
+        response = jsonify({'error': 'Cohere API is failing, try again shortly', 'details': str(error)})
+        response.headers['Retry-After'] = str(int(error.retry_after + 0.5))
+        return response, 503
+    if isinstance(error, DeadlineExceeded):
+        return jsonify({'error': 'Generation took too long', 'details': str(error)}), 504
+    return jsonify({'error': str(error)}), 500
+
+async def run_generation(task: GenerationTask):
+    """Generate the task's study material for the request's PDF, as one JSON body or a stream."""
+    deadline = request_deadline()
+    # Form parsing and reading the upload must not block the shared loop
+    with timed(UPLOAD):
+        source, digest, error = await asyncio.to_thread(load_request_pdf)
+    if error:
+        return error
+
+    chunk = request_chunk()
+    if digest is None:
+        with timed(HASH):
+            digest = await asyncio.to_thread(hash_source, source)
+    pages, total_chars, boilerplate = await asyncio.to_thread(iter_document_pages, source, digest, *(chunk or ()))
+
+    stream_format = requested_stream_format()
+    if stream_format:
+        events = task.iter_events(pages, total_chars, boilerplate, deadline)
+        return generation_stream_response(events, stream_format)
+
+    # Double clicks and client retries join the identical request already running
+    items = await task.generate(pages, total_chars, digest, chunk, deadline)
+    for field, field_items in items.items():
+        ITEMS_RETURNED.inc(len(field_items), field)
+    with timed(SERIALIZE):
+        return jsonify({
+            **items,
+            'message': task.message
+        })
+
+@app.route('/api/flashcards/generate', methods=['POST'])
+async def generate_flashcards():
+    try:
+        return await run_generation(GENERATION_TASKS['flashcards'])
+    except Exception as e:
+        logger.error(f"Error in flashcard generation: {str(e)}")
+        return generation_error_response(e)
+
+@app.route('/api/learning/enhanced', methods=['POST'])
+async def generate_enhanced_learning():
+    try:
+        return await run_generation(GENERATION_TASKS['learning'])
     except Exception as e:
         logger.error(f"Error in learning content generation: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return generation_error_response(e)
 
 @app.route('/api/quiz/generate', methods=['POST'])
 async def generate_quiz():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'}), 400
-            
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files are allowed'}), 400
-
-        # Save the file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        return await run_generation(GENERATION_TASKS['quiz'])
+    except Exception as e:
+        logger.error(f"Error in quiz generation: {str(e)}")
+        return generation_error_response(e)
 
-        try:
-            # Check if we need to process in chunks
-            chunk_number = request.headers.get('X-Chunk-Number')
-            total_chunks = request.headers.get('X-Total-Chunks')
-            
-            if chunk_number and total_chunks:
-                # Process chunk
-                text = extract_text_chunk(filepath, int(chunk_number), int(total_chunks))
-            else:
-                # Process entire file
-                text = extract_full_text(filepath)
-            
-            # Process text in segments to generate more questions
-            if len(text) > 5000:
-                # Process the first 5000 characters
-                first_segment = text[:5000]
-                # Process the next 5000 characters with 1000 character overlap
-                second_segment = text[4000:9000] if len(text) > 9000 else text[4000:]
-                
-                # Generate questions for both segments
-                first_prompt = f"""Based on the following text, generate a quiz with 5 multiple choice questions. Each question should:
-1. Test understanding of key concepts
-2. Have exactly 4 options labeled A, B, C, and D
-3. Include a clear explanation for the correct answer
-
-Text to use for generating questions:
-{first_segment}
-
-Format the response as a JSON object with a 'quiz' array containing objects with:
-- question: string
-- options: array of 4 strings
-- correct_answer: string (one of the options)
-- explanation: string explaining why the answer is correct"""
-
-                second_prompt = f"""Based on the following text, generate a quiz with 5 multiple choice questions. Each question should:
-1. Test understanding of key concepts
-2. Have exactly 4 options labeled A, B, C, and D
-3. Include a clear explanation for the correct answer
-
-Text to use for generating questions:
-{second_segment}
-
-Format the response as a JSON object with a 'quiz' array containing objects with:
-- question: string
-- options: array of 4 strings
-- correct_answer: string (one of the options)
-- explanation: string explaining why the answer is correct"""
-
-                # Generate questions for both segments
-                first_response = await asyncio.wait_for(
-                    copilot_client.generate_chat_completion([
-                        {
-                            "role": "user",
-                            "content": first_prompt
-                        }
-                    ]),
-                    timeout=120
-                )
-                
-                second_response = []
-                if len(text) > 5000:
-                    second_response = await asyncio.wait_for(
-                        copilot_client.generate_chat_completion([
-                            {
-                                "role": "user",
-                                "content": second_prompt
-                            }
-                        ]),
-                        timeout=120
-                    )
-                
-                # Parse and combine responses
-                first_quiz_data = json.loads(first_response)
-                second_quiz_data = json.loads(second_response) if second_response else {"quiz": []}
-                
-                # Combine and deduplicate questions
-                all_questions = first_quiz_data.get('quiz', []) + second_quiz_data.get('quiz', [])
-                unique_questions = []
-                seen_questions = set()
-                
-                for question in all_questions:
-                    # Create a unique key for each question
-                    question_key = question['question'].lower().strip()
-                    if question_key not in seen_questions:
-                        seen_questions.add(question_key)
-                        unique_questions.append(question)
-                
-                quiz_data = {"quiz": unique_questions}
-            else:
-                # Process the entire text if it's under 5000 characters
-                prompt = f"""Based on the following text, generate a quiz with 8 multiple choice questions. Each question should:
-1. Test understanding of key concepts
-2. Have exactly 4 options labeled A, B, C, and D
-3. Include a clear explanation for the correct answer
-
-Text to use for generating questions:
-{text}
-
-Format the response as a JSON object with a 'quiz' array containing objects with:
-- question: string
-- options: array of 4 strings
-- correct_answer: string (one of the options)
-- explanation: string explaining why the answer is correct"""
-
-                response = await asyncio.wait_for(
-                    copilot_client.generate_chat_completion([
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]),
-                    timeout=120
-                )
-                
-                quiz_data = json.loads(response)
-
-            return jsonify({
-                'quiz': quiz_data.get('quiz', []),
-                'message': 'Generated quiz questions successfully'
-            })
+@app.route('/api/study-pack', methods=['POST'])
+async def generate_study_pack():
+    """Flashcards, quiz questions and learning content together, from one LLM call per segment."""
+    try:
+        return await run_generation(GENERATION_TASKS['study_pack'])
+    except Exception as e:
+        logger.error(f"Error in study pack generation: {str(e)}")
+        return generation_error_response(e)
+
+def optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue flashcard, quiz, learning or study pack generation and return a job ID at once.
+
+    Takes 'task' (flashcards, quiz, learning or study_pack) plus either a
+    'document_id' or a multipart 'file', which is stored as a new document
+    session. Optional 'chunk_number'/'total_chunks' restrict generation to one
+    chunk. Poll GET /api/jobs/<job_id> for progress and results.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        fields = request.form if request.form else payload
 
-        finally:
-            # Clean up the file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        task = GENERATION_TASKS.get(fields.get('task', ''))
+        if task is None:
+            return jsonify({'error': f"Unknown task, expected one of: {', '.join(GENERATION_TASKS)}"}), 400
 
+        try:
+            chunk_number = optional_int(fields.get('chunk_number') or request.headers.get('X-Chunk-Number'))
+            total_chunks = optional_int(fields.get('total_chunks') or request.headers.get('X-Total-Chunks'))
+        except ValueError:
+            return jsonify({'error': 'chunk_number and total_chunks must be integers'}), 400
+
+        document_id = fields.get('document_id')
+        if document_id:
+            session = document_store.get(document_id)
+            if session is None:
+                return jsonify({'error': 'Unknown or expired document_id'}), 404
+        else:
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file part'}), 400
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'No selected file'}), 400
+            if not file.filename.lower().endswith('.pdf'):
+                return jsonify({'error': 'Only PDF files are allowed'}), 400
+            with timed(UPLOAD):
+                pdf_bytes = file.read()
+            with timed(HASH):
+                digest = hash_bytes(pdf_bytes)
+            # Parse before storing, as create_document does, so junk never gets a session or a job
+            try:
+                get_pdf_metadata(pdf_bytes, digest)
+            except PdfReadError as e:
+                return jsonify({'error': f'Invalid PDF: {str(e)}'}), 400
+            # The job outlives this request, so keep the PDF in a document session rather than uploads/
+            session = document_store.create(pdf_bytes, secure_filename(file.filename), digest)
+
+        job = job_queue.submit(
+            task,
+            session.pdf_bytes,
+            session.digest,
+            chunk_number=chunk_number,
+            total_chunks=total_chunks,
+            document_id=session.document_id,
+            bypass_cache=bypass_completion_cache.get()
+        )
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Location'] = f"/api/jobs/{job.job_id}"
+        return response
+
+    except (DocumentStoreFullError, JobQueueFullError) as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        logger.error(f"Error in quiz generation: {str(e)}")
+        logger.error(f"Error creating generation job: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job_id'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Unknown or expired job_id'}), 404
+    return jsonify({'message': 'Job cancelled'})
+
 @app.route('/api/chat', methods=['POST'])
-async def chat():
-    """Endpoint for general chat using Cohere API."""
+def chat():
+    """
+    Endpoint for general chat using Cohere API.
+
+    Replies as JSON by default. With {"stream": true} or an
+    "Accept: text/event-stream" header the reply is streamed as Server-Sent
+    Events: one unnamed event per token ({"text": ...}), then a "done" event
+    with the full reply, or an "error" event if the upstream stream fails.
+    """
     try:
         data = request.get_json()
         if not data or 'messages' not in data:
@@ -429,29 +660,46 @@ async def chat():
         if not user_message:
             return jsonify({'error': 'Empty message content'}), 400
 
-        api_key = os.getenv('COHERE_API_KEY')
-        if not api_key:
-            logger.warning('COHERE_API_KEY not configured')
-            return jsonify({'error': 'COHERE_API_KEY not configured. Please set it in the server .env'}), 400
-
-        model_id = os.getenv('COHERE_CHAT_MODEL', 'command')
-        cohere_payload = {
-            "model": model_id,
-            "message": user_message,
-        }
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        cohere_url = "https://api.cohere.ai/v1/chat"
-        response = requests.post(cohere_url, json=cohere_payload, headers=headers, timeout=30)
-        if response.status_code != 200:
-            logger.error(f"Cohere chat error: {response.status_code} {response.text}")
-            return jsonify({'error': 'Cohere API error', 'details': response.text}), 502
-
-        assistant_text = response.json().get('text', '')
-        return jsonify({'response': assistant_text})
-
+        if not wants_event_stream(data):
+            assistant_text = shared_loop.call(copilot_client.generate_chat_reply(user_message))
+            return jsonify({'response': assistant_text})
+
+        tokens = shared_loop.iterate(copilot_client.stream_chat(user_message), timeout=copilot_client.read_timeout)
+        # Pull the first token now so upstream failures still get a proper status code
+        first_token = next(tokens, '')
+
+        def generate():
+            reply = [first_token]
+            try:
+                if first_token:
+                    yield sse_event({'text': first_token})
+                for token in tokens:
+                    reply.append(token)
+                    yield sse_event({'text': token})
+                yield sse_event({'response': ''.join(reply)}, event='done')
+            except Exception as e:
+                logger.error(f"Error while streaming chat reply: {str(e)}")
+                yield sse_event({'error': str(e)}, event='error')
+            finally:
+                tokens.close()
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except UpstreamError as e:
+        logger.error(f"Cohere chat error: {e.status} {e.body}")
+        return jsonify({'error': 'Cohere API error', 'details': e.body}), 502
+    except RateLimitError as e:
+        logger.warning(f"Cohere chat rate limited: {str(e)}")
+        return jsonify({'error': 'Cohere API rate limited', 'details': str(e)}), 503
+    except CircuitOpenError as e:
+        logger.warning(f"Cohere chat refused: {str(e)}")
+        response = jsonify({'error': 'Cohere API is failing, try again shortly', 'details': str(e)})
+        response.headers['Retry-After'] = str(int(e.retry_after + 0.5))
+        return response, 503
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -471,8 +719,11 @@ def after_request(response):
             "http://192.168.31.10:8081"
         ]:
             response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, X-Chunk-Number, X-Total-Chunks'
+            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, X-Chunk-Number, X-Total-Chunks, X-Cache-Bypass, X-Request-Timeout, Content-Range'
+            # Let the frontend read the per-stage timings (fetch headers and the Resource Timing API)
+            response.headers['Access-Control-Expose-Headers'] = 'Server-Timing'
+            response.headers['Timing-Allow-Origin'] = origin
     return response
 
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+"""
+Chunk extraction latency: re-parse per chunk vs. the parse-once page index.
+
+Run from the backend directory:
+
+    python benchmarks/bench_chunk_extraction.py --pages 300 --chunks 20
+
+With the page index, chunk latency should stay flat as the chunk number
+grows; the legacy path pays for the whole page tree on every request.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader
+from benchmarks.pdf_corpus import generate_pdf
+from services.document_cache import DocumentCache, hash_bytes
+from services.page_index import join_page_texts, page_range_for_chunk
+
+
+def legacy_extract_chunk(pdf_bytes: bytes, chunk_number: int, total_chunks: int) -> str:
+    """The pre-index implementation: open and parse the PDF for every chunk."""
+    pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
+    start_page, end_page = page_range_for_chunk(len(pdf_reader.pages), chunk_number, total_chunks)
+    text = ""
+    for page_num in range(start_page, end_page):
+        page_text = pdf_reader.pages[page_num].extract_text()
+        if page_text:
+            text += page_text + "\n"
+    return text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--chunks', type=int, default=20)
+    parser.add_argument('--density', default='normal')
+    args = parser.parse_args()
+
+    pdf_bytes = generate_pdf(args.pages, args.density)
+    digest = hash_bytes(pdf_bytes)
+    cache = DocumentCache(cache_dir='')
+
+    print(f"{args.pages} pages, {len(pdf_bytes) / 1024:.0f} KiB, {args.chunks} chunks")
+    print(f"{'chunk':>5} {'legacy ms':>10} {'indexed ms':>11}")
+    legacy_total = indexed_total = 0.0
+    for chunk_number in range(1, args.chunks + 1):
+        started = time.perf_counter()
+        legacy_text = legacy_extract_chunk(pdf_bytes, chunk_number, args.chunks)
+        legacy_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        indexed_text = join_page_texts(cache.get_chunk_pages(pdf_bytes, chunk_number, args.chunks, digest=digest))
+        indexed_ms = (time.perf_counter() - started) * 1000
+
+        if legacy_text != indexed_text:
+            raise SystemExit(f"Chunk {chunk_number} text differs between implementations")
+        legacy_total += legacy_ms
+        indexed_total += indexed_ms
+        print(f"{chunk_number:>5} {legacy_ms:>10.1f} {indexed_ms:>11.1f}")
+
+    print(f"{'total':>5} {legacy_total:>10.1f} {indexed_total:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
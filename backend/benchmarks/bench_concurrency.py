@@ -0,0 +1,165 @@
+"""
+Concurrent request capacity of the backend against a slow upstream.
+
+Starts the local Cohere stub with a fixed latency, then runs the backend
+under gunicorn three ways:
+
+- per-request-sync: as render.yaml used to start it (a single sync worker)
+- per-request-gthread: gunicorn.conf.py's threads, but Flask's stock
+  event loop per request (SHARED_EVENT_LOOP=false)
+- shared-loop-gthread: gunicorn.conf.py as deployed
+
+The first two differ only in thread count; the last two only in the event
+loop, which isolates its effect. Each run fires batches of concurrent quiz
+requests and reports throughput and latency percentiles. With the threaded
+worker, concurrency beyond GUNICORN_THREADS queues for a free thread.
+
+    python benchmarks/bench_concurrency.py --latency 1.0 --concurrency 1 10 50 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import aiohttp
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.pdf_corpus import generate_pdf
+
+# name -> (gunicorn arguments, extra environment)
+SERVER_CONFIGS = {
+    # gunicorn picks up ./gunicorn.conf.py by default, so point it at an empty config
+    'per-request-sync': (['-c', os.devnull], {}),
+    'per-request-gthread': (['-c', 'gunicorn.conf.py'], {'SHARED_EVENT_LOOP': 'false'}),
+    'shared-loop-gthread': (['-c', 'gunicorn.conf.py'], {}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def fire(base_url: str, document_ids: List[str], concurrency: int) -> Dict:
+    latencies = []
+
+    async def one(session: aiohttp.ClientSession, document_id: str):
+        started = time.perf_counter()
+        # Distinct documents and no completion cache, so every request really waits on the upstream
+        async with session.post(f"{base_url}/api/quiz/generate", json={'document_id': document_id},
+                                headers={'X-Cache-Bypass': '1'}) as response:
+            await response.read()
+            if response.status != 200:
+                return
+        latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*[one(session, document_ids[i]) for i in range(concurrency)], return_exceptions=True)
+        wall = time.perf_counter() - started
+
+    return {
+        'ok': len(latencies),
+        'errors': concurrency - len(latencies),
+        'wall': wall,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+    }
+
+
+async def upload(base_url: str, count: int) -> List[str]:
+    """Store count different one-page PDFs, so concurrent requests are not coalesced into one."""
+    document_ids = []
+    async with aiohttp.ClientSession() as session:
+        for seed in range(count):
+            form = aiohttp.FormData()
+            form.add_field('file', generate_pdf(1, 'sparse', seed), filename='bench.pdf',
+                           content_type='application/pdf')
+            async with session.post(f"{base_url}/api/documents", data=form) as response:
+                body = await response.json()
+                if response.status != 201:
+                    raise RuntimeError(f"Upload failed: {body}")
+                document_ids.append(body['document_id'])
+    return document_ids
+
+
+def run_config(name: str, extra_args: List[str], extra_env: Dict[str, str], stub_url: str, levels: List[int]):
+    port = free_port()
+    env = dict(os.environ,
+               COHERE_API_KEY=os.getenv('COHERE_API_KEY', 'benchmark'),
+               COHERE_API_URL=stub_url,
+               # Let the scheduler and connection pool pass the whole load through to the stub
+               LLM_MAX_CONCURRENCY=os.getenv('LLM_MAX_CONCURRENCY', '1024'),
+               COHERE_POOL_LIMIT=os.getenv('COHERE_POOL_LIMIT', '1024'),
+               **extra_env)
+    command = [sys.executable, '-m', 'gunicorn', *extra_args, '--bind', f"127.0.0.1:{port}", 'app:app']
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}"
+        document_ids = asyncio.run(upload(base_url, max(levels)))
+        print(f"\n{name}")
+        print(f"{'concurrency':>11} {'ok':>5} {'errors':>6} {'wall s':>7} {'req/s':>7} {'p50 s':>6} {'p95 s':>6}")
+        for concurrency in levels:
+            result = asyncio.run(fire(base_url, document_ids, concurrency))
+            print(f"{concurrency:>11} {result['ok']:>5} {result['errors']:>6} {result['wall']:>7.2f} "
+                  f"{result['rps']:>7.1f} {result['p50']:>6.2f} {result['p95']:>6.2f}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=1.0, help="Stub upstream latency in seconds")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--configs', nargs='+', choices=sorted(SERVER_CONFIGS), default=list(SERVER_CONFIGS))
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'stub_cohere.py'),
+         '--port', str(stub_port), '--latency', str(args.latency)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(stub_port)
+        stub_url = f"http://127.0.0.1:{stub_port}/v1/chat"
+        print(f"Stub upstream latency {args.latency}s")
+        for name in args.configs:
+            run_config(name, *SERVER_CONFIGS[name], stub_url, args.concurrency)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Cross-segment deduplication: which pairs are kept apart, and throughput.
+
+Run from the backend directory:
+
+    python benchmarks/bench_dedupe.py --items 5000
+
+First checks known pairs: distinct items whose questions differ in one
+short token must both survive, and reworded repeats must be dropped. Exits
+non-zero if any pair is judged wrongly. Then times filter() over a batch of
+generated flashcards with a share of reworded repeats mixed in.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.generation import FLASHCARDS_OUTPUT, QUIZ_OUTPUT
+from services.response_types import Flashcard, QuizQuestion
+
+# (first, second, whether second is a duplicate of first)
+FLASHCARD_PAIRS = [
+    (Flashcard("What year did World War I begin?", "1914"),
+     Flashcard("What year did World War II begin?", "1939"), False),
+    (Flashcard("What does CPU stand for?", "Central Processing Unit"),
+     Flashcard("What does GPU stand for?", "Graphics Processing Unit"), False),
+    (Flashcard("Which planet is closest to the Sun?", "Mercury"),
+     Flashcard("Which planet is farthest from the Sun?", "Neptune"), False),
+    (Flashcard("What is the powerhouse of the cell?", "The mitochondria"),
+     Flashcard("What is the powerhouse of a cell?", "Mitochondria"), True),
+    (Flashcard("What year did World War II begin?", "1939"),
+     Flashcard("In what year did World War II begin?", "1939"), True),
+]
+
+QUIZ_PAIRS = [
+    (QuizQuestion("What year did World War I begin?", ["1914", "1939", "1918", "1945"], "1914", ""),
+     QuizQuestion("What year did World War II begin?", ["1914", "1939", "1918", "1945"], "1939", ""), False),
+    (QuizQuestion("Which gas do plants absorb from the air during photosynthesis?",
+                  ["Oxygen", "Carbon dioxide", "Nitrogen", "Helium"], "Carbon dioxide", ""),
+     QuizQuestion("Which gas do plants absorb from the air in photosynthesis?",
+                  ["Oxygen", "Carbon dioxide", "Argon", "Helium"], "Carbon dioxide", ""), True),
+]
+
+
+def check_pairs() -> int:
+    failures = 0
+    for output, pairs in ((FLASHCARDS_OUTPUT, FLASHCARD_PAIRS), (QUIZ_OUTPUT, QUIZ_PAIRS)):
+        for first, second, duplicate in pairs:
+            kept = output.deduplicator().filter([first, second])
+            ok = len(kept) == (1 if duplicate else 2)
+            failures += not ok
+            print(f"{'ok' if ok else 'WRONG':>5} {'drop' if duplicate else 'keep'}: "
+                  f"{first.question!r} / {second.question!r}")
+    return failures
+
+
+def reworded(card: Flashcard) -> Flashcard:
+    return Flashcard(card.question.replace("What is", "What's").rstrip('?') + " ?", card.answer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--repeat-share', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    failures = check_pairs()
+
+    random.seed(args.seed)
+    words = [f"term{i}" for i in range(2000)]
+    cards = [Flashcard(f"What is {' '.join(random.sample(words, 4))}?", ' '.join(random.sample(words, 3)))
+             for _ in range(args.items)]
+    cards += [reworded(card) for card in random.sample(cards, int(args.items * args.repeat_share))]
+    random.shuffle(cards)
+
+    deduplicator = FLASHCARDS_OUTPUT.deduplicator()
+    started = time.perf_counter()
+    kept = deduplicator.filter(cards)
+    elapsed = time.perf_counter() - started
+    print(f"{len(cards)} flashcards in {elapsed * 1000:.0f} ms ({len(cards) / elapsed:.0f}/s): "
+          f"{len(kept)} kept, {deduplicator.near_duplicates} near duplicates dropped")
+
+    if failures:
+        raise SystemExit(f"{failures} pairs judged wrongly")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Per-response CPU of reading a structured completion: legacy round-trips vs. typed result models.
+
+Run from the backend directory:
+
+    python benchmarks/bench_json_roundtrip.py --responses 2000 --type study_pack
+
+The legacy path parsed the Cohere body, parsed its 'text' field, dumped
+it back to a string, parsed that string again in the service, validated
+the dicts and finally let Flask's stdlib provider serialize them. The
+current path parses the body and the text once each, validates straight
+into __slots__ models and serializes them with the fast JSON backend.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_cohere import fake_response_text
+from services.response_types import RESPONSE_TYPES
+from utils import fast_json
+
+REQUIRED_FIELDS = {
+    key: item_schema['required']
+    for response_type in RESPONSE_TYPES.values()
+    for key, item_schema in ((key, prop['items']) for key, prop in response_type.schema['properties'].items())
+}
+
+
+def legacy_read(body: str, response_type) -> str:
+    """The pre-model implementation, step for step."""
+    response_data = json.loads(body)
+    content = response_data.get('text', '{}')
+    parsed_content = json.loads(content)
+    response = json.dumps(parsed_content)
+    data = json.loads(response)
+    result = {}
+    for key, (field, _) in response_type.fields.items():
+        result[field] = [item for item in data.get(key, [])
+                         if isinstance(item, dict) and all(isinstance(item.get(name), (str, list))
+                                                           for name in REQUIRED_FIELDS[key])]
+    # Flask's default provider: sorted keys, ASCII escapes
+    return json.dumps(result, sort_keys=True, ensure_ascii=True)
+
+
+def typed_read(body: str, response_type) -> str:
+    content = fast_json.loads(body).get('text', '{}')
+    return fast_json.dumps(response_type.parse(content))
+
+
+def time_per_call(read, bodies, response_type) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        read(body, response_type)
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--responses', type=int, default=2000)
+    parser.add_argument('--type', default='study_pack', choices=sorted(RESPONSE_TYPES))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    response_type = RESPONSE_TYPES[args.type]
+    payload = {'response_format': {'type': 'json_object', 'schema': response_type.schema}}
+    bodies = [json.dumps({'text': fake_response_text(payload), 'finish_reason': 'COMPLETE'})
+              for _ in range(args.responses)]
+
+    if json.loads(legacy_read(bodies[0], response_type)) != json.loads(typed_read(bodies[0], response_type)):
+        raise SystemExit("Legacy and typed paths disagree")
+
+    backend = 'orjson' if fast_json.orjson is not None else 'json (orjson not installed)'
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(f"{args.responses} '{args.type}' responses, {size:.0f} bytes each, fast backend: {backend}")
+    legacy_us = time_per_call(legacy_read, bodies, response_type)
+    typed_us = time_per_call(typed_read, bodies, response_type)
+    print(f"{'legacy':>8} {legacy_us:>8.1f} us/response")
+    print(f"{'typed':>8} {typed_us:>8.1f} us/response")
+    print(f"{'saved':>8} {legacy_us - typed_us:>8.1f} us/response ({legacy_us / typed_us:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""
+Offline load test of every backend endpoint against the local Cohere stub.
+
+Starts benchmarks/stub_cohere.py and the backend under gunicorn (with
+gunicorn.conf.py), uploads synthetic PDFs from benchmarks/pdf_corpus.py and
+fires closed-loop concurrent load at each endpoint in turn. For each one it
+reports successful and failed requests, requests per second, p50/p95/p99
+latency, time to first byte for streams, and the peak and final resident
+memory of the server processes. Nothing leaves the machine.
+
+    python benchmarks/bench_load.py --requests 200 --concurrency 20 --pages 5 50
+    python benchmarks/bench_load.py --scenarios quiz quiz_stream --json before.json
+    python benchmarks/bench_load.py --compare before.json --tolerance 0.2
+
+With --compare the run exits non-zero if any scenario's p95 latency grew, or
+its throughput fell, by more than the tolerance, so it can gate changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_concurrency import free_port, percentile, wait_for_port
+from benchmarks.pdf_corpus import LINES_PER_DENSITY, generate_pdf
+
+# Statuses that end a job
+JOB_DONE = ('succeeded', 'failed', 'cancelled')
+
+
+class Target:
+    """The running server plus the documents the scenarios work on."""
+
+    def __init__(self, base_url: str, pdfs: Dict[int, bytes], document_ids: Dict[int, str], headers: Dict[str, str]):
+        self.base_url = base_url
+        self.pdfs = pdfs
+        self.document_ids = document_ids
+        self.headers = headers
+
+
+# A request returns (ok, seconds, seconds to first byte or None). Requests
+# that need setup (e.g. a document to delete) time only the call under test.
+Request = Callable[[aiohttp.ClientSession, Target, int], Awaitable[Tuple[bool, float, Optional[float]]]]
+
+
+def pdf_form(pdf: bytes) -> aiohttp.FormData:
+    form = aiohttp.FormData()
+    form.add_field('file', pdf, filename='bench.pdf', content_type='application/pdf')
+    return form
+
+
+async def timed_request(session: aiohttp.ClientSession, method: str, url: str, expected: Tuple[int, ...] = (200,),
+                        **kwargs) -> Tuple[bool, float, Optional[float]]:
+    started = time.perf_counter()
+    first_byte = None
+    async with session.request(method, url, **kwargs) as response:
+        async for _ in response.content.iter_any():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+        return response.status in expected, time.perf_counter() - started, first_byte
+
+
+async def upload_document(session: aiohttp.ClientSession, target: Target, pdf: bytes) -> str:
+    async with session.post(f"{target.base_url}/api/documents", data=pdf_form(pdf)) as response:
+        body = await response.json()
+        if response.status != 201:
+            raise RuntimeError(f"Upload failed: {body}")
+        return body['document_id']
+
+
+def generation(path: str, stream: Optional[str] = None) -> Callable[[int], Request]:
+    """POST the document_id of a pages-page PDF to a generation endpoint."""
+    def for_pages(pages: int) -> Request:
+        async def request(session, target, _):
+            headers = dict(target.headers)
+            if stream:
+                headers['Accept'] = stream
+            return await timed_request(session, 'POST', f"{target.base_url}{path}",
+                                       json={'document_id': target.document_ids[pages]}, headers=headers)
+        return request
+    return for_pages
+
+
+def multipart(path: str, expected: Tuple[int, ...] = (200,)) -> Callable[[int], Request]:
+    """Upload a pages-page PDF to path with every request."""
+    def for_pages(pages: int) -> Request:
+        async def request(session, target, _):
+            return await timed_request(session, 'POST', f"{target.base_url}{path}", expected,
+                                       data=pdf_form(target.pdfs[pages]), headers=target.headers)
+        return request
+    return for_pages
+
+
+def get(path: str) -> Callable[[int], Request]:
+    def for_pages(pages: int) -> Request:
+        async def request(session, target, _):
+            url = f"{target.base_url}{path}".format(document_id=target.document_ids[pages])
+            return await timed_request(session, 'GET', url)
+        return request
+    return for_pages
+
+
+def delete_document(pages: int) -> Request:
+    async def request(session, target, _):
+        document_id = await upload_document(session, target, target.pdfs[pages])
+        return await timed_request(session, 'DELETE', f"{target.base_url}/api/documents/{document_id}")
+    return request
+
+
+def job(task: str) -> Callable[[int], Request]:
+    """Queue a job and poll it to completion; the latency is the job's end-to-end time."""
+    def for_pages(pages: int) -> Request:
+        async def request(session, target, _):
+            started = time.perf_counter()
+            async with session.post(f"{target.base_url}/api/jobs", headers=target.headers,
+                                    json={'task': task, 'document_id': target.document_ids[pages]}) as response:
+                body = await response.json()
+                if response.status != 202:
+                    return False, time.perf_counter() - started, None
+            accepted = time.perf_counter() - started
+            while True:
+                await asyncio.sleep(0.05)
+                async with session.get(f"{target.base_url}/api/jobs/{body['job_id']}") as response:
+                    status = (await response.json()).get('status')
+                if status in JOB_DONE:
+                    return status == 'succeeded', time.perf_counter() - started, accepted
+        return request
+    return for_pages
+
+
+def cancel_job(pages: int) -> Request:
+    async def request(session, target, _):
+        async with session.post(f"{target.base_url}/api/jobs", headers=target.headers,
+                                json={'task': 'quiz', 'document_id': target.document_ids[pages]}) as response:
+            body = await response.json()
+        return await timed_request(session, 'DELETE', f"{target.base_url}/api/jobs/{body['job_id']}")
+    return request
+
+
+def chat(stream: bool) -> Callable[[int], Request]:
+    def for_pages(_pages: int) -> Request:
+        async def request(session, target, index):
+            payload = {'messages': [{'role': 'user', 'content': f"Explain topic {index}"}], 'stream': stream}
+            return await timed_request(session, 'POST', f"{target.base_url}/api/chat", json=payload)
+        return request
+    return for_pages
+
+
+# Scenario -> (request factory taking a page count, whether it depends on the document size)
+SCENARIOS: Dict[str, Tuple[Callable[[int], Request], bool]] = {
+    'documents_upload': (multipart('/api/documents', (201,)), True),
+    'documents_get': (get('/api/documents/{document_id}'), True),
+    'documents_delete': (delete_document, True),
+    'metadata': (multipart('/api/metadata'), True),
+    'flashcards': (generation('/api/flashcards/generate'), True),
+    'flashcards_upload': (multipart('/api/flashcards/generate'), True),
+    'learning': (generation('/api/learning/enhanced'), True),
+    'quiz': (generation('/api/quiz/generate'), True),
+    'quiz_stream': (generation('/api/quiz/generate', 'application/x-ndjson'), True),
+    'study_pack': (generation('/api/study-pack'), True),
+    'study_pack_sse': (generation('/api/study-pack', 'text/event-stream'), True),
+    'job_quiz': (job('quiz'), True),
+    'job_cancel': (cancel_job, True),
+    'chat': (chat(False), False),
+    'chat_stream': (chat(True), False),
+    'stats': (get('/api/stats'), False),
+    'metrics': (get('/metrics'), False),
+}
+
+
+class MemorySampler:
+    """Samples the resident memory of a process and all its descendants (Linux /proc)."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _children(pid: int) -> List[int]:
+        children = []
+        try:
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as file:
+                    children.extend(int(child) for child in file.read().split())
+        except OSError:
+            pass
+        return children
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def sample(self) -> int:
+        pending, total = [self.pid], 0
+        while pending:
+            pid = pending.pop()
+            total += self._rss(pid)
+            pending.extend(self._children(pid))
+        self.last = total
+        self.peak = max(self.peak, total)
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.peak = self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._stop.clear()
+        self.sample()
+
+
+async def run_scenario(target: Target, request: Request, requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    errors = 0
+    issued = 0
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal errors, issued
+        while issued < requests:
+            index = issued
+            issued += 1
+            try:
+                ok, seconds, first_byte = await request(session, target, index)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, KeyError):
+                ok, seconds, first_byte = False, 0.0, None
+            if not ok:
+                errors += 1
+                continue
+            latencies.append(seconds)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(session) for _ in range(min(concurrency, requests))])
+        wall = time.perf_counter() - started
+
+    return {
+        'ok': len(latencies),
+        'errors': errors,
+        'wall': wall,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'ttfb_p50': percentile(first_bytes, 0.50) if first_bytes else None,
+    }
+
+
+async def prepare(base_url: str, pages: List[int], density: str, headers: Dict[str, str]) -> Target:
+    pdfs = {count: generate_pdf(count, density) for count in pages}
+    target = Target(base_url, pdfs, {}, headers)
+    async with aiohttp.ClientSession() as session:
+        for count, pdf in pdfs.items():
+            target.document_ids[count] = await upload_document(session, target, pdf)
+    return target
+
+
+def start_server(stub_url: str, workdir: str, use_cache: bool) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ,
+               COHERE_API_KEY=os.getenv('COHERE_API_KEY', 'benchmark'),
+               COHERE_API_URL=stub_url,
+               # Keep caches of earlier runs out of the measurement
+               LLM_CACHE_DB=os.path.join(workdir, 'completions.sqlite3') if use_cache else '',
+               DOCUMENT_CACHE_DIR='',
+               LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f"127.0.0.1:{port}", 'app:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_port(port, timeout=60)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def start_stub(args) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'stub_cohere.py'), '--port', str(port),
+         '--latency', str(args.latency), '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+         '--slow-rate', str(args.slow_rate), '--token-delay', str(args.token_delay)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_port(port)
+    return stub, f"http://127.0.0.1:{port}/v1/chat"
+
+
+def compare(results: Dict[str, Dict], baseline_path: str, tolerance: float, min_delta: float) -> List[str]:
+    """Scenarios that regressed against a saved run; p95 changes under min_delta seconds are noise."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before['ok'] or not result['ok']:
+            continue
+        if result['p95'] > before['p95'] * (1 + tolerance) and result['p95'] - before['p95'] > min_delta:
+            regressions.append(f"{name}: p95 {before['p95']:.3f}s -> {result['p95']:.3f}s")
+        if result['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']:.1f} -> {result['rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=100, help="Requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=10, help="Requests in flight at once")
+    parser.add_argument('--pages', type=int, nargs='+', default=[5], help="Page counts of the test PDFs")
+    parser.add_argument('--density', choices=sorted(LINES_PER_DENSITY), default='normal')
+    parser.add_argument('--latency', type=float, default=0.2, help="Stub upstream latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--token-delay', type=float, default=0.005)
+    parser.add_argument('--use-cache', action='store_true',
+                        help="Let repeated prompts hit the completion cache instead of the stub")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--compare', help="Fail on regressions against results written by --json")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta', type=float, default=0.01,
+                        help="Ignore p95 increases smaller than this many seconds")
+    args = parser.parse_args()
+
+    headers = {} if args.use_cache else {'X-Cache-Bypass': '1'}
+    results: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        stub, stub_url = start_stub(args)
+        server = None
+        try:
+            server, base_url = start_server(stub_url, workdir, args.use_cache)
+            target = asyncio.run(prepare(base_url, args.pages, args.density, headers))
+            print(f"Stub latency {args.latency}s, {args.requests} requests per scenario, "
+                  f"concurrency {args.concurrency}, {args.density} PDFs")
+            print(f"{'scenario':<24} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+                  f"{'ttfb s':>7} {'peak MB':>8} {'end MB':>7}")
+            memory = MemorySampler(server.pid)
+            for name in args.scenarios:
+                factory, sized = SCENARIOS[name]
+                for pages in (args.pages if sized else args.pages[:1]):
+                    label = f"{name}[{pages}p]" if sized else name
+                    with memory:
+                        result = asyncio.run(run_scenario(target, factory(pages), args.requests, args.concurrency))
+                    result['peak_rss_mb'] = memory.peak / 2 ** 20
+                    result['end_rss_mb'] = memory.last / 2 ** 20
+                    results[label] = result
+                    ttfb = f"{result['ttfb_p50']:.3f}" if result['ttfb_p50'] is not None else '-'
+                    print(f"{label:<24} {result['ok']:>5} {result['errors']:>4} {result['rps']:>7.1f} "
+                          f"{result['p50']:>7.3f} {result['p95']:>7.3f} {result['p99']:>7.3f} {ttfb:>7} "
+                          f"{result['peak_rss_mb']:>8.1f} {result['end_rss_mb']:>7.1f}")
+        finally:
+            for process in (server, stub):
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
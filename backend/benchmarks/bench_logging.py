@@ -0,0 +1,165 @@
+"""
+Logging cost a generation request puts on the request path: legacy vs. queued logging.
+
+Run from the backend directory:
+
+    python benchmarks/bench_logging.py --requests 500 --type quiz
+
+The legacy path is the old setup_logger (file and console handlers written
+synchronously by the calling thread) with the old log calls: eager
+json.dumps of the prompt, payload and response for DEBUG records that are
+then discarded, and an INFO line for every generated item. The current
+path queues each record for the logging thread and only serializes
+payloads for sampled calls at DEBUG level. Both run at LOG_LEVEL
+(default INFO). Console output goes to
+/dev/null in both cases, so terminal speed does not skew the result.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_cohere import fake_response_text
+from services.response_types import RESPONSE_TYPES
+
+PROMPT_CHARS = 6000
+
+
+def legacy_logger(name: str, log_file: str, console, level: int) -> logging.Logger:
+    """The pre-queue setup_logger, step for step (minus the duplicate handlers a second call added)."""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.propagate = False
+    file_handler = RotatingFileHandler(f'logs/{log_file}', maxBytes=10*1024*1024, backupCount=5)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    console_handler = logging.StreamHandler(console)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger
+
+
+def legacy_request(logger: logging.Logger, messages, payload, body: str, kind: str):
+    """The log calls one request made before, in order."""
+    logger.info("Starting generation")
+    logger.debug(f"Input text length: {len(messages[0]['content'])} characters")
+    logger.info("Sending request to Cohere API")
+    logger.info("Starting chat completion request")
+    logger.debug(f"Messages received: {json.dumps(messages, indent=2)}")
+    headers = {"Authorization": "Bearer x", "Content-Type": "application/json"}
+    logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+    logger.debug(f"Request headers: {json.dumps({k: v if k != 'Authorization' else '***' for k, v in headers.items()}, indent=2)}")
+    logger.debug(f"Response status: {200}")
+    logger.debug(f"Response headers: {headers}")
+    logger.debug(f"Response body: {body}")
+    response_data = json.loads(body)
+    logger.debug(f"Parsed response: {json.dumps(response_data, indent=2)}")
+    content = response_data['text']
+    logger.debug(f"Extracted content: {content}")
+    items = next(iter(json.loads(content).values()))
+    logger.info(f"=== Generated {kind} ===")
+    for i, item in enumerate(items):
+        logger.info(f"\nItem {i+1}:")
+        for key, value in item.items():
+            if isinstance(value, list):
+                logger.info(f"{key}:")
+                for j, option in enumerate(value):
+                    logger.info(f"{chr(65+j)}. {option}")
+            else:
+                logger.info(f"{key}: {value}")
+        logger.info("-" * 50)
+    logger.info(f"\nTotal generated: {len(items)}")
+    logger.info("Received response from Cohere API")
+    logger.info(f"Successfully generated {len(items)} items")
+
+
+def current_request(logger: logging.Logger, messages, payload, body: str, kind: str):
+    """The log calls one request makes now, in order."""
+    from utils.logger_config import LazyJSON, sample_payloads
+    logger.info("Starting generation")
+    logger.debug("Input text length: %d characters", len(messages[0]['content']))
+    logger.debug("Sending request to Cohere API")
+    logger.debug("Starting chat completion request")
+    dump_payloads = sample_payloads(logger)
+    if dump_payloads:
+        logger.debug("Messages received: %s", LazyJSON(messages))
+        logger.debug("Request payload: %s", LazyJSON(payload))
+    logger.debug("Response status: %s", 200)
+    if dump_payloads:
+        logger.debug("Response body: %s", LazyJSON(body))
+    items = next(iter(json.loads(json.loads(body)['text']).values()))
+    logger.info(f"Generated {kind}: {len(items)} items")
+    logger.debug("Received response from Cohere API")
+    logger.info(f"Successfully generated {len(items)} items")
+
+
+def run(logger, log_request, requests) -> float:
+    started = time.perf_counter()
+    for messages, payload, body in requests:
+        log_request(logger, messages, payload, body, 'items')
+    return (time.perf_counter() - started) / len(requests) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--type', default='quiz', choices=['flashcards', 'quiz', 'concepts'])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    schema = RESPONSE_TYPES[args.type].schema
+    requests = []
+    for _ in range(args.requests):
+        prompt = ' '.join(f"word{random.randint(0, 9999)}" for _ in range(PROMPT_CHARS // 9))
+        messages = [{"role": "user", "content": prompt}]
+        payload = {"model": "command-r", "message": prompt,
+                   "response_format": {"type": "json_object", "schema": schema}}
+        body = json.dumps({'text': fake_response_text(payload), 'finish_reason': 'COMPLETE'})
+        requests.append((messages, payload, body))
+
+    stdout = sys.stdout
+    devnull = open(os.devnull, 'w')
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.makedirs('logs')
+        # The queued pipeline's console handler writes to whatever stderr is at import
+        sys.stderr = devnull
+        from utils.logger_config import logging_stats, setup_logger
+        current = setup_logger('bench_current', 'current.log')
+        setup_logger('bench_current', 'current.log')
+        sys.stderr = sys.__stderr__
+
+        legacy = legacy_logger('bench_legacy', 'legacy.log', devnull, current.level)
+        legacy_us = run(legacy, legacy_request, requests)
+        # Separates the two changes: the trimmed log calls, still written synchronously
+        trimmed_us = run(legacy_logger('bench_trimmed', 'trimmed.log', devnull, current.level), current_request, requests)
+        current_us = run(current, current_request, requests)
+        drain_started = time.perf_counter()
+        while logging_stats()['queued']:
+            time.sleep(0.001)
+        drain_ms = (time.perf_counter() - drain_started) * 1e3
+
+        legacy_kb = os.path.getsize('logs/legacy.log') / len(requests) / 1024
+        current_kb = os.path.getsize('logs/current.log') / len(requests) / 1024 if os.path.exists('logs/current.log') else 0
+        os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    print(f"{args.requests} '{args.type}' requests, {logging.getLevelName(current.level)} level, console to /dev/null", file=stdout)
+    print(f"{'legacy':>8} {legacy_us:>8.1f} us/request on the request thread, {legacy_kb:.1f} KB logged", file=stdout)
+    print(f"{'trimmed':>8} {trimmed_us:>8.1f} us/request on the request thread (current calls, synchronous handlers)",
+          file=stdout)
+    print(f"{'queued':>8} {current_us:>8.1f} us/request on the request thread, {current_kb:.1f} KB logged", file=stdout)
+    print(f"{'saved':>8} {legacy_us - current_us:>8.1f} us/request ({legacy_us / current_us:.1f}x); "
+          f"logging thread caught up {drain_ms:.0f} ms later, {logging_stats()['dropped']} records dropped", file=stdout)
+    print(f"handlers after two setup_logger calls: {len(current.handlers)}", file=stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic PDF generator for benchmarks.
+
+Writes minimal, valid PDFs with Helvetica text so benchmarks never depend on
+real course material or extra packages. Output is deterministic for a given
+seed, page count and density.
+"""
+import argparse
+import os
+import random
+from typing import List
+
+WORDS = (
+    "cell membrane protein energy enzyme reaction gradient equilibrium "
+    "structure function theory model system network signal process data "
+    "analysis method result evidence hypothesis experiment variable control "
+    "force mass velocity momentum field charge current voltage resistance "
+    "market price demand supply capital labour policy growth inflation"
+).split()
+
+LINES_PER_DENSITY = {
+    'sparse': 10,
+    'normal': 35,
+    'dense': 60
+}
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_page_lines(rng: random.Random, page_num: int, lines: int) -> List[str]:
+    """Build the text lines of one synthetic page."""
+    page_lines = [f"Chapter {page_num // 10 + 1} - Section {page_num + 1}"]
+    for _ in range(lines):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 14))]
+        page_lines.append(" ".join(words).capitalize() + ".")
+    return page_lines
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    """Serialize a list of pages (each a list of text lines) into PDF bytes."""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    # Page objects reference the page tree, which is written after all pages
+    pages_id = font_id + 2 * len(pages) + 1
+    kids = []
+    for lines in pages:
+        operations = ["BT /F1 10 Tf 40 760 Td 12 TL"]
+        operations.extend(f"({_escape(line)}) Tj T*" for line in lines)
+        operations.append("ET")
+        stream = "\n".join(operations).encode('latin-1')
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    return bytes(output)
+
+
+def generate_pdf(page_count: int, density: str = 'normal', seed: int = 0) -> bytes:
+    """
+    Generate a synthetic PDF.
+
+    Args:
+        page_count (int): Number of pages
+        density (str): One of 'sparse', 'normal' or 'dense'
+        seed (int): Seed for the word generator
+
+    Returns:
+        bytes: The PDF file contents
+    """
+    rng = random.Random(f"{seed}-{page_count}-{density}")
+    lines = LINES_PER_DENSITY[density]
+    return build_pdf([make_page_lines(rng, page_num, lines) for page_num in range(page_count)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write synthetic PDFs for benchmarking")
+    parser.add_argument('--pages', type=int, nargs='+', default=[5, 50, 300])
+    parser.add_argument('--density', choices=sorted(LINES_PER_DENSITY), default='normal')
+    parser.add_argument('--out', default='benchmarks/corpus')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for page_count in args.pages:
+        path = os.path.join(args.out, f"synthetic_{page_count}p_{args.density}.pdf")
+        with open(path, 'wb') as file:
+            file.write(generate_pdf(page_count, args.density))
+        print(f"Wrote {path}")
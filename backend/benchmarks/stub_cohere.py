@@ -0,0 +1,109 @@
+"""
+Local stand-in for Cohere's /v1/chat endpoint.
+
+Answers with schema-valid JSON for whatever response_format schema the
+request carries, after a configurable delay, so benchmarks run offline and
+never spend API quota. Requests with "stream": true get Cohere-style NDJSON
+events, one word per text-generation event.
+
+    python benchmarks/stub_cohere.py --port 8765 --latency 1.0
+"""
+import argparse
+import asyncio
+import json
+import random
+from aiohttp import web
+
+
+def _fake_value(schema: dict, index: int):
+    kind = schema.get('type')
+    if kind == 'object':
+        return {name: _fake_value(prop, index) for name, prop in schema.get('properties', {}).items()}
+    if kind == 'array':
+        item_schema = schema.get('items', {})
+        count = 4 if item_schema.get('type') == 'string' else 5
+        return [_fake_value(item_schema, index * 10 + i) for i in range(count)]
+    return f"Synthetic value {index}"
+
+
+def fake_response_text(payload: dict) -> str:
+    """Build the 'text' field: a JSON document matching the requested schema."""
+    schema = (payload.get('response_format') or {}).get('schema')
+    if not schema:
+        return f"Stub reply to: {payload.get('message', '')[:80]}"
+    document = _fake_value(schema, random.randint(0, 10 ** 6))
+    # Quiz answers must be one of the options
+    for question in document.get('quiz', []):
+        if question.get('options'):
+            question['correct_answer'] = question['options'][0]
+    return json.dumps(document)
+
+
+def create_app(latency: float = 1.0, jitter: float = 0.0, error_rate: float = 0.0,
+               rate_limit_rate: float = 0.0, token_delay: float = 0.02,
+               slow_rate: float = 0.0, slow_factor: float = 5.0) -> web.Application:
+    stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    async def chat(request: web.Request) -> web.Response:
+        payload = await request.json()
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+        try:
+            delay = max(0.0, latency + random.uniform(-jitter, jitter))
+            # A long tail: the occasional response takes several times the median
+            if random.random() < slow_rate:
+                delay *= slow_factor
+            await asyncio.sleep(delay)
+            roll = random.random()
+            if roll < rate_limit_rate:
+                stats['rate_limited'] += 1
+                return web.json_response({'message': 'rate limited'}, status=429, headers={'Retry-After': '1'})
+            if roll < rate_limit_rate + error_rate:
+                stats['errors'] += 1
+                return web.json_response({'message': 'stub upstream error'}, status=500)
+            text = fake_response_text(payload)
+            if payload.get('stream'):
+                return await stream_reply(request, text)
+            return web.json_response({'text': text, 'finish_reason': 'COMPLETE'})
+        finally:
+            stats['in_flight'] -= 1
+
+    async def stream_reply(request: web.Request, text: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'application/stream+json'})
+        await response.prepare(request)
+        await response.write(json.dumps({'is_finished': False, 'event_type': 'stream-start'}).encode() + b"\n")
+        for i, word in enumerate(text.split(' ')):
+            token = word if i == 0 else f" {word}"
+            await response.write(json.dumps({'is_finished': False, 'event_type': 'text-generation',
+                                             'text': token}).encode() + b"\n")
+            await asyncio.sleep(token_delay)
+        await response.write(json.dumps({'is_finished': True, 'event_type': 'stream-end',
+                                         'finish_reason': 'COMPLETE', 'response': {'text': text}}).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.router.add_post('/v1/chat', chat)
+    app.router.add_get('/stats', get_stats)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local Cohere /v1/chat stub")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=1.0, help="Seconds per response")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--token-delay', type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="Fraction of responses that are slow")
+    parser.add_argument('--slow-factor', type=float, default=5.0, help="How many times slower a slow response is")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.token_delay,
+                           args.slow_rate, args.slow_factor),
+                host=args.host, port=args.port)
@@ -0,0 +1,24 @@
+import os
+
+# Async views run on one shared event loop per worker process (see
+# SharedLoopFlask in app.py), so a request thread only waits on a future while
+# its Cohere calls are in flight. Each request still holds one of the worker's
+# threads until it finishes, so a worker serves at most GUNICORN_THREADS
+# concurrent requests; further ones queue until a thread is free.
+worker_class = 'gthread'
+# Document sessions (services/document_store.py), resumable uploads and jobs
+# live in the memory of the worker that created them, and idle ones are only
+# expired when that worker next touches its store. With WEB_CONCURRENCY > 1, a
+# document_id, upload_id or job_id is only valid on the worker that issued it,
+# so run more than one worker only behind a proxy with sticky sessions.
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 128))
+
+# With gthread workers this only bounds how long a worker's main loop may go
+# without a heartbeat before the arbiter restarts it; it does not limit how
+# long a request runs. Requests are bounded in the app by GENERATION_TIMEOUT
+# (300s default, X-Request-Timeout can shorten it) and background jobs by
+# JOB_TIMEOUT (600s default).
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
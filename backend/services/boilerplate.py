@@ -0,0 +1,146 @@
+import os
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Set
+from dotenv import load_dotenv
+from utils.logger_config import setup_logger
+
+logger = setup_logger('boilerplate', 'boilerplate.log')
+
+load_dotenv()
+
+# A line is boilerplate when it shows up near the top or bottom of at least this fraction of pages
+BOILERPLATE_MIN_FRACTION = float(os.getenv('BOILERPLATE_MIN_FRACTION', 0.5))
+# Fewer pages than this say nothing about what repeats
+BOILERPLATE_MIN_PAGES = 3
+# Pages buffered before the first page is released when stripping a stream of pages
+BOILERPLATE_LEARN_PAGES = int(os.getenv('BOILERPLATE_LEARN_PAGES', 6))
+# Headers and footers live in the first and last few lines of a page
+EDGE_LINES = 3
+# Rough chars-per-token ratio for English text, for reporting only
+CHARS_PER_TOKEN = 4
+
+_DIGITS = re.compile(r'\d+')
+_SPACES = re.compile(r'\s+')
+
+
+def line_signature(line: str) -> str:
+    """Normalize a line so running headers match across pages, e.g. 'Page 3 of 40' and 'Page 4 of 40'."""
+    return _SPACES.sub(' ', _DIGITS.sub('#', line.lower())).strip()
+
+
+def _edge_indexes(line_count: int) -> Set[int]:
+    return set(range(min(EDGE_LINES, line_count))) | set(range(max(0, line_count - EDGE_LINES), line_count))
+
+
+def edge_signatures(page: str) -> Set[str]:
+    """Signatures of the non-empty lines at the top and bottom of a page."""
+    lines = page.splitlines()
+    signatures = (line_signature(lines[i]) for i in _edge_indexes(len(lines)))
+    return {signature for signature in signatures if signature}
+
+
+class BoilerplateStripper:
+    """
+    Removes running headers, footers, page numbers and similar lines repeated across pages.
+
+    Lines near the top or bottom of a page are counted by their normalized
+    signature; once a signature has appeared on at least min_fraction of
+    the pages seen, matching edge lines are dropped. Lines in the body of a
+    page are never touched.
+
+    A stripper is used for one document. It works on a complete list of
+    pages or on a lazy stream of them: the stream is held back for the first
+    learn_pages pages so the repeats can be learned, then pages flow through
+    as they arrive while the counts keep updating.
+    """
+
+    def __init__(self, min_fraction: float = BOILERPLATE_MIN_FRACTION,
+                 learn_pages: int = BOILERPLATE_LEARN_PAGES):
+        self.min_fraction = min_fraction
+        self.learn_pages = max(learn_pages, BOILERPLATE_MIN_PAGES)
+        self._counts: Counter = Counter()
+        self._pages_seen = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self.lines_removed = 0
+
+    @property
+    def chars_saved(self) -> int:
+        return self.chars_in - self.chars_out
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.chars_saved // CHARS_PER_TOKEN
+
+    def observe(self, page: str):
+        """Count the edge lines of one page."""
+        self._pages_seen += 1
+        self._counts.update(edge_signatures(page))
+
+    def boilerplate(self) -> Set[str]:
+        """Signatures currently considered boilerplate."""
+        if self._pages_seen < BOILERPLATE_MIN_PAGES:
+            return set()
+        needed = max(2, self.min_fraction * self._pages_seen)
+        return {signature for signature, count in self._counts.items() if count >= needed}
+
+    def strip(self, page: str, boilerplate: Optional[Set[str]] = None) -> str:
+        """Return page without its boilerplate edge lines."""
+        if boilerplate is None:
+            boilerplate = self.boilerplate()
+        self.chars_in += len(page)
+        if not boilerplate or not page:
+            self.chars_out += len(page)
+            return page
+
+        lines = page.splitlines()
+        edges = _edge_indexes(len(lines))
+        kept = [line for i, line in enumerate(lines) if i not in edges or line_signature(line) not in boilerplate]
+        self.lines_removed += len(lines) - len(kept)
+        stripped = "\n".join(kept)
+        self.chars_out += len(stripped)
+        return stripped
+
+    def strip_pages(self, pages: List[str]) -> List[str]:
+        """Strip a complete document, learning from all of its pages first."""
+        for page in pages:
+            self.observe(page)
+        boilerplate = self.boilerplate()
+        stripped = [self.strip(page, boilerplate) for page in pages]
+        self.log_savings()
+        return stripped
+
+    def iter_pages(self, pages: Iterable[str]) -> Iterator[str]:
+        """Strip a lazy stream of pages."""
+        held: List[str] = []
+        for page in pages:
+            self.observe(page)
+            if held is None:
+                yield self.strip(page)
+                continue
+            held.append(page)
+            if len(held) >= self.learn_pages:
+                boilerplate = self.boilerplate()
+                for held_page in held:
+                    yield self.strip(held_page, boilerplate)
+                held = None
+        if held:
+            boilerplate = self.boilerplate()
+            for held_page in held:
+                yield self.strip(held_page, boilerplate)
+        self.log_savings()
+
+    def log_savings(self):
+        if self.lines_removed:
+            logger.info(
+                f"Stripped {self.lines_removed} boilerplate lines: {self.chars_saved} chars "
+                f"(~{self.tokens_saved} tokens) of {self.chars_in}"
+            )
+
+    def stats(self):
+        return {
+            'boilerplate_lines_removed': self.lines_removed,
+            'boilerplate_chars_saved': self.chars_saved,
+            'boilerplate_tokens_saved': self.tokens_saved
+        }
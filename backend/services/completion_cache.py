@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from utils.logger_config import setup_logger
+
+logger = setup_logger('completion_cache', 'completion_cache.log')
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Set per request (e.g. from an X-Cache-Bypass header): skip lookups but still store fresh results
+bypass_completion_cache: contextvars.ContextVar[bool] = contextvars.ContextVar('bypass_completion_cache', default=False)
+
+
+def completion_key(model: str, schema: Optional[Dict], prompt: str) -> str:
+    """SHA-256 over everything that determines a completion."""
+    material = json.dumps([model, schema, prompt], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Cache of LLM completions keyed on (model, schema, prompt).
+
+    Completions live in an in-memory LRU whose entries expire after a TTL.
+    When a database path is configured, completions are also written to a
+    SQLite table so they survive restarts and are shared by every worker
+    process on the host. Disk access runs in a worker thread so it never
+    stalls the shared event loop.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 db_path: Optional[str] = None):
+        load_dotenv()
+        if max_entries is None:
+            max_entries = int(os.getenv('LLM_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        if ttl is None:
+            ttl = float(os.getenv('LLM_CACHE_TTL', DEFAULT_TTL_SECONDS))
+        if db_path is None:
+            db_path = os.getenv('LLM_CACHE_DB') or None
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries: TTLCache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        logger.info(f"Initialized CompletionCache (max_entries={self.max_entries}, ttl={self.ttl}s, db_path={self.db_path})")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the SQLite tier on first use. Caller holds the db lock."""
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _load_from_disk(self, key: str) -> Optional[str]:
+        if not self.db_path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connection().execute(
+                    "SELECT value FROM completions WHERE key = ? AND created > ?",
+                    (key, time.time() - self.ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Completion cache lookup failed: {str(e)}")
+            return None
+        return row[0] if row else None
+
+    def _write_to_disk(self, key: str, value: str):
+        if not self.db_path:
+            return
+        try:
+            with self._db_lock:
+                db = self._connection()
+                db.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, time.time())
+                )
+                # Expired rows are only ever skipped by lookups, so prune them as we go
+                db.execute("DELETE FROM completions WHERE created <= ?", (time.time() - self.ttl,))
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write completion to cache: {str(e)}")
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a completion in memory, then on disk. Honours bypass_completion_cache."""
+        if bypass_completion_cache.get():
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        value = await asyncio.to_thread(self._load_from_disk, key) if self.db_path else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+                self._entries[key] = value
+        return value
+
+    async def put(self, key: str, value: str):
+        """Add a completion to both tiers."""
+        with self._lock:
+            self._entries[key] = value
+        if self.db_path:
+            await asyncio.to_thread(self._write_to_disk, key, value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed
+            }
+
+# Create a singleton instance
+completion_cache = CompletionCache()
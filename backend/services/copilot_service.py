@@ -1,13 +1,27 @@
+import asyncio
+import atexit
 import logging
 import os
-from typing import List, Dict
+import time
+from typing import AsyncIterator, List, Dict, Mapping, Optional, Tuple
 import json
 import aiohttp
 from dotenv import load_dotenv
-from utils.logger_config import setup_logger
+from services.completion_cache import completion_cache, completion_key
+from services.hedging import completion_hedger
+from services.llm_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RateLimitError, llm_scheduler, parse_retry_after
+from services.resilience import CircuitOpenError, UpstreamError, is_transient, upstream_breaker, upstream_retry
+from services.response_types import ResponseType, ResultItem, get_response_type
+from services.single_flight import completion_flights, record_upstream_call
+from utils import fast_json
+from utils.deadline import DeadlineExceeded, remaining, time_remains
+from utils.event_loop import shared_loop
+from utils.logger_config import LazyJSON, sample_payloads, setup_logger
+from utils.metrics import PARSE, PROMPT, PROMPT_CHARS, UPSTREAM, UPSTREAM_CALLS, timed
 
 logger = setup_logger('copilot_service', 'copilot_service.log')
 
+
 class CopilotClient:
     def __init__(self):
         load_dotenv()
@@ -17,169 +31,355 @@ class CopilotClient:
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        self.endpoint = "https://api.cohere.ai/v1/chat"
+        self.endpoint = os.getenv('COHERE_API_URL', "https://api.cohere.ai/v1/chat")
         self.model = "command-a-03-2025"
+        self.chat_model = os.getenv('COHERE_CHAT_MODEL', 'command')
+
+        # Connection pool settings for the long-lived HTTP session
+        self.pool_limit = int(os.getenv('COHERE_POOL_LIMIT', 32))
+        self.keepalive_timeout = float(os.getenv('COHERE_KEEPALIVE_TIMEOUT', 60))
+        self.dns_cache_ttl = int(os.getenv('COHERE_DNS_CACHE_TTL', 300))
+        self.connect_timeout = float(os.getenv('COHERE_CONNECT_TIMEOUT', 10))
+        self.read_timeout = float(os.getenv('COHERE_READ_TIMEOUT', 120))
+        self.request_timeout = float(os.getenv('COHERE_REQUEST_TIMEOUT', 120))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_pid: Optional[int] = None
         logger.info(f"Initialized CopilotClient with model: {self.model}")
 
-    async def generate_chat_completion(self, messages: List[Dict[str, str]]) -> str:
-        """Generate a chat completion using Cohere's API with structured JSON output."""
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the shared HTTP session, creating it on first use.
+
+        Runs on the shared event loop, which owns the session for the life of
+        the process, so TCP/TLS connections to Cohere are reused across calls
+        and requests. A forked worker builds its own session instead of reusing
+        the parent's sockets.
+        """
+        if self._session is None or self._session.closed or self._session_pid != os.getpid():
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=self.connect_timeout,
+                sock_read=self.read_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._session_pid = os.getpid()
+            logger.info(f"Opened HTTP session to Cohere (pool limit {self.pool_limit})")
+        return self._session
+
+    def _request_timeout(self) -> aiohttp.ClientTimeout:
+        """Per-request timeout: COHERE_REQUEST_TIMEOUT, cut short by the current deadline."""
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("Deadline exceeded before calling Cohere")
+        total = self.request_timeout if left is None else min(self.request_timeout, left)
+        return aiohttp.ClientTimeout(total=total, connect=self.connect_timeout, sock_read=self.read_timeout)
+
+    async def _post(self, payload: Dict, headers: Dict[str, str]) -> Tuple[int, Mapping[str, str], str]:
+        """
+        POST to the chat endpoint through the pooled session. Runs on the shared event loop.
+
+        Refused at once while the circuit breaker is open; every outcome is
+        reported to the breaker.
+        """
+        timeout = self._request_timeout()
+        upstream_breaker.before_call()
+        session = await self._get_session()
+        PROMPT_CHARS.inc(len(payload.get("message", "")))
         try:
-            if not self.api_key:
-                raise ValueError("API key not configured. Please set COHERE_API_KEY in .env file.")
-
-            logger.info("Starting chat completion request")
-            logger.debug(f"Messages received: {json.dumps(messages, indent=2)}")
-            
-            # Determine the response format based on the message content
-            message_content = messages[0]["content"].lower()
-            if "flashcard" in message_content:
-                schema = {
-                    "type": "object",
-                    "properties": {
-                        "flashcards": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "question": {"type": "string"},
-                                    "answer": {"type": "string"}
-                                },
-                                "required": ["question", "answer"]
-                            }
-                        }
-                    },
-                    "required": ["flashcards"]
-                }
-            elif "quiz" in message_content:
-                schema = {
-                    "type": "object",
-                    "properties": {
-                        "quiz": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "question": {"type": "string"},
-                                    "options": {
-                                        "type": "array",
-                                        "items": {"type": "string"}
-                                    },
-                                    "correct_answer": {"type": "string"},
-                                    "explanation": {"type": "string"}
-                                },
-                                "required": ["question", "options", "correct_answer", "explanation"]
-                            }
-                        }
-                    },
-                    "required": ["quiz"]
-                }
-            else:
-                schema = {
-                    "type": "object",
-                    "properties": {
-                        "concepts": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "concept": {"type": "string"},
-                                    "definition": {"type": "string"},
-                                    "real_world_application": {"type": "string"},
-                                    "latest_insight": {"type": "string"}
-                                },
-                                "required": ["concept", "definition", "real_world_application", "latest_insight"]
-                            }
-                        }
-                    },
-                    "required": ["concepts"]
-                }
-
-            # Prepare the request payload
-            payload = {
-                "model": self.model,
-                "message": messages[0]["content"],
-                "response_format": {
-                    "type": "json_object",
-                    "schema": schema
-                }
-            }
+            with timed(UPSTREAM):
+                async with session.post(self.endpoint, json=payload, headers=headers, timeout=timeout) as response:
+                    status, response_headers, body = response.status, response.headers, await response.text()
+        except asyncio.CancelledError:
+            UPSTREAM_CALLS.inc(label_value='cancelled')
+            upstream_breaker.cancelled()
+            raise
+        except Exception as e:
+            UPSTREAM_CALLS.inc(label_value=type(e).__name__)
+            if isinstance(e, asyncio.TimeoutError) and not time_remains(0):
+                # Our own budget ran out, which says nothing about Cohere's health
+                upstream_breaker.cancelled()
+                raise DeadlineExceeded("Deadline exceeded while waiting for Cohere") from e
+            upstream_breaker.record(failed=is_transient(e))
+            raise
+        UPSTREAM_CALLS.inc(label_value=str(status))
+        upstream_breaker.record(failed=status >= 500)
+        return status, response_headers, body
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
 
-            logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
-            logger.debug(f"Request headers: {json.dumps({k: v if k != 'Authorization' else '***' for k, v in headers.items()}, indent=2)}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.endpoint, json=payload, headers=headers) as response:
-                    response_text = await response.text()
-                    logger.debug(f"Response status: {response.status}")
-                    logger.debug(f"Response headers: {dict(response.headers)}")
-                    logger.debug(f"Response body: {response_text}")
+    async def close(self):
+        """Close the pooled session. Runs on the shared event loop."""
+        if self._session is not None and self._session_pid == os.getpid():
+            await self._session.close()
+        self._session = None
 
-                    if response.status != 200:
-                        error_msg = f"API request failed with status {response.status}: {response_text}"
-                        logger.error(error_msg)
-                        raise Exception(error_msg)
-
-                    response_data = json.loads(response_text)
-                    logger.debug(f"Parsed response: {json.dumps(response_data, indent=2)}")
-
-                    # Extract the content from the response
-                    content = response_data.get('text', '{}')
-                    logger.debug(f"Extracted content: {content}")
-                    
-                    try:
-                        # Parse the JSON response
-                        parsed_content = json.loads(content)
-                        
-                        # Log the content based on type
-                        if "flashcards" in parsed_content:
-                            flashcards = parsed_content.get('flashcards', [])
-                            logger.info("=== Generated Flashcards ===")
-                            for i, card in enumerate(flashcards):
-                                logger.info(f"\nFlashcard {i+1}:")
-                                logger.info(f"Question: {card.get('question', 'No question')}")
-                                logger.info(f"Answer: {card.get('answer', 'No answer')}")
-                                logger.info("-" * 50)
-                            logger.info(f"\nTotal flashcards generated: {len(flashcards)}")
-                        elif "quiz" in parsed_content:
-                            quiz_questions = parsed_content.get('quiz', [])
-                            logger.info("=== Generated Quiz Questions ===")
-                            for i, question in enumerate(quiz_questions):
-                                logger.info(f"\nQuestion {i+1}:")
-                                logger.info(f"Question: {question.get('question', 'No question')}")
-                                logger.info("Options:")
-                                for j, option in enumerate(question.get('options', [])):
-                                    logger.info(f"{chr(65+j)}. {option}")
-                                logger.info(f"Correct Answer: {question.get('correct_answer', 'No answer')}")
-                                logger.info(f"Explanation: {question.get('explanation', 'No explanation')}")
-                                logger.info("-" * 50)
-                            logger.info(f"\nTotal quiz questions generated: {len(quiz_questions)}")
-                        elif "concepts" in parsed_content:
-                            concepts = parsed_content.get('concepts', [])
-                            logger.info("=== Generated Learning Concepts ===")
-                            for i, concept in enumerate(concepts):
-                                logger.info(f"\nConcept {i+1}:")
-                                logger.info(f"Name: {concept.get('concept', 'No concept')}")
-                                logger.info(f"Definition: {concept.get('definition', 'No definition')}")
-                                logger.info(f"Application: {concept.get('real_world_application', 'No application')}")
-                                logger.info(f"Insight: {concept.get('latest_insight', 'No insight')}")
-                                logger.info("-" * 50)
-                            logger.info(f"\nTotal concepts generated: {len(concepts)}")
-                        
-                        return json.dumps(parsed_content)
-                    except json.JSONDecodeError as e:
-                        error_msg = f"Failed to parse JSON response: {e}"
-                        logger.error(error_msg)
-                        raise Exception(error_msg)
+    def shutdown(self):
+        """Close the pooled session from synchronous code, e.g. at interpreter exit."""
+        if self._session is None or self._session_pid != os.getpid():
+            return
+        try:
+            shared_loop.call(self.close(), timeout=5)
+        except Exception as e:
+            logger.warning(f"Error closing HTTP session: {str(e)}")
 
+    async def generate_chat_completion(self, messages: List[Dict[str, str]], response_type: str,
+                                       priority: int = PRIORITY_BULK) -> Dict[str, List[ResultItem]]:
+        """
+        Generate a chat completion using Cohere's API with structured JSON output.
+
+        response_type names the entry of RESPONSE_TYPES giving the schema sent
+        upstream and the models the answer is parsed into. The answer is
+        parsed and validated once, straight into those models.
+
+        Completions are cached on (model, schema, prompt), so a re-upload or a
+        retry of the same segment does not call Cohere again, and concurrent
+        identical calls are coalesced into one. On a miss the call
+        waits for a slot in the shared LLM scheduler, so concurrent requests
+        never exceed the provider-friendly concurrency budget and interactive
+        calls can be admitted ahead of bulk generation. With LLM_HEDGING on,
+        a call slower than recent ones is raced against a duplicate.
+        Transient failures are retried while the current deadline allows,
+        and calls fail fast with CircuitOpenError while Cohere is failing.
+
+        Returns:
+            Dict[str, List[ResultItem]]: The valid items of each field of the response type
+        """
+        try:
+            with timed(PROMPT):
+                kind = get_response_type(response_type)
+                prompt = messages[0]["content"]
+                cache_key = completion_key(self.model, kind.schema, prompt)
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Completion cache hit for %s", cache_key[:12])
+                with timed(PARSE):
+                    return kind.parse(cached)
+
+            # Identical prompts already in flight (double clicks, retries) share one upstream call
+            result = await completion_flights.run(
+                cache_key,
+                lambda: self._complete_uncached(messages, kind, cache_key, priority)
+            )
+            # Callers sharing a flight must not share mutable lists
+            return {field: list(items) for field, items in result.items()}
+        except (CircuitOpenError, DeadlineExceeded):
+            # Callers answer these differently from other failures (503, 504)
+            raise
         except Exception as e:
             error_msg = f"Error in generate_chat_completion: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise Exception(error_msg)
 
+    async def generate_chat_reply(self, message: str) -> str:
+        """Answer a free-form chat message in one piece, as an interactive call."""
+        return await upstream_retry.run(
+            lambda: llm_scheduler.run(lambda: self._request_chat_reply(message), PRIORITY_INTERACTIVE)
+        )
+
+    async def _request_chat_reply(self, message: str) -> str:
+        payload = {"model": self.chat_model, "message": message}
+        status, headers, body = await shared_loop.run(self._post(payload, self._headers()))
+        llm_scheduler.observe_headers(headers)
+        if status == 429:
+            raise RateLimitError(f"API request was rate limited: {body}", parse_retry_after(headers))
+        if status != 200:
+            raise UpstreamError(status, body)
+        return json.loads(body).get('text', '')
+
+    async def stream_chat(self, message: str) -> AsyncIterator[str]:
+        """
+        Stream a free-form chat reply token by token.
+
+        Must be iterated on the shared event loop, which owns the HTTP session.
+        The scheduler slot is held until the stream ends or the consumer closes
+        the generator. Everything up to the first token is retried as
+        generate_chat_reply is: 429s under the scheduler, transient failures
+        (5xx, dropped connections, timeouts) under upstream_retry while the
+        deadline allows. So rate limits and upstream errors are still raised
+        before the first token, and callers can answer with a proper error
+        status; a failure after it ends the stream. Each attempt, reading the
+        stream included, is limited to COHERE_REQUEST_TIMEOUT, cut short by
+        the current deadline.
+        """
+        payload = {"model": self.chat_model, "message": message, "stream": True}
+        response, tokens, first_token = await upstream_retry.run(lambda: self._start_chat_stream(payload))
+        try:
+            async with response:
+                if first_token is not None:
+                    yield first_token
+                    async for token in tokens:
+                        yield token
+            llm_scheduler.on_success()
+        finally:
+            await tokens.aclose()
+            llm_scheduler.release()
+
+    async def _start_chat_stream(self, payload: Dict) -> Tuple[aiohttp.ClientResponse, AsyncIterator[str], Optional[str]]:
+        """
+        Take a scheduler slot, start a streamed chat call and read up to its first token.
+
+        Returns the open response, its remaining tokens and the first one (None
+        if the reply has no text), with the slot still held: the caller closes
+        the response and releases the slot when the stream ends. On any failure
+        the response is closed and the slot released before raising, so a retry
+        queues for a slot like any other call.
+        """
+        session = await self._get_session()
+        attempt = 0
+        while True:
+            await llm_scheduler.acquire(PRIORITY_INTERACTIVE)
+            try:
+                response = await self._post_streaming(session, payload)
+                try:
+                    llm_scheduler.observe_headers(response.headers)
+                    if response.status == 429:
+                        body = await response.text()
+                        raise RateLimitError(f"API request was rate limited: {body}",
+                                             parse_retry_after(response.headers))
+                    if response.status != 200:
+                        raise UpstreamError(response.status, await response.text())
+                    tokens = self._chat_tokens(response)
+                    first_token = await anext(tokens, None)
+                except BaseException:
+                    response.close()
+                    raise
+                return response, tokens, first_token
+            except RateLimitError as e:
+                llm_scheduler.release()
+                llm_scheduler.on_rate_limited(e.retry_after)
+                if attempt >= llm_scheduler.rate_limit_retries:
+                    raise
+                attempt += 1
+            except BaseException:
+                llm_scheduler.release()
+                raise
+
+    async def _post_streaming(self, session: aiohttp.ClientSession, payload: Dict) -> aiohttp.ClientResponse:
+        """Start a streamed POST, accounted and bounded like _post; the body is left unread."""
+        # Taken after the scheduler wait, which spends part of the deadline
+        timeout = self._request_timeout()
+        upstream_breaker.before_call()
+        PROMPT_CHARS.inc(len(payload.get("message", "")))
+        try:
+            response = await session.post(self.endpoint, json=payload, headers=self._headers(), timeout=timeout)
+        except asyncio.CancelledError:
+            UPSTREAM_CALLS.inc(label_value='cancelled')
+            upstream_breaker.cancelled()
+            raise
+        except Exception as e:
+            UPSTREAM_CALLS.inc(label_value=type(e).__name__)
+            if isinstance(e, asyncio.TimeoutError) and not time_remains(0):
+                upstream_breaker.cancelled()
+                raise DeadlineExceeded("Deadline exceeded while waiting for Cohere") from e
+            upstream_breaker.record(failed=is_transient(e))
+            raise
+        UPSTREAM_CALLS.inc(label_value=str(response.status))
+        upstream_breaker.record(failed=response.status >= 500)
+        return response
+
+    @staticmethod
+    async def _chat_tokens(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """Text of each token in a streamed chat response, up to the end of the stream."""
+        # Cohere streams one JSON event per line
+        async for line in response.content:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            event_type = event.get('event_type')
+            if event_type == 'text-generation':
+                yield event.get('text', '')
+            elif event_type == 'stream-end':
+                return
+
+    async def _complete_uncached(self, messages: List[Dict[str, str]], kind: ResponseType, cache_key: str,
+                                 priority: int) -> Dict[str, List[ResultItem]]:
+        record_upstream_call()
+        # A slow call may be duplicated, each attempt in its own scheduler slot; only when
+        # a slot is free, since a hedge queued behind other calls cannot finish sooner
+        # 5xx answers and dropped connections are retried while the deadline allows
+        content = await upstream_retry.run(lambda: completion_hedger.run(
+            lambda: llm_scheduler.run(lambda: self._request_chat_completion(messages, kind.schema), priority),
+            llm_scheduler.has_spare_capacity
+        ))
+        try:
+            with timed(PARSE):
+                result = kind.parse(content)
+        except ValueError as e:
+            error_msg = f"Failed to parse JSON response: {e}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        logger.info(
+            f"Generated {kind.name}: " + ", ".join(f"{len(items)} {field}" for field, items in result.items())
+        )
+        # Only answers that parsed are cached, as the model's own text
+        await completion_cache.put(cache_key, content)
+        return result
+
+    async def _request_chat_completion(self, messages: List[Dict[str, str]], schema: Dict) -> str:
+        """Send a single chat request to Cohere and return the JSON content, unparsed."""
+        if not self.api_key:
+            raise ValueError("API key not configured. Please set COHERE_API_KEY in .env file.")
+
+        logger.debug("Starting chat completion request")
+        # Full payloads are dumped for a sample of calls, and only at DEBUG level
+        dump_payloads = sample_payloads(logger)
+        if dump_payloads:
+            logger.debug("Messages received: %s", LazyJSON(messages))
+
+        # Prepare the request payload
+        payload = {
+            "model": self.model,
+            "message": messages[0]["content"],
+            "response_format": {
+                "type": "json_object",
+                "schema": schema
+            }
+        }
+
+        headers = self._headers()
+
+        if dump_payloads:
+            logger.debug("Request payload: %s", LazyJSON(payload))
+
+        started = time.monotonic()
+        response_status, response_headers, response_text = await shared_loop.run(
+            self._post(payload, headers)
+        )
+        if response_status == 200:
+            completion_hedger.observe(time.monotonic() - started)
+        logger.debug("Response status: %s", response_status)
+        if dump_payloads:
+            logger.debug("Response headers: %s", LazyJSON(dict(response_headers)))
+            logger.debug("Response body: %s", LazyJSON(response_text))
+
+        llm_scheduler.observe_headers(response_headers)
+
+        if response_status == 429:
+            raise RateLimitError(
+                f"API request was rate limited: {response_text}",
+                parse_retry_after(response_headers)
+            )
+
+        if response_status != 200:
+            error = UpstreamError(response_status, response_text)
+            logger.error(str(error))
+            raise error
+
+        response_data = fast_json.loads(response_text)
+
+        # Extract the content from the response
+        content = response_data.get('text', '{}')
+        return content
+
 # Create a singleton instance
-copilot_client = CopilotClient() 
\ No newline at end of file
+copilot_client = CopilotClient()
+atexit.register(copilot_client.shutdown) 
\ No newline at end of file
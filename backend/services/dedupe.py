@@ -0,0 +1,191 @@
+import os
+import re
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from numpy.lib.stride_tricks import sliding_window_view
+
+load_dotenv()
+
+# Items at or above this estimated Jaccard similarity of their character shingles are duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.7))
+
+SHINGLE_CHARS = 5
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_SHINGLE_MASK = np.uint64(0xFFFFFFFF)
+# Fixed seed: the same items always get the same signatures, in every process
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, (1 << 31) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 31) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+# Polynomial rolling-hash weights for one shingle; overflow wraps, which is fine for hashing
+_SHINGLE_WEIGHTS = np.array([pow(1000003, SHINGLE_CHARS - 1 - i, 1 << 64) for i in range(SHINGLE_CHARS)],
+                            dtype=np.uint64)
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse punctuation and whitespace, so trivial edits do not matter."""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def question_key(item) -> str:
+    """Flashcards and quiz questions repeat when their question text matches, ignoring case."""
+    return item.question.lower().strip()
+
+
+def question_text(item) -> str:
+    return item.question
+
+
+def flashcard_answer(item) -> str:
+    return item.answer
+
+
+def quiz_answer(item) -> str:
+    return item.correct_answer
+
+
+def concept_key(item) -> str:
+    return item.concept
+
+
+def concept_text(item) -> str:
+    # Concept names alone are too short to compare; the definition says what it is
+    return f"{item.concept} {item.definition}"
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """32-bit hashes of every SHINGLE_CHARS-character window of text."""
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_CHARS:
+        codes = np.concatenate([codes, np.zeros(SHINGLE_CHARS - len(codes), dtype=np.uint64)])
+    windows = sliding_window_view(codes, SHINGLE_CHARS)
+    return (windows * _SHINGLE_WEIGHTS).sum(axis=1, dtype=np.uint64) & _SHINGLE_MASK
+
+
+def answer_shingles(text: str) -> frozenset:
+    """The exact set of shingle hashes of a (short) answer; empty if it has no text."""
+    text = normalize_text(text)
+    return frozenset(_shingle_hashes(text).tolist()) if text else frozenset()
+
+
+def answers_match(first: frozenset, second: frozenset, threshold: float) -> bool:
+    """
+    Whether two answers say the same thing: one's shingles mostly contained in the other's.
+
+    Containment rather than Jaccard, so "The mitochondria" matches "Mitochondria".
+    A missing answer matches anything, leaving the decision to the question.
+    """
+    if not first or not second:
+        return True
+    return len(first & second) / min(len(first), len(second)) >= threshold
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    MinHash signatures of the character shingles of each (non-empty) text.
+
+    All texts are hashed in one vectorized pass: shingle hashes are
+    concatenated, permuted together and reduced per text.
+
+    Returns:
+        np.ndarray: (len(texts), MINHASH_PERMUTATIONS) array of uint64
+    """
+    shingles = [_shingle_hashes(text) for text in texts]
+    offsets = np.cumsum([0] + [len(hashes) for hashes in shingles[:-1]])
+    permuted = (np.concatenate(shingles)[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME
+    return np.minimum.reduceat(permuted, offsets, axis=0)
+
+
+class Deduplicator:
+    """
+    Drops generated items already seen in earlier segments of the same request.
+
+    An item is a duplicate when its key matches an earlier item exactly, or
+    when its text is a near duplicate of an earlier item's: overlapping
+    segments tend to produce the same question reworded slightly. Near
+    duplicates are found with MinHash over character shingles and
+    locality-sensitive hashing, so each new item is only compared with the
+    few earlier items sharing an LSH band with it, and the cost stays
+    roughly linear in the number of items.
+
+    Short questions that differ in one token ("World War I" vs "World War
+    II") still score as near duplicates, so when an answer function is
+    given, a near duplicate must also have a matching answer.
+
+    Items can be fed in batches as segments finish, so streamed responses
+    and buffered ones apply exactly the same rule. The first occurrence is
+    always the one kept, so the selection is deterministic for a given
+    order of batches.
+    """
+
+    def __init__(self, key: Callable[[object], Hashable], text: Optional[Callable[[object], str]] = None,
+                 threshold: float = NEAR_DUPLICATE_THRESHOLD, answer: Optional[Callable[[object], str]] = None):
+        self.key = key
+        self.text = text
+        self.answer = answer
+        self.threshold = threshold
+        self.seen = set()
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self._signatures: List[np.ndarray] = []
+        self._answers: List[frozenset] = []
+        self._buckets: Dict[bytes, List[int]] = {}
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = signature.reshape(MINHASH_BANDS, MINHASH_ROWS)
+        return [bytes([band]) + rows[band].tobytes() for band in range(MINHASH_BANDS)]
+
+    def _is_near_duplicate(self, signature: np.ndarray, band_keys: List[bytes], answer: frozenset) -> bool:
+        candidates = sorted({kept for band_key in band_keys for kept in self._buckets.get(band_key, ())})
+        if not candidates:
+            return False
+        candidate_signatures = np.stack([self._signatures[kept] for kept in candidates])
+        similarity = (candidate_signatures == signature).mean(axis=1)
+        return any(answers_match(answer, self._answers[kept], self.threshold)
+                   for kept, score in zip(candidates, similarity) if score >= self.threshold)
+
+    def _remember(self, signature: np.ndarray, band_keys: List[bytes], answer: frozenset):
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._answers.append(answer)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(position)
+
+    def filter(self, items: Iterable) -> List:
+        """Return the items not seen before, in order, and remember them."""
+        exact_unique = []
+        for item in items:
+            item_key = self.key(item)
+            if item_key in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(item_key)
+            exact_unique.append(item)
+
+        if self.text is None:
+            return exact_unique
+
+        texts = [normalize_text(self.text(item)) for item in exact_unique]
+        comparable = [i for i, text in enumerate(texts) if text]
+        signatures = minhash_signatures([texts[i] for i in comparable]) if comparable else None
+        signature_of = {i: row for i, row in zip(comparable, signatures if signatures is not None else [])}
+
+        unique = []
+        for i, item in enumerate(exact_unique):
+            signature = signature_of.get(i)
+            if signature is not None:
+                band_keys = self._band_keys(signature)
+                answer = answer_shingles(self.answer(item)) if self.answer is not None else frozenset()
+                if self._is_near_duplicate(signature, band_keys, answer):
+                    self.duplicates += 1
+                    self.near_duplicates += 1
+                    continue
+                self._remember(signature, band_keys, answer)
+            unique.append(item)
+        return unique
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Union
+from dotenv import load_dotenv
+from services.pdf_service import pdf_service
+from services.page_index import PageIndex, join_page_texts, page_range_for_chunk
+from utils.logger_config import setup_logger
+
+logger = setup_logger('document_cache', 'document_cache.log')
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64MB of extracted text
+DEFAULT_MAX_OPEN_INDEXES = 8
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the SHA-256 hex digest of the given PDF bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(filepath: str) -> str:
+    """Return the SHA-256 hex digest of a file without loading it all at once."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_source(source: Union[bytes, str]) -> str:
+    """Hash raw PDF bytes or the file at the given path."""
+    if isinstance(source, (bytes, bytearray)):
+        return hash_bytes(source)
+    return hash_file(source)
+
+
+class ExtractedDocument:
+    """Extraction result for a single PDF, addressed by the hash of its bytes."""
+
+    def __init__(self, digest: str, page_count: int, pages: List[str], file_size: int):
+        self.digest = digest
+        self.page_count = page_count
+        self.pages = pages
+        self.file_size = file_size
+        # Same shape as the text the endpoints used to build page by page
+        self.full_text = join_page_texts(pages)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the extracted text."""
+        return len(self.full_text) + sum(len(page) for page in self.pages)
+
+    def to_dict(self) -> Dict:
+        return {
+            'digest': self.digest,
+            'page_count': self.page_count,
+            'pages': self.pages,
+            'file_size': self.file_size
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ExtractedDocument':
+        return cls(data['digest'], data['page_count'], data['pages'], data['file_size'])
+
+
+def extract_document(source: Union[bytes, str], digest: str) -> ExtractedDocument:
+    """
+    Parse a PDF once and extract the text of every page.
+
+    Args:
+        source (Union[bytes, str]): Raw PDF bytes or a path to the PDF file
+        digest (str): SHA-256 of the PDF bytes
+
+    Returns:
+        ExtractedDocument: Page count, per-page text and full text
+    """
+    return document_from_index(PageIndex(source, digest))
+
+
+def _should_use_pool(index: PageIndex) -> bool:
+    """Hand a large index to the process pool unless most of its pages are already extracted."""
+    return pdf_service.should_parallelize(index.page_count) and index.extracted_count * 2 < index.page_count
+
+
+def document_from_index(index: PageIndex) -> ExtractedDocument:
+    """Finish extracting an index and turn it into a cacheable document."""
+    if _should_use_pool(index):
+        index.fill_pages(pdf_service.extract_pages(index.data, index.page_count))
+    pages = index.all_pages()
+    return ExtractedDocument(index.digest, index.page_count, pages, index.file_size)
+
+
+class DocumentCache:
+    """
+    Content-addressed cache of extracted PDF text.
+
+    Entries are kept in an in-memory LRU bounded by the approximate size of the
+    extracted text. When a cache directory is configured, every extracted
+    document is also written there as JSON so repeat uploads survive restarts.
+
+    Documents that are only partially read (chunked requests) live in a small
+    LRU of open page indexes until every page has been extracted.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, cache_dir: Optional[str] = None,
+                 max_open_indexes: Optional[int] = None):
+        load_dotenv()
+        if max_bytes is None:
+            max_bytes = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        if max_open_indexes is None:
+            max_open_indexes = int(os.getenv('PAGE_INDEX_MAX_OPEN', DEFAULT_MAX_OPEN_INDEXES))
+        if cache_dir is None:
+            cache_dir = os.getenv('DOCUMENT_CACHE_DIR') or None
+
+        self.max_bytes = max_bytes
+        self.max_open_indexes = max_open_indexes
+        self.cache_dir = cache_dir
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self._entries: 'OrderedDict[str, ExtractedDocument]' = OrderedDict()
+        self._current_bytes = 0
+        self._indexes: 'OrderedDict[str, PageIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        logger.info(f"Initialized DocumentCache (max_bytes={self.max_bytes}, cache_dir={self.cache_dir})")
+
+    def _disk_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load_from_disk(self, digest: str) -> Optional[ExtractedDocument]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                return ExtractedDocument.from_dict(json.load(file))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable cache file {path}: {str(e)}")
+            return None
+
+    def _write_to_disk(self, document: ExtractedDocument):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(document.digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(document.to_dict(), file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache file {path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, document: ExtractedDocument):
+        """Insert into the memory tier and evict least recently used entries. Caller holds the lock."""
+        if document.digest in self._entries:
+            self._entries.move_to_end(document.digest)
+            return
+        if document.nbytes > self.max_bytes:
+            logger.info(f"Document {document.digest[:12]} is larger than the memory cache, not keeping it in memory")
+            return
+        self._entries[document.digest] = document
+        self._current_bytes += document.nbytes
+        while self._current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._current_bytes -= evicted.nbytes
+            logger.debug("Evicted document %s from memory cache", evicted.digest[:12])
+
+    def get(self, digest: str) -> Optional[ExtractedDocument]:
+        """Look up a document by content hash in memory, then on disk."""
+        with self._lock:
+            document = self._entries.get(digest)
+            if document is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return document
+
+        document = self._load_from_disk(digest)
+        if document is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._store(document)
+        return document
+
+    def put(self, document: ExtractedDocument):
+        """Add an extracted document to both cache tiers."""
+        with self._lock:
+            self._store(document)
+        self._write_to_disk(document)
+
+    def evict(self, digest: str):
+        """Drop a document's text and open page index from memory. The disk tier is kept."""
+        with self._lock:
+            document = self._entries.pop(digest, None)
+            if document is not None:
+                self._current_bytes -= document.nbytes
+            self._indexes.pop(digest, None)
+
+    def get_page_index(self, source: Union[bytes, str], digest: str) -> PageIndex:
+        """
+        Return the open page index for a document, parsing the PDF only if none is open.
+
+        Args:
+            source (Union[bytes, str]): Raw PDF bytes or a path to the PDF file
+            digest (str): SHA-256 of the PDF bytes
+
+        Returns:
+            PageIndex: Index whose already extracted pages are reused
+        """
+        with self._lock:
+            index = self._indexes.get(digest)
+            if index is not None:
+                self._indexes.move_to_end(digest)
+                return index
+
+        index = PageIndex(source, digest)
+        with self._lock:
+            # Another request may have built the same index meanwhile; keep the first one
+            existing = self._indexes.get(digest)
+            if existing is not None:
+                return existing
+            self._indexes[digest] = index
+            while len(self._indexes) > self.max_open_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _complete_index(self, index: PageIndex) -> ExtractedDocument:
+        """Promote a page index to a cached document and close it."""
+        document = document_from_index(index)
+        self.put(document)
+        with self._lock:
+            self._indexes.pop(index.digest, None)
+        return document
+
+    def get_or_extract(self, source: Union[bytes, str], digest: Optional[str] = None) -> ExtractedDocument:
+        """
+        Return the extracted document for a PDF, parsing it only on a cache miss.
+
+        Args:
+            source (Union[bytes, str]): Raw PDF bytes or a path to the PDF file
+            digest (Optional[str]): Precomputed SHA-256 of the PDF bytes
+
+        Returns:
+            ExtractedDocument: The cached or freshly extracted document
+        """
+        if digest is None:
+            digest = hash_source(source)
+
+        document = self.get(digest)
+        if document is not None:
+            logger.info(f"Document cache hit for {digest[:12]}")
+            return document
+
+        with self._lock:
+            self.misses += 1
+        logger.info(f"Document cache miss for {digest[:12]}, extracting text")
+        return self._complete_index(self.get_page_index(source, digest))
+
+    def iter_pages(self, source: Union[bytes, str], digest: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield the text of every page in order, extracting pages only as they are consumed.
+
+        Cached documents are replayed from memory. Otherwise pages come from the
+        open page index (or the process pool for large PDFs) and the document is
+        cached once the last page has been yielded.
+
+        Args:
+            source (Union[bytes, str]): Raw PDF bytes or a path to the PDF file
+            digest (Optional[str]): Precomputed SHA-256 of the PDF bytes
+        """
+        if digest is None:
+            digest = hash_source(source)
+
+        document = self.get(digest)
+        if document is not None:
+            yield from document.pages
+            return
+
+        with self._lock:
+            self.misses += 1
+        index = self.get_page_index(source, digest)
+        if _should_use_pool(index):
+            pages = []
+            for text in pdf_service.iter_pages(index.data, index.page_count):
+                pages.append(text)
+                yield text
+            index.fill_pages(pages)
+        else:
+            for page_num in range(index.page_count):
+                yield index.page_text(page_num)
+        self._complete_index(index)
+
+    def estimate_text_length(self, source: Union[bytes, str], digest: Optional[str] = None) -> int:
+        """
+        Return the length of a document's full text, estimating it for documents not yet extracted.
+
+        The estimate extrapolates from the first, middle and last page, which are
+        memoized in the page index and not extracted again later.
+        """
+        if digest is None:
+            digest = hash_source(source)
+
+        document = self.get(digest)
+        if document is not None:
+            return len(document.full_text)
+
+        index = self.get_page_index(source, digest)
+        if index.page_count == 0:
+            return 0
+        sample = sorted({0, index.page_count // 2, index.page_count - 1})
+        sampled_chars = sum(len(index.page_text(page_num)) + 1 for page_num in sample)
+        return int(sampled_chars / len(sample) * index.page_count)
+
+    def get_chunk_pages(self, source: Union[bytes, str], chunk_number: int, total_chunks: int,
+                        digest: Optional[str] = None) -> List[str]:
+        """Return the page texts of one chunk of a PDF, extracting only the pages inside it."""
+        if digest is None:
+            digest = hash_source(source)
+
+        document = self.get(digest)
+        if document is not None:
+            start_page, end_page = page_range_for_chunk(document.page_count, chunk_number, total_chunks)
+            return document.pages[start_page:end_page]
+
+        index = self.get_page_index(source, digest)
+        start_page, end_page = page_range_for_chunk(index.page_count, chunk_number, total_chunks)
+        pages = index.pages_text(start_page, end_page)
+        if index.is_complete:
+            self._complete_index(index)
+        return pages
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'open_indexes': len(self._indexes)
+            }
+
+# Create a singleton instance
+document_cache = DocumentCache()
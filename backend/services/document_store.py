@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from services.document_cache import document_cache, hash_bytes
+from utils.logger_config import setup_logger
+
+logger = setup_logger('document_store', 'document_store.log')
+
+DEFAULT_SESSION_TTL = 60 * 60  # 1 hour since last use
+DEFAULT_MAX_SESSION_BYTES = 512 * 1024 * 1024
+SWEEP_INTERVAL = 60
+
+
+class DocumentStoreFullError(ValueError):
+    """Storing a document would exceed the configured byte budget."""
+
+
+class DocumentSession:
+    """A PDF uploaded once and referenced by ID from the feature endpoints."""
+
+    def __init__(self, document_id: str, digest: str, filename: str, pdf_bytes: bytes):
+        self.document_id = document_id
+        self.digest = digest
+        self.filename = filename
+        self.pdf_bytes = pdf_bytes
+        self.file_size = len(pdf_bytes)
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def to_dict(self, ttl: int) -> Dict:
+        return {
+            'document_id': self.document_id,
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'expires_in': max(0, int(self.last_access + ttl - time.time()))
+        }
+
+
+class DocumentStore:
+    """
+    In-memory registry of uploaded documents with sliding TTL expiry.
+
+    A session keeps the raw PDF bytes so extraction can be redone if the
+    document cache has evicted its text. When the last session for a given
+    content hash expires, its extracted text is dropped from memory as well.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_bytes: Optional[int] = None):
+        load_dotenv()
+        if ttl is None:
+            ttl = int(os.getenv('DOCUMENT_SESSION_TTL', DEFAULT_SESSION_TTL))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('DOCUMENT_SESSION_MAX_BYTES', DEFAULT_MAX_SESSION_BYTES))
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions: Dict[str, DocumentSession] = {}
+        self._current_bytes = 0
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        logger.info(f"Initialized DocumentStore (ttl={self.ttl}s, max_bytes={self.max_bytes})")
+
+    def _remove(self, document_id: str) -> Optional[DocumentSession]:
+        """Drop a session and release its cached text if nothing else uses it. Caller holds the lock."""
+        session = self._sessions.pop(document_id, None)
+        if session is None:
+            return None
+        self._current_bytes -= session.file_size
+        if not any(other.digest == session.digest for other in self._sessions.values()):
+            document_cache.evict(session.digest)
+        return session
+
+    def _sweep(self, force: bool = False):
+        """Expire idle sessions. Caller holds the lock."""
+        now = time.time()
+        if not force and now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        expired = [document_id for document_id, session in self._sessions.items()
+                   if now - session.last_access > self.ttl]
+        for document_id in expired:
+            self._remove(document_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} document sessions")
+
+    def create(self, pdf_bytes: bytes, filename: str, digest: Optional[str] = None) -> DocumentSession:
+        """
+        Store an uploaded PDF and return its session.
+
+        Args:
+            pdf_bytes (bytes): Raw PDF contents
+            filename (str): Original (sanitized) filename
+            digest (str, optional): SHA-256 of pdf_bytes, if the caller already computed it
+
+        Returns:
+            DocumentSession: The new session
+
+        Raises:
+            DocumentStoreFullError: If storing the document would exceed the configured byte budget
+        """
+        session = DocumentSession(uuid.uuid4().hex, digest or hash_bytes(pdf_bytes), filename, pdf_bytes)
+        with self._lock:
+            self._sweep(force=self._current_bytes + session.file_size > self.max_bytes)
+            if self._current_bytes + session.file_size > self.max_bytes:
+                raise DocumentStoreFullError("Document storage is full, please try again later")
+            self._sessions[session.document_id] = session
+            self._current_bytes += session.file_size
+        logger.info(f"Created document session {session.document_id} for {filename} ({session.file_size} bytes)")
+        return session
+
+    def get(self, document_id: str) -> Optional[DocumentSession]:
+        """Return a live session and extend its TTL, or None if unknown or expired."""
+        with self._lock:
+            self._sweep()
+            session = self._sessions.get(document_id)
+            if session is None:
+                return None
+            if time.time() - session.last_access > self.ttl:
+                self._remove(document_id)
+                return None
+            session.last_access = time.time()
+            return session
+
+    def find_by_digest(self, digest: str) -> Optional[DocumentSession]:
+        """Return a live session holding the PDF with the given SHA-256, if any."""
+        with self._lock:
+            now = time.time()
+            for session in self._sessions.values():
+                if session.digest == digest and now - session.last_access <= self.ttl:
+                    return session
+            return None
+
+    def delete(self, document_id: str) -> bool:
+        """Remove a session. Returns False if it did not exist."""
+        with self._lock:
+            return self._remove(document_id) is not None
+
+# Create a singleton instance
+document_store = DocumentStore()
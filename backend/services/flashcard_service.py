@@ -1,19 +1,31 @@
 import logging
-from typing import List, Dict
+from typing import List
 import json
 import os
 from dotenv import load_dotenv
 import aiohttp
 from services.copilot_service import copilot_client
+from services.resilience import upstream_retry
+from services.response_types import Flashcard
+from utils.deadline import time_remains
 from utils.logger_config import setup_logger
 
 logger = setup_logger('flashcard_service', 'flashcard_service.log')
 
+load_dotenv()
+
+FLASHCARD_COUNT = 10
+# Cards asked for beyond FLASHCARD_COUNT, so a few invalid or missing ones rarely cost a top-up call
+FLASHCARD_SPECULATIVE_EXTRA = int(os.getenv('FLASHCARD_SPECULATIVE_EXTRA', 3))
+
 class FlashcardService:
-    def __init__(self):
+    def __init__(self, speculative_extra: int = FLASHCARD_SPECULATIVE_EXTRA):
+        self.speculative_extra = speculative_extra
+        self.calls = 0
+        self.top_ups = 0
         logger.info("Initialized FlashcardService")
 
-    async def generate_flashcards(self, text: str) -> List[Dict[str, str]]:
+    async def generate_flashcards(self, text: str) -> List[Flashcard]:
         """
         Generate flashcards from the given text using Cohere's API.
         
@@ -21,53 +33,59 @@ class FlashcardService:
             text (str): The text to generate flashcards from
             
         Returns:
-            List[Dict[str, str]]: List of flashcards, each containing 'question' and 'answer'
+            List[Flashcard]: List of flashcards, each with a question and an answer
         """
         try:
             logger.info("Starting flashcard generation")
-            logger.debug(f"Input text length: {len(text)} characters")
+            logger.debug("Input text length: %d characters", len(text))
 
-            # Prepare the message for the API with explicit request for 10 flashcards
-            message = f"""Create exactly 10 educational flashcards from the following text.
+            # Ask for a few more than needed: the extras are trimmed, and a short answer
+            # usually still has 10 valid cards instead of needing a serial top-up call
+            requested = FLASHCARD_COUNT + self.speculative_extra
+            message = f"""Create exactly {requested} educational flashcards from the following text.
             Each flashcard should:
             1. Have a clear, concise question
             2. Include a detailed, accurate answer
             3. Cover different key concepts from the text
             4. Be suitable for studying and review
             
-            Format the response as a JSON object with exactly 10 flashcards.
+            Format the response as a JSON object with exactly {requested} flashcards.
             Each flashcard must have both a question and answer field.
             
             Text:
             {text}"""
 
-            logger.info("Sending request to Cohere API")
+            logger.debug("Sending request to Cohere API")
             
             # Call the Cohere API through the copilot client
-            response = await copilot_client.generate_chat_completion([{"content": message}])
-            logger.info("Received response from Cohere API")
+            response = await copilot_client.generate_chat_completion([{"content": message}], 'flashcards')
+            logger.debug("Received response from Cohere API")
             
-            # Parse the response
-            response_data = json.loads(response)
-            flashcards = response_data.get('flashcards', [])
+            flashcards = response['flashcards'][:FLASHCARD_COUNT]
+            self.calls += 1
             
             # Ensure we have exactly 10 flashcards
-            if len(flashcards) < 10:
-                logger.warning(f"Received only {len(flashcards)} flashcards, expected 10")
+            if len(flashcards) < FLASHCARD_COUNT and not time_remains(upstream_retry.min_attempt_seconds):
+                # Better a short set now than none once the deadline passes
+                logger.warning(f"Received only {len(flashcards)} flashcards, no time left for more")
+            elif len(flashcards) < FLASHCARD_COUNT:
+                logger.warning(f"Received only {len(flashcards)} flashcards, expected {FLASHCARD_COUNT}")
+                self.top_ups += 1
                 # If we got fewer than 10, try to generate more
-                remaining = 10 - len(flashcards)
+                remaining = FLASHCARD_COUNT - len(flashcards)
                 additional_message = f"""Generate {remaining} more flashcards to complement these existing ones:
-                {json.dumps(flashcards, indent=2)}
+                {json.dumps([card.to_dict() for card in flashcards], indent=2)}
                 
                 Make sure the new flashcards are different from the existing ones and cover different aspects of the text.
                 """
                 
-                additional_response = await copilot_client.generate_chat_completion([{"content": additional_message}])
-                additional_data = json.loads(additional_response)
-                additional_flashcards = additional_data.get('flashcards', [])
+                additional_response = await copilot_client.generate_chat_completion(
+                    [{"content": additional_message}], 'flashcards'
+                )
+                additional_flashcards = additional_response['flashcards']
                 
                 flashcards.extend(additional_flashcards)
-                flashcards = flashcards[:10]  # Ensure we don't exceed 10
+                flashcards = flashcards[:FLASHCARD_COUNT]  # Ensure we don't exceed 10
             
             logger.info(f"Successfully generated {len(flashcards)} flashcards")
             return flashcards
@@ -76,5 +94,12 @@ class FlashcardService:
             logger.error(f"Error generating flashcards: {str(e)}", exc_info=True)
             raise
 
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'top_ups': self.top_ups,
+            'speculative_extra': self.speculative_extra
+        }
+
 # Create a singleton instance
 flashcard_service = FlashcardService() 
\ No newline at end of file
@@ -0,0 +1,241 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from services.boilerplate import BoilerplateStripper
+from services.completion_cache import bypass_completion_cache
+from services.copilot_service import copilot_client
+from services.dedupe import (Deduplicator, concept_key, concept_text, flashcard_answer, question_key, question_text,
+                             quiz_answer)
+from services.document_cache import document_cache
+from services.enhanced_learning_service import enhanced_learning_service
+from services.flashcard_service import flashcard_service
+from services.page_index import join_page_texts
+from services.pipeline import iter_segment_pipeline, run_segment_pipeline
+from services.response_types import ResultItem
+from services.segmenter import MAX_GENERATION_SEGMENTS, Segment, Segmenter
+from services.single_flight import generation_flights
+from services.study_pack_service import study_pack_service
+from utils.deadline import deadline_after, run_with_deadline
+from utils.logger_config import setup_logger
+
+logger = setup_logger('generation', 'generation.log')
+
+
+def iter_document_pages(source, digest: Optional[str] = None, chunk_number: Optional[int] = None,
+                        total_chunks: Optional[int] = None) -> Tuple[Iterable[str], int, BoilerplateStripper]:
+    """
+    Page texts to generate from, the length of their joined text, and the
+    BoilerplateStripper that removes repeated headers and footers from them.
+
+    A single chunk when chunk_number and total_chunks are given, otherwise
+    every page of the document, extracted lazily as it is consumed. For
+    documents that are not extracted yet the length is an estimate.
+    """
+    stripper = BoilerplateStripper()
+    if chunk_number and total_chunks:
+        # Process chunk
+        pages = document_cache.get_chunk_pages(source, chunk_number, total_chunks, digest)
+        text = join_page_texts(stripper.strip_pages(pages))
+        return [text], len(text), stripper
+    # Process entire file
+    pages = stripper.iter_pages(document_cache.iter_pages(source, digest))
+    return pages, document_cache.estimate_text_length(source, digest), stripper
+
+
+def document_segmenter(total_chars: int) -> Segmenter:
+    """Sentence-aligned overlapping windows over the whole document, capped at MAX_GENERATION_SEGMENTS."""
+    return Segmenter(max_segments=MAX_GENERATION_SEGMENTS, total_chars=total_chars)
+
+
+def expected_segments(total_chars: int) -> int:
+    """How many segments a document of total_chars characters will be generated from."""
+    return min(MAX_GENERATION_SEGMENTS, document_segmenter(total_chars).estimated_windows(total_chars))
+
+
+def build_quiz_prompt(text: str, question_count: int) -> str:
+    return f"""Based on the following text, generate a quiz with {question_count} multiple choice questions. Each question should:
+1. Test understanding of key concepts
+2. Have exactly 4 options labeled A, B, C, and D
+3. Include a clear explanation for the correct answer
+
+Text to use for generating questions:
+{text}
+
+Format the response as a JSON object with a 'quiz' array containing objects with:
+- question: string
+- options: array of 4 strings
+- correct_answer: string (one of the options)
+- explanation: string explaining why the answer is correct"""
+
+
+async def generate_segment_flashcards(segment: Segment) -> Dict[str, List[ResultItem]]:
+    flashcards = await run_with_deadline(
+        flashcard_service.generate_flashcards(segment.text),
+        deadline_after(60)
+    )
+    return {'flashcards': flashcards}
+
+
+async def generate_segment_learning(segment: Segment) -> Dict[str, List[ResultItem]]:
+    learning_content = await run_with_deadline(
+        enhanced_learning_service.generate_learning_content(segment.text),
+        deadline_after(60)
+    )
+    return {'learning_content': learning_content}
+
+
+def segment_question_count(segment: Segment) -> int:
+    # A short document gets all 8 questions, longer ones 5 per segment
+    return 8 if segment.is_whole_document else 5
+
+
+async def generate_segment_quiz(segment: Segment) -> Dict[str, List[ResultItem]]:
+    return await run_with_deadline(
+        copilot_client.generate_chat_completion([
+            {
+                "role": "user",
+                "content": build_quiz_prompt(segment.text, segment_question_count(segment))
+            }
+        ], 'quiz'),
+        deadline_after(120)
+    )
+
+
+async def generate_segment_study_pack(segment: Segment) -> Dict[str, List[ResultItem]]:
+    return await run_with_deadline(
+        study_pack_service.generate_study_pack(segment.text, segment_question_count(segment)),
+        deadline_after(120)
+    )
+
+
+class TaskOutput:
+    """One list of items a generation task produces, and how repeats of its items are recognised."""
+
+    def __init__(self, field: str, dedupe_key: Callable[[ResultItem], str], dedupe_text: Callable[[ResultItem], str],
+                 dedupe_answer: Optional[Callable[[ResultItem], str]] = None):
+        self.field = field
+        self.dedupe_key = dedupe_key
+        self.dedupe_text = dedupe_text
+        self.dedupe_answer = dedupe_answer
+
+    def deduplicator(self) -> Deduplicator:
+        return Deduplicator(self.dedupe_key, self.dedupe_text, answer=self.dedupe_answer)
+
+
+class GenerationTask:
+    """
+    Study material generated per segment of a document.
+
+    Generation maps generate_segment over overlapping, sentence-aligned
+    segments covering the whole document, so items spanning a segment
+    boundary are not missed, then drops items repeated across segments.
+    generate_segment returns a list of items for each of the task's
+    outputs; each output is deduplicated on its own.
+    """
+
+    def __init__(self, name: str, message: str,
+                 generate_segment: Callable[[Segment], Awaitable[Dict[str, List[ResultItem]]]],
+                 outputs: List[TaskOutput]):
+        self.name = name
+        self.message = message
+        self.generate_segment = generate_segment
+        self.outputs = outputs
+
+    @property
+    def fields(self) -> List[str]:
+        return [output.field for output in self.outputs]
+
+    def deduplicators(self) -> Dict[str, Deduplicator]:
+        return {output.field: output.deduplicator() for output in self.outputs}
+
+    def segment_handler(self, deadline: Optional[float]) -> Callable[[Segment], Awaitable[Dict[str, List[ResultItem]]]]:
+        """generate_segment under the request's deadline, whichever task ends up running it."""
+        return lambda segment: run_with_deadline(self.generate_segment(segment), deadline)
+
+    async def _generate(self, pages: Iterable[str], total_chars: int,
+                        deadline: Optional[float]) -> Dict[str, List[ResultItem]]:
+        segment_results = await run_segment_pipeline(pages, document_segmenter(total_chars),
+                                                      self.segment_handler(deadline))
+        return {
+            field: deduplicator.filter(item for result in segment_results for item in result.get(field, []))
+            for field, deduplicator in self.deduplicators().items()
+        }
+
+    async def generate(self, pages: Iterable[str], total_chars: int, digest: Optional[str] = None,
+                       chunk: Optional[Tuple[int, int]] = None,
+                       deadline: Optional[float] = None) -> Dict[str, List[ResultItem]]:
+        """
+        Generate every segment and return the unique items of each output in segment order.
+
+        When the document digest is given, identical requests (same document,
+        task, chunk and cache bypass) already in flight are joined instead of
+        repeated, each still waiting only until its own deadline.
+        deadline (a time.monotonic() instant) bounds every nested LLM call.
+        """
+        if digest is None:
+            return await self._generate(pages, total_chars, deadline)
+        items = await generation_flights.run(
+            # A cache-bypassing request must not be answered from a leader that read the cache
+            (digest, self.name, chunk, bypass_completion_cache.get()),
+            lambda: self._generate(pages, total_chars, deadline),
+            deadline
+        )
+        # Callers sharing a flight must not share mutable lists
+        return {field: list(field_items) for field, field_items in items.items()}
+
+    async def iter_events(self, pages: Iterable[str], total_chars: int, boilerplate: BoilerplateStripper,
+                          deadline: Optional[float] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Generate every segment, yielding results as each segment finishes.
+
+        Yields one 'items' event per segment with the items of each output
+        not already sent, then a 'summary' event with the totals, including
+        the prompt characters saved by stripping boilerplate.
+        """
+        deduplicators = self.deduplicators()
+        counts = {field: 0 for field in deduplicators}
+        segments = 0
+        segment_results = iter_segment_pipeline(pages, document_segmenter(total_chars),
+                                                self.segment_handler(deadline))
+        try:
+            async for segment, result in segment_results:
+                segments += 1
+                event = {'segment': segment.index}
+                for field, deduplicator in deduplicators.items():
+                    event[field] = deduplicator.filter(result.get(field, []))
+                    counts[field] += len(event[field])
+                yield 'items', event
+        finally:
+            await segment_results.aclose()
+        yield 'summary', {
+            'count': sum(counts.values()),
+            'counts': counts,
+            'segments': segments,
+            'duplicates': sum(deduplicator.duplicates for deduplicator in deduplicators.values()),
+            'near_duplicates': sum(deduplicator.near_duplicates for deduplicator in deduplicators.values()),
+            **boilerplate.stats(),
+            'message': self.message
+        }
+
+
+FLASHCARDS_OUTPUT = TaskOutput('flashcards', question_key, question_text, flashcard_answer)
+LEARNING_OUTPUT = TaskOutput('learning_content', concept_key, concept_text)
+QUIZ_OUTPUT = TaskOutput('quiz', question_key, question_text, quiz_answer)
+
+GENERATION_TASKS: Dict[str, GenerationTask] = {
+    'flashcards': GenerationTask(
+        'flashcards', 'Generated flashcards successfully',
+        generate_segment_flashcards, [FLASHCARDS_OUTPUT]
+    ),
+    'learning': GenerationTask(
+        'learning', 'Generated learning content successfully',
+        generate_segment_learning, [LEARNING_OUTPUT]
+    ),
+    'quiz': GenerationTask(
+        'quiz', 'Generated quiz questions successfully',
+        generate_segment_quiz, [QUIZ_OUTPUT]
+    ),
+    # All three from one completion per segment
+    'study_pack': GenerationTask(
+        'study_pack', 'Generated study pack successfully',
+        generate_segment_study_pack, [FLASHCARDS_OUTPUT, QUIZ_OUTPUT, LEARNING_OUTPUT]
+    )
+}
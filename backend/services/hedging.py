@@ -0,0 +1,167 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from dotenv import load_dotenv
+from utils.logger_config import setup_logger
+
+logger = setup_logger('hedging', 'hedging.log')
+
+T = TypeVar('T')
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_WINDOW = 200
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MIN_DELAY = 0.25
+DEFAULT_BUDGET = 0.05
+# Unused budget stops accumulating here, so a quiet hour cannot fund a burst of hedges
+MAX_BUDGET_TOKENS = 10.0
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, '').lower() in ('1', 'true', 'yes')
+
+
+class Hedger:
+    """
+    Hedged upstream calls: when a call runs longer than most recent calls
+    did, a duplicate is started and whichever answers first wins.
+
+    The hedge delay is a percentile of a rolling window of observed
+    latencies, so it follows the provider as it speeds up or slows down;
+    nothing is hedged until enough samples exist. A token bucket caps the
+    extra load: every call deposits `budget` tokens and a hedge spends one,
+    so at most about budget * 100% of calls are duplicated. The loser is
+    cancelled as soon as the winner returns.
+
+    Off unless enabled, since a hedge costs a second upstream call.
+    """
+
+    def __init__(self, name: str, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                 budget: Optional[float] = None, window: int = DEFAULT_WINDOW,
+                 min_samples: int = DEFAULT_MIN_SAMPLES, min_delay: Optional[float] = None):
+        load_dotenv()
+        if enabled is None:
+            enabled = _env_flag('LLM_HEDGING')
+        if percentile is None:
+            percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', DEFAULT_PERCENTILE))
+        if budget is None:
+            budget = float(os.getenv('LLM_HEDGE_BUDGET', DEFAULT_BUDGET))
+        if min_delay is None:
+            min_delay = float(os.getenv('LLM_HEDGE_MIN_DELAY', DEFAULT_MIN_DELAY))
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+        logger.info(f"Initialized {name} Hedger (enabled={enabled}, p{percentile:g}, budget={budget:.0%})")
+
+    def observe(self, seconds: float):
+        """Record the latency of one upstream call."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged, or None while there are too few samples."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        rank = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.min_delay, ordered[rank])
+
+    def _deposit(self):
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(MAX_BUDGET_TOKENS, self._tokens + self.budget)
+
+    def _try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                self.over_budget += 1
+                return False
+            self._tokens -= 1.0
+            self.hedged += 1
+            return True
+
+    async def run(self, call: Callable[[], Awaitable[T]],
+                  can_hedge: Callable[[], bool] = lambda: True) -> T:
+        """
+        Run call(), starting a second call() if the first is slow.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Starts one attempt; must be safe to run twice
+            can_hedge (Callable[[], bool]): Checked when the hedge delay expires; False skips the hedge,
+                e.g. when there is no spare upstream capacity for a duplicate
+
+        Returns:
+            T: The result of whichever attempt succeeded first
+        """
+        if not self.enabled:
+            return await call()
+        self._deposit()
+        delay = self.hedge_delay()
+        if delay is None:
+            return await call()
+
+        primary_started = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        hedge: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if done or not can_hedge() or not self._try_spend():
+                return await primary
+
+            started = time.monotonic()
+            hedge = asyncio.ensure_future(call())
+            logger.info(f"{self.name}: call exceeded {delay:.2f}s, hedging")
+            pending = {primary, hedge}
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is hedge:
+                            with self._lock:
+                                self.hedge_wins += 1
+                            logger.info(f"{self.name}: hedge won after {time.monotonic() - started:.2f}s")
+                        return attempt.result()
+                    if first_error is None or attempt is primary:
+                        first_error = attempt.exception()
+            raise first_error
+        finally:
+            if hedge is not None and not primary.done():
+                # A slow primary that lost never reports its latency; without this
+                # lower bound the window would forget the tail and the delay would sink
+                self.observe(time.monotonic() - primary_started)
+            # The losing attempt gives its scheduler slot back as it unwinds
+            for attempt in (primary, hedge):
+                if attempt is not None and not attempt.done():
+                    attempt.cancel()
+
+    def stats(self) -> Dict:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hedge_delay': None if delay is None else round(delay, 3),
+                'samples': len(self._latencies),
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'over_budget': self.over_budget
+            }
+
+# Structured completions; chat replies have a different latency profile and are not hedged
+completion_hedger = Hedger('completion')
@@ -0,0 +1,277 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from services.completion_cache import bypass_completion_cache
+from services.generation import GenerationTask, expected_segments, iter_document_pages
+from utils.deadline import deadline_after, run_with_deadline
+from utils.event_loop import shared_loop
+from utils.logger_config import setup_logger
+
+logger = setup_logger('job_queue', 'job_queue.log')
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETENTION = 60 * 60  # Finished jobs are kept for an hour
+DEFAULT_MAX_PENDING = 100
+DEFAULT_JOB_TIMEOUT = 600
+SWEEP_INTERVAL = 60
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobQueueFullError(ValueError):
+    """Too many jobs are already waiting or running to accept another."""
+
+
+class Job:
+    """One queued generation request and everything produced for it so far."""
+
+    def __init__(self, job_id: str, task: GenerationTask, source, digest: str,
+                 chunk_number: Optional[int] = None, total_chunks: Optional[int] = None,
+                 document_id: Optional[str] = None, bypass_cache: bool = False):
+        self.job_id = job_id
+        self.task = task
+        self.source = source
+        self.digest = digest
+        self.chunk_number = chunk_number
+        self.total_chunks = total_chunks
+        self.document_id = document_id
+        self.bypass_cache = bypass_cache
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.segments_done = 0
+        self.segments_total: Optional[int] = None
+        self.items: Dict[str, List[Dict]] = {field: [] for field in task.fields}
+        self.summary: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.handle: Optional[asyncio.Future] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def item_count(self) -> int:
+        return sum(len(items) for items in self.items.values())
+
+    def to_dict(self) -> Dict:
+        """Status, progress and the items generated so far, which grow while the job runs."""
+        data = {
+            'job_id': self.job_id,
+            'task': self.task.name,
+            'status': self.status,
+            'document_id': self.document_id,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': {
+                'segments_done': self.segments_done,
+                'segments_total': self.segments_total,
+                'items': self.item_count
+            },
+            'result': {field: list(items) for field, items in self.items.items()}
+        }
+        if self.summary is not None:
+            data['result'].update(self.summary)
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    In-process queue of generation jobs.
+
+    Long generations run in the background instead of holding an HTTP
+    connection (and a worker thread) open: clients enqueue a job, get its ID
+    back at once and poll for progress. A fixed number of worker coroutines
+    on the shared event loop drain the queue, so at most `workers` jobs run
+    at the same time; their LLM calls still go through the shared scheduler.
+    Finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(self, workers: Optional[int] = None, retention: Optional[int] = None,
+                 max_pending: Optional[int] = None, timeout: Optional[float] = None):
+        load_dotenv()
+        if workers is None:
+            workers = int(os.getenv('JOB_WORKERS', DEFAULT_WORKERS))
+        if retention is None:
+            retention = int(os.getenv('JOB_RETENTION', DEFAULT_RETENTION))
+        if max_pending is None:
+            max_pending = int(os.getenv('JOB_MAX_PENDING', DEFAULT_MAX_PENDING))
+        if timeout is None:
+            timeout = float(os.getenv('JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT))
+        self.workers = workers
+        self.retention = retention
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._pid: Optional[int] = None
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        logger.info(f"Initialized JobQueue (workers={self.workers}, retention={self.retention}s)")
+
+    def _start_workers_locked(self):
+        """Start the worker coroutines on first use, and again in a forked child. Caller holds the lock."""
+        if self._queue is not None and self._pid == os.getpid():
+            return
+        self._queue = asyncio.Queue()
+        self._pid = os.getpid()
+        for worker_number in range(self.workers):
+            # A fresh context: workers must not inherit the submitting request's
+            shared_loop.submit(self._worker(worker_number), contextvars.Context())
+        logger.info(f"Started {self.workers} job workers in process {self._pid}")
+
+    def _sweep(self, force: bool = False):
+        """Forget finished jobs past their retention. Caller holds the lock."""
+        now = time.time()
+        if not force and now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.is_finished and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired:
+            logger.info(f"Dropped {len(expired)} finished jobs")
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.is_finished)
+
+    def submit(self, task: GenerationTask, source, digest: str, chunk_number: Optional[int] = None,
+               total_chunks: Optional[int] = None, document_id: Optional[str] = None,
+               bypass_cache: bool = False) -> Job:
+        """
+        Enqueue a generation job.
+
+        Args:
+            task (GenerationTask): What to generate
+            source: Raw PDF bytes
+            digest (str): SHA-256 of the PDF bytes
+            chunk_number (Optional[int]): 1-based chunk to generate from, or None for the whole document
+            total_chunks (Optional[int]): Number of chunks the document is split into
+            document_id (Optional[str]): Document session the PDF belongs to, echoed back in the status
+            bypass_cache (bool): Skip completion cache lookups for this job
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            JobQueueFullError: If too many jobs are already waiting or running
+        """
+        job = Job(uuid.uuid4().hex, task, source, digest, chunk_number, total_chunks, document_id, bypass_cache)
+        with self._lock:
+            self._sweep()
+            pending = sum(1 for other in self._jobs.values() if not other.is_finished)
+            if pending >= self.max_pending:
+                raise JobQueueFullError("Too many generation jobs in progress, please try again later")
+            self._start_workers_locked()
+            self._jobs[job.job_id] = job
+            queue = self._queue
+        shared_loop.loop.call_soon_threadsafe(queue.put_nowait, job)
+        logger.info(f"Queued {task.name} job {job.job_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._sweep()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it does not exist."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.is_finished:
+                return True
+            if job.status == JOB_QUEUED:
+                # Workers skip cancelled jobs when they dequeue them
+                self._finish(job, JOB_CANCELLED)
+                return True
+            handle = job.handle
+        if handle is not None:
+            shared_loop.loop.call_soon_threadsafe(handle.cancel)
+        return True
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        # The PDF is only needed while generating
+        job.source = None
+
+    async def _worker(self, worker_number: int):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            with self._lock:
+                if job.status != JOB_QUEUED:
+                    continue
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                job.handle = asyncio.ensure_future(self._run(job))
+            # wait() rather than await, so cancelling the job does not cancel the worker
+            await asyncio.wait([job.handle])
+
+    async def _run(self, job: Job):
+        bypass_completion_cache.set(job.bypass_cache)
+        logger.info(f"Running {job.task.name} job {job.job_id}")
+        try:
+            pages, total_chars, boilerplate = await asyncio.to_thread(
+                iter_document_pages, job.source, job.digest, job.chunk_number, job.total_chunks
+            )
+            job.segments_total = expected_segments(total_chars)
+
+            # The job's timeout is the deadline of every LLM call made for it
+            deadline = deadline_after(self.timeout)
+
+            async def consume():
+                async for event, data in job.task.iter_events(pages, total_chars, boilerplate, deadline):
+                    if event == 'items':
+                        for field, items in job.items.items():
+                            items.extend(data[field])
+                        job.segments_done += 1
+                    else:
+                        job.summary = data
+
+            await run_with_deadline(consume(), deadline)
+            with self._lock:
+                self._finish(job, JOB_SUCCEEDED)
+            logger.info(f"Job {job.job_id} finished with {job.item_count} items")
+        except asyncio.CancelledError:
+            with self._lock:
+                self._finish(job, JOB_CANCELLED)
+            logger.info(f"Job {job.job_id} cancelled")
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._finish(job, JOB_FAILED, f"Job timed out after {self.timeout:.0f}s")
+            logger.error(f"Job {job.job_id} timed out")
+        except Exception as e:
+            with self._lock:
+                self._finish(job, JOB_FAILED, str(e))
+            logger.error(f"Job {job.job_id} failed: {str(e)}", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts['workers'] = self.workers
+            return counts
+
+# Create a singleton instance
+job_queue = JobQueue()
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+from dotenv import load_dotenv
+from utils.logger_config import setup_logger
+from utils.metrics import LLM_QUEUE, observe_stage, timed
+
+logger = setup_logger('llm_scheduler', 'llm_scheduler.log')
+
+T = TypeVar('T')
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_RATE_LIMIT_RETRIES = 3
+DEFAULT_RETRY_AFTER = 2.0
+
+
+class RateLimitError(Exception):
+    """The upstream provider rejected a call with HTTP 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to Retry-After or X-RateLimit-Reset headers, if present."""
+    for name in ('Retry-After', 'X-RateLimit-Reset'):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        # Some providers send an epoch timestamp for the reset
+        if seconds > 10 ** 9:
+            seconds -= time.time()
+        return max(0.0, seconds)
+    return None
+
+
+class _Waiter:
+    __slots__ = ('priority', 'sequence', 'loop', 'future', 'granted', 'cancelled')
+
+    def __init__(self, priority: int, sequence: int, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.priority = priority
+        self.sequence = sequence
+        self.loop = loop
+        self.future = future
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for upstream LLM calls.
+
+    Calls from any request (and any event loop) share one concurrency budget.
+    Waiting calls are admitted by priority, then FIFO. The budget adapts
+    AIMD-style: each success adds roughly one slot per window of calls, and
+    each 429 halves it and pauses admissions for the provider's Retry-After.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, min_concurrency: int = 1,
+                 rate_limit_retries: Optional[int] = None):
+        load_dotenv()
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+        if rate_limit_retries is None:
+            rate_limit_retries = int(os.getenv('LLM_RATE_LIMIT_RETRIES', DEFAULT_RATE_LIMIT_RETRIES))
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.rate_limit_retries = rate_limit_retries
+        self._limit = float(max_concurrency)
+        self._active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._resume_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rate_limited = 0
+        logger.info(f"Initialized LLMScheduler (max_concurrency={self.max_concurrency})")
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    def _dispatch_locked(self):
+        """Admit as many waiters as the current budget allows. Caller holds the lock."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            self._schedule_resume_locked(self._paused_until - now)
+            return
+        while self._waiters and self._active < self.limit:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            try:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                # The waiting request's event loop is already closed
+                continue
+            waiter.granted = True
+            self._active += 1
+
+    def _schedule_resume_locked(self, delay: float):
+        if self._resume_timer is not None and self._resume_timer.is_alive():
+            return
+        self._resume_timer = threading.Timer(delay, self._resume)
+        self._resume_timer.daemon = True
+        self._resume_timer.start()
+
+    def _resume(self):
+        with self._lock:
+            self._resume_timer = None
+            self._dispatch_locked()
+
+    async def acquire(self, priority: int = PRIORITY_BULK):
+        """Wait for a slot. Must be paired with release()."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._active < self.limit and time.monotonic() >= self._paused_until:
+                self._active += 1
+                observe_stage(LLM_QUEUE, 0.0)
+                return
+            waiter = _Waiter(priority, next(self._sequence), loop, loop.create_future())
+            heapq.heappush(self._waiters, waiter)
+            self._dispatch_locked()
+
+        try:
+            with timed(LLM_QUEUE):
+                await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Admitted just as we gave up: hand the slot to someone else
+                    self._active -= 1
+                    self._dispatch_locked()
+                else:
+                    waiter.cancelled = True
+            raise
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._dispatch_locked()
+
+    def on_success(self):
+        with self._lock:
+            self.completed += 1
+            # Additive increase: about one extra slot per `limit` successful calls
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(1.0, self._limit))
+            self._dispatch_locked()
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        with self._lock:
+            self.rate_limited += 1
+            # Multiplicative decrease
+            self._limit = max(float(self.min_concurrency), self._limit / 2)
+            delay = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning(f"Upstream rate limited, concurrency now {self.limit}, pausing {delay:.1f}s")
+
+    def observe_headers(self, headers: Mapping[str, str]):
+        """Back off before hitting the limit when the provider says the quota is exhausted."""
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is None:
+            return
+        try:
+            exhausted = int(float(remaining)) <= 0
+        except ValueError:
+            return
+        if exhausted:
+            retry_after = parse_retry_after(headers)
+            with self._lock:
+                self._limit = max(float(self.min_concurrency), self._limit / 2)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    async def run(self, call: Callable[[], Awaitable[T]], priority: int = PRIORITY_BULK) -> T:
+        """
+        Run an upstream call under the shared concurrency budget.
+
+        Args:
+            call (Callable[[], Awaitable[T]]): Starts the upstream call; may be invoked again after a 429
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BULK
+
+        Returns:
+            T: Whatever the call returns
+        """
+        attempt = 0
+        while True:
+            await self.acquire(priority)
+            try:
+                result = await call()
+            except RateLimitError as e:
+                self.on_rate_limited(e.retry_after)
+                if attempt >= self.rate_limit_retries:
+                    raise
+                attempt += 1
+                continue
+            finally:
+                self.release()
+            self.on_success()
+            return result
+
+    def has_spare_capacity(self) -> bool:
+        """True when a call would be admitted right now, without queueing."""
+        with self._lock:
+            return (self._active < self.limit and time.monotonic() >= self._paused_until
+                    and not any(not waiter.cancelled for waiter in self._waiters))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'active': self._active,
+                'waiting': sum(1 for waiter in self._waiters if not waiter.cancelled),
+                'completed': self.completed,
+                'rate_limited': self.rate_limited
+            }
+
+# Create a singleton instance
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,95 @@
+import io
+import threading
+from typing import List, Optional, Tuple, Union
+from PyPDF2 import PdfReader
+from utils.logger_config import setup_logger
+from utils.metrics import EXTRACT, PDF_PARSE, timed
+
+logger = setup_logger('page_index', 'page_index.log')
+
+
+def page_range_for_chunk(total_pages: int, chunk_number: int, total_chunks: int) -> Tuple[int, int]:
+    """
+    Map a 1-based chunk number onto a half-open page range.
+
+    Args:
+        total_pages (int): Number of pages in the document
+        chunk_number (int): 1-based chunk requested by the client
+        total_chunks (int): Number of chunks the client split the document into
+
+    Returns:
+        Tuple[int, int]: (start_page, end_page) with end_page exclusive
+    """
+    pages_per_chunk = max(1, total_pages // total_chunks)
+    start_page = (chunk_number - 1) * pages_per_chunk
+    end_page = min(start_page + pages_per_chunk, total_pages)
+    return start_page, end_page
+
+
+def join_page_texts(pages: List[str]) -> str:
+    """Join page texts the way the extraction endpoints always have."""
+    return "\n".join(page for page in pages if page).strip()
+
+
+class PageIndex:
+    """
+    Parsed page tree of a single PDF with lazily extracted page text.
+
+    The xref table and page tree are parsed once when the index is built.
+    Page text is extracted on first access and memoized, so serving chunk N
+    only costs the pages inside chunk N.
+    """
+
+    def __init__(self, source: Union[bytes, str], digest: str):
+        # Keep the bytes rather than the path: uploads are deleted after each request
+        if isinstance(source, (bytes, bytearray)):
+            data = bytes(source)
+        else:
+            with open(source, 'rb') as file:
+                data = file.read()
+
+        self.digest = digest
+        self.data = data
+        self.file_size = len(data)
+        with timed(PDF_PARSE):
+            self._reader = PdfReader(io.BytesIO(data))
+            self.page_count = len(self._reader.pages)
+        self._texts: List[Optional[str]] = [None] * self.page_count
+        self._extracted = 0
+        self._lock = threading.Lock()
+        logger.info(f"Built page index for {digest[:12]} with {self.page_count} pages")
+
+    @property
+    def extracted_count(self) -> int:
+        return self._extracted
+
+    @property
+    def is_complete(self) -> bool:
+        return self._extracted == self.page_count
+
+    def fill_pages(self, texts: List[str]):
+        """Record page texts extracted elsewhere (e.g. by the process pool) for pages not yet read."""
+        with self._lock:
+            for page_num, text in enumerate(texts):
+                if self._texts[page_num] is None:
+                    self._texts[page_num] = text
+                    self._extracted += 1
+
+    def page_text(self, page_num: int) -> str:
+        """Return the text of a single 0-based page, extracting it on first use."""
+        with self._lock:
+            text = self._texts[page_num]
+            if text is None:
+                with timed(EXTRACT):
+                    text = self._reader.pages[page_num].extract_text() or ""
+                self._texts[page_num] = text
+                self._extracted += 1
+            return text
+
+    def pages_text(self, start_page: int, end_page: int) -> List[str]:
+        """Return the text of pages in [start_page, end_page)."""
+        return [self.page_text(page_num) for page_num in range(start_page, end_page)]
+
+    def all_pages(self) -> List[str]:
+        """Extract any remaining pages and return the text of every page."""
+        return self.pages_text(0, self.page_count)
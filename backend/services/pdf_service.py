@@ -1,22 +1,163 @@
+import io
 import os
 import logging
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+from services.boilerplate import BoilerplateStripper
 from utils.logger_config import setup_logger
+from utils.metrics import EXTRACT, timed
 
 # Configure logging
 logger = setup_logger('pdf_service', 'pdf_service.log')
 
+DEFAULT_PARALLEL_THRESHOLD_PAGES = 40
+
+
+def _open_reader(source: Union[bytes, str]):
+    """Return (reader, stream) for raw PDF bytes or a file path."""
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+    return PdfReader(stream), stream
+
+
+def _iter_page_range(reader: PdfReader, start_page: int, end_page: int) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """Yield a (text, error) pair per page so callers can decide whether a failing page is fatal."""
+    for page_num in range(start_page, end_page):
+        try:
+            yield reader.pages[page_num].extract_text() or "", None
+        except Exception as e:
+            yield None, str(e)
+
+
+def _extract_page_range(source: Union[bytes, str], start_page: int, end_page: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Extract pages [start_page, end_page) in a worker process.
+
+    Must stay at module level to be picklable.
+    """
+    reader, stream = _open_reader(source)
+    try:
+        return list(_iter_page_range(reader, start_page, end_page))
+    finally:
+        stream.close()
+
+
 class PDFService:
     def __init__(self):
-        logger.info("Initialized PDFService")
+        load_dotenv()
+        self.max_workers = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+        self.parallel_threshold = int(os.getenv('PDF_PARALLEL_THRESHOLD_PAGES', DEFAULT_PARALLEL_THRESHOLD_PAGES))
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        logger.info(f"Initialized PDFService (workers={self.max_workers}, parallel_threshold={self.parallel_threshold} pages)")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Create the worker pool on first use, and again after a fork."""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # spawn avoids forking a multi-threaded server process
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def should_parallelize(self, page_count: int) -> bool:
+        return self.max_workers > 1 and page_count >= self.parallel_threshold
+
+    def iter_page_results(self, source: Union[bytes, str], page_count: Optional[int] = None) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+        """
+        Yield (text, error) for every page in page order, as soon as it is extracted.
+
+        Large PDFs are split into page ranges across the process pool; each
+        range is yielded as soon as it and every range before it is done.
+        Workers are sent a file path and a page range, never the PDF itself:
+        raw bytes are written to a temporary file once and read from the page
+        cache by each worker, instead of being pickled once per range.
+
+        Args:
+            source (Union[bytes, str]): Raw PDF bytes or a path to the PDF file
+            page_count (Optional[int]): Page count if the caller already knows it
+        """
+        reader, stream = _open_reader(source)
+        try:
+            if page_count is None:
+                page_count = len(reader.pages)
+            if not self.should_parallelize(page_count):
+                yield from _iter_page_range(reader, 0, page_count)
+                return
+        finally:
+            stream.close()
+
+        # A few ranges per worker keeps the pool busy when some pages are much slower
+        range_count = min(page_count, self.max_workers * 2)
+        step = -(-page_count // range_count)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        logger.info(f"Extracting {page_count} pages in {len(ranges)} ranges across {self.max_workers} processes")
+
+        spill_path = None
+        if isinstance(source, (bytes, bytearray)):
+            fd, spill_path = tempfile.mkstemp(prefix='pdf-extract-', suffix='.pdf')
+            with os.fdopen(fd, 'wb') as spill:
+                spill.write(source)
+        path = spill_path or source
+
+        pool = self._get_pool()
+        futures = [pool.submit(_extract_page_range, path, start, end) for start, end in ranges]
+        try:
+            for future in futures:
+                with timed(EXTRACT):
+                    results = future.result()
+                yield from results
+        finally:
+            # The consumer may stop early once it has enough text
+            for future in futures:
+                future.cancel()
+            if spill_path is not None:
+                # A cancelled range already running may fail to open it; nobody reads its result
+                os.remove(spill_path)
+
+    def extract_page_results(self, source: Union[bytes, str], page_count: Optional[int] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Extract every page, returning (text, error) per page in page order."""
+        return list(self.iter_page_results(source, page_count))
 
-    def extract_text(self, filepath: str) -> str:
+    def iter_pages(self, source: Union[bytes, str], page_count: Optional[int] = None) -> Iterator[str]:
+        """
+        Yield the raw text of every page, in page order, as pages are extracted.
+
+        Produces exactly the same output whether or not the process pool is used.
+
+        Raises:
+            ValueError: If any page fails to extract
+        """
+        for page_num, (text, error) in enumerate(self.iter_page_results(source, page_count), 1):
+            if error is not None:
+                raise ValueError(f"Error extracting text from page {page_num}: {error}")
+            yield text
+
+    def extract_pages(self, source: Union[bytes, str], page_count: Optional[int] = None) -> List[str]:
+        """Extract the raw text of every page, in page order."""
+        return list(self.iter_pages(source, page_count))
+
+    def extract_text(self, filepath: str, strip_boilerplate: bool = True) -> str:
         """
         Extract text from a PDF file.
         
         Args:
             filepath (str): Path to the PDF file
+            strip_boilerplate (bool): Drop running headers, footers and page numbers repeated across pages
             
         Returns:
             str: Extracted text from the PDF
@@ -31,42 +172,42 @@ class PDFService:
             if not os.path.exists(filepath):
                 raise FileNotFoundError(f"PDF file not found: {filepath}")
             
-            # Open and read the PDF
-            with open(filepath, 'rb') as file:
-                reader = PdfReader(file)
-                total_pages = len(reader.pages)
-                logger.info(f"PDF has {total_pages} pages")
-                
-                # Extract text from each page
-                text = ""
-                for page_num, page in enumerate(reader.pages, 1):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            # Clean up the text
-                            page_text = page_text.strip()
-                            # Remove excessive whitespace
-                            page_text = ' '.join(page_text.split())
-                            text += f"\n--- Page {page_num} ---\n{page_text}\n"
-                        else:
-                            logger.warning(f"No text could be extracted from page {page_num}")
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num}: {str(e)}")
-                        continue
-                
-                if not text.strip():
-                    logger.error("No text could be extracted from the PDF")
-                    raise ValueError("No text could be extracted from the PDF")
-                
-                # Clean up the final text
-                text = text.strip()
-                # Remove excessive newlines
-                text = '\n'.join(line for line in text.splitlines() if line.strip())
-                
-                logger.info(f"Successfully extracted {len(text)} characters from PDF")
-                logger.debug(f"First 500 characters of extracted text: {text[:500]}")
-                return text
+            page_results = self.extract_page_results(filepath)
+            logger.info(f"PDF has {len(page_results)} pages")
+
+            if strip_boilerplate:
+                stripper = BoilerplateStripper()
+                stripped_pages = stripper.strip_pages([page_text or "" for page_text, _ in page_results])
+                page_results = [(page_text, error) for page_text, (_, error) in zip(stripped_pages, page_results)]
+
+            # Extract text from each page
+            text = ""
+            for page_num, (page_text, error) in enumerate(page_results, 1):
+                if error is not None:
+                    logger.warning(f"Error extracting text from page {page_num}: {error}")
+                    continue
+                if page_text:
+                    # Clean up the text
+                    page_text = page_text.strip()
+                    # Remove excessive whitespace
+                    page_text = ' '.join(page_text.split())
+                    text += f"\n--- Page {page_num} ---\n{page_text}\n"
+                else:
+                    logger.warning(f"No text could be extracted from page {page_num}")
+
+            if not text.strip():
+                logger.error("No text could be extracted from the PDF")
+                raise ValueError("No text could be extracted from the PDF")
             
+            # Clean up the final text
+            text = text.strip()
+            # Remove excessive newlines
+            text = '\n'.join(line for line in text.splitlines() if line.strip())
+            
+            logger.info(f"Successfully extracted {len(text)} characters from PDF")
+            logger.debug("First 500 characters of extracted text: %s", text[:500])
+            return text
+
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}", exc_info=True)
             raise
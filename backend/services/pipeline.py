@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from services.segmenter import Segment, Segmenter
+from utils.logger_config import setup_logger
+
+logger = setup_logger('pipeline', 'pipeline.log')
+
+T = TypeVar('T')
+
+_DONE = object()
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def iter_segment_pipeline(pages: Iterable[str], segmenter: Segmenter,
+                                handler: Callable[[Segment], Awaitable[T]]) -> AsyncIterator[Tuple[Segment, T]]:
+    """
+    Overlap PDF extraction with generation, yielding results as they finish.
+
+    Pages are pulled from the (blocking) page iterator in a worker thread and
+    packed into segments; handler(segment) is started as soon as each segment
+    is ready, so the first LLM call is in flight while later pages are still
+    being parsed. Closing the iterator early cancels outstanding handlers.
+
+    Args:
+        pages (Iterable[str]): Page texts, typically a lazy extraction generator
+        segmenter (Segmenter): Packs pages into prompt-sized segments
+        handler (Callable[[Segment], Awaitable[T]]): Coroutine run per segment
+
+    Yields:
+        Tuple[Segment, T]: Each segment with its handler result, in completion order
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = False
+
+    def produce():
+        try:
+            for segment in segmenter.iter_segments(pages):
+                if cancelled:
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, segment)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, _ProducerError(e))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    # Extraction and segmenting timings belong to the request that started them
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    running: Dict[asyncio.Future, Segment] = {}
+    next_segment: Optional[asyncio.Future] = asyncio.ensure_future(queue.get())
+    try:
+        while next_segment is not None or running:
+            waiting = set(running)
+            if next_segment is not None:
+                waiting.add(next_segment)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_segment in done:
+                item = next_segment.result()
+                next_segment = None
+                if isinstance(item, _ProducerError):
+                    raise item.error
+                if item is _DONE:
+                    await producer
+                else:
+                    logger.info(f"Segment {item.index} ready ({len(item.text)} chars), starting generation")
+                    running[asyncio.ensure_future(handler(item))] = item
+                    next_segment = asyncio.ensure_future(queue.get())
+
+            finished = sorted((task for task in done if task in running), key=lambda task: running[task].index)
+            for task in finished:
+                segment = running.pop(task)
+                yield segment, task.result()
+    finally:
+        cancelled = True
+        if next_segment is not None:
+            next_segment.cancel()
+        for task in running:
+            task.cancel()
+
+
+async def run_segment_pipeline(pages: Iterable[str], segmenter: Segmenter,
+                               handler: Callable[[Segment], Awaitable[T]]) -> List[T]:
+    """
+    Run handler over every segment of the document and collect the results.
+
+    Args:
+        pages (Iterable[str]): Page texts, typically a lazy extraction generator
+        segmenter (Segmenter): Packs pages into prompt-sized segments
+        handler (Callable[[Segment], Awaitable[T]]): Coroutine run per segment
+
+    Returns:
+        List[T]: Handler results in segment order
+    """
+    results = {}
+    async for segment, result in iter_segment_pipeline(pages, segmenter, handler):
+        results[segment.index] = result
+    return [results[index] for index in sorted(results)]
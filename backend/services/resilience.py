@@ -0,0 +1,223 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import aiohttp
+from dotenv import load_dotenv
+from utils.deadline import DeadlineExceeded, remaining
+from utils.logger_config import setup_logger
+from utils.metrics import RETRY_BACKOFF, UPSTREAM_RETRIES, timed
+
+logger = setup_logger('resilience', 'resilience.log')
+
+T = TypeVar('T')
+
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BASE = 0.5
+DEFAULT_RETRY_MAX = 8.0
+# A retry that cannot get at least this long before the deadline is not worth starting
+DEFAULT_MIN_ATTEMPT_SECONDS = 5.0
+
+DEFAULT_BREAKER_WINDOW = 30.0
+DEFAULT_BREAKER_MIN_CALLS = 10
+DEFAULT_BREAKER_FAILURE_RATE = 0.5
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class UpstreamError(Exception):
+    """Cohere answered with a non-200 status other than 429."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"API request failed with status {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class CircuitOpenError(Exception):
+    """Upstream calls are being refused because too many recent ones failed."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """Worth retrying, and a sign of upstream trouble: 5xx answers, dropped connections, timed-out calls."""
+    if isinstance(error, UpstreamError):
+        return error.status >= 500
+    if isinstance(error, DeadlineExceeded):
+        return False
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class RetryPolicy:
+    """
+    Retries transient upstream failures with exponential backoff and full jitter.
+
+    A retry only happens when the current deadline leaves room for the
+    backoff plus a useful attempt, so retries never push a request past its
+    budget. Rate limits are not retried here: the LLM scheduler handles 429s.
+    """
+
+    def __init__(self, retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, min_attempt_seconds: Optional[float] = None):
+        load_dotenv()
+        if retries is None:
+            retries = int(os.getenv('LLM_RETRIES', DEFAULT_RETRIES))
+        if base_delay is None:
+            base_delay = float(os.getenv('LLM_RETRY_BASE', DEFAULT_RETRY_BASE))
+        if max_delay is None:
+            max_delay = float(os.getenv('LLM_RETRY_MAX', DEFAULT_RETRY_MAX))
+        if min_attempt_seconds is None:
+            min_attempt_seconds = float(os.getenv('LLM_MIN_ATTEMPT_SECONDS', DEFAULT_MIN_ATTEMPT_SECONDS))
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_seconds = min_attempt_seconds
+        self.retried = 0
+        self.gave_up = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: anywhere between zero and the exponential cap."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.retries:
+                    raise
+                delay = self.backoff(attempt)
+                left = remaining()
+                if left is not None and left < delay + self.min_attempt_seconds:
+                    self.gave_up += 1
+                    logger.warning(f"Not retrying {type(e).__name__}: only {left:.1f}s left before the deadline")
+                    raise
+                attempt += 1
+                self.retried += 1
+                UPSTREAM_RETRIES.inc()
+                logger.warning(f"Retrying upstream call in {delay:.2f}s (attempt {attempt + 1}): {str(e)}")
+                with timed(RETRY_BACKOFF):
+                    await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        return {'retried': self.retried, 'gave_up': self.gave_up}
+
+
+class CircuitBreaker:
+    """
+    Fails upstream calls fast while the upstream is failing.
+
+    Outcomes of the calls in the last `window` seconds are kept; once at
+    least `min_calls` of them exist and `failure_rate` of them failed, the
+    breaker opens and every call is refused at once for `cooldown` seconds,
+    instead of each worker waiting out its own timeouts against a degraded
+    provider. Then one trial call is let through (half open): success
+    closes the breaker, failure opens it for another cooldown.
+    """
+
+    def __init__(self, name: str, window: Optional[float] = None, min_calls: Optional[int] = None,
+                 failure_rate: Optional[float] = None, cooldown: Optional[float] = None):
+        load_dotenv()
+        if window is None:
+            window = float(os.getenv('LLM_BREAKER_WINDOW', DEFAULT_BREAKER_WINDOW))
+        if min_calls is None:
+            min_calls = int(os.getenv('LLM_BREAKER_MIN_CALLS', DEFAULT_BREAKER_MIN_CALLS))
+        if failure_rate is None:
+            failure_rate = float(os.getenv('LLM_BREAKER_FAILURE_RATE', DEFAULT_BREAKER_FAILURE_RATE))
+        if cooldown is None:
+            cooldown = float(os.getenv('LLM_BREAKER_COOLDOWN', DEFAULT_BREAKER_COOLDOWN))
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = BREAKER_CLOSED
+        self._outcomes = deque()  # (time.monotonic(), failed)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def _trim_locked(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def before_call(self):
+        """
+        Admit one call, or refuse it.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half open with the trial call already running
+        """
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return
+            now = time.monotonic()
+            retry_after = self._opened_at + self.cooldown - now
+            if self.state == BREAKER_OPEN and retry_after <= 0:
+                self.state = BREAKER_HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == BREAKER_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                logger.info(f"{self.name} circuit half open, letting a trial call through")
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} is failing, not calling it for now", max(1.0, retry_after))
+
+    def record(self, failed: bool):
+        """Record the outcome of an admitted call."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == BREAKER_HALF_OPEN:
+                self._trial_in_flight = False
+                if failed:
+                    self._open_locked(now, "trial call failed")
+                else:
+                    self.state = BREAKER_CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"{self.name} circuit closed")
+                return
+            self._outcomes.append((now, failed))
+            self._trim_locked(now)
+            if self.state == BREAKER_CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, outcome in self._outcomes if outcome)
+                if failures >= self.failure_rate * len(self._outcomes):
+                    self._open_locked(now, f"{failures} of the last {len(self._outcomes)} calls failed")
+
+    def cancelled(self):
+        """An admitted call ended without an outcome (e.g. the client went away)."""
+        with self._lock:
+            if self.state == BREAKER_HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open_locked(self, now: float, reason: str):
+        self.state = BREAKER_OPEN
+        self._opened_at = now
+        self.opened += 1
+        logger.error(f"{self.name} circuit open for {self.cooldown:.0f}s: {reason}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._trim_locked(time.monotonic())
+            return {
+                'state': self.state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': sum(1 for _, failed in self._outcomes if failed),
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+
+# Shared by every call to Cohere in the process
+upstream_retry = RetryPolicy()
+upstream_breaker = CircuitBreaker('Cohere')
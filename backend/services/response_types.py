@@ -0,0 +1,190 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from utils import fast_json
+
+QUIZ_OPTION_COUNT = 4
+
+FLASHCARD_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "answer": {"type": "string"}
+    },
+    "required": ["question", "answer"]
+}
+
+QUIZ_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
+        "correct_answer": {"type": "string"},
+        "explanation": {"type": "string"}
+    },
+    "required": ["question", "options", "correct_answer", "explanation"]
+}
+
+CONCEPT_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "concept": {"type": "string"},
+        "definition": {"type": "string"},
+        "real_world_application": {"type": "string"},
+        "latest_insight": {"type": "string"}
+    },
+    "required": ["concept", "definition", "real_world_application", "latest_insight"]
+}
+
+
+class ResultItem:
+    """Base of the generated item models: compact, with a fixed set of fields."""
+
+    __slots__ = ()
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass
+class Flashcard(ResultItem):
+    __slots__ = ('question', 'answer')
+    question: str
+    answer: str
+
+
+@dataclass
+class QuizQuestion(ResultItem):
+    __slots__ = ('question', 'options', 'correct_answer', 'explanation')
+    question: str
+    options: List[str]
+    correct_answer: str
+    explanation: str
+
+
+@dataclass
+class Concept(ResultItem):
+    __slots__ = ('concept', 'definition', 'real_world_application', 'latest_insight')
+    concept: str
+    definition: str
+    real_world_application: str
+    latest_insight: str
+
+
+def _is_string(value) -> bool:
+    return isinstance(value, str) and value.strip() != ''
+
+
+def _is_string_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(element, str) for element in value)
+
+
+_TYPE_CHECKS = {
+    'string': _is_string,
+    'array': _is_string_list
+}
+
+
+def compile_item_parser(model: Type[ResultItem], item_schema: Dict,
+                        check: Optional[Callable[[ResultItem], bool]] = None
+                        ) -> Callable[[object], Optional[ResultItem]]:
+    """
+    Turn an item schema into a function building a model from one raw item, or None if it is invalid.
+
+    The schema is walked once here rather than for every item: the parser
+    only runs the precomputed (field, type check) pairs.
+    """
+    properties = item_schema['properties']
+    fields: Tuple[Tuple[str, Callable], ...] = tuple(
+        (name, _TYPE_CHECKS[properties[name]['type']]) for name in item_schema['required']
+    )
+
+    def parse(raw) -> Optional[ResultItem]:
+        if not isinstance(raw, dict):
+            return None
+        for name, is_valid in fields:
+            if not is_valid(raw.get(name)):
+                return None
+        item = model(*(raw[name] for name, _ in fields))
+        if check is not None and not check(item):
+            return None
+        return item
+
+    return parse
+
+
+class ResponseType:
+    """
+    One structured completion format: the schema sent upstream, and how to read the answer back.
+
+    fields maps each top-level array in the response to the name callers
+    know it by and the parser for its items.
+    """
+
+    __slots__ = ('name', 'schema', 'fields')
+
+    def __init__(self, name: str, items: Dict[str, Tuple[str, Type[ResultItem], Dict]],
+                 checks: Optional[Dict[str, Callable[[ResultItem], bool]]] = None):
+        checks = checks or {}
+        self.name = name
+        self.schema = {
+            "type": "object",
+            "properties": {key: {"type": "array", "items": item_schema}
+                           for key, (_, _, item_schema) in items.items()},
+            "required": list(items)
+        }
+        self.fields = {
+            key: (field, compile_item_parser(model, item_schema, checks.get(key)))
+            for key, (field, model, item_schema) in items.items()
+        }
+
+    def parse(self, text: str) -> Dict[str, List[ResultItem]]:
+        """
+        Parse and validate the model's JSON answer in one pass.
+
+        Returns:
+            Dict[str, List[ResultItem]]: The valid items of each field; invalid ones are dropped
+
+        Raises:
+            ValueError: If text is not a JSON object
+        """
+        data = fast_json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("Structured completion is not a JSON object")
+        result = {}
+        for key, (field, parse_item) in self.fields.items():
+            raw_items = data.get(key)
+            parsed = (parse_item(raw) for raw in raw_items) if isinstance(raw_items, list) else ()
+            result[field] = [item for item in parsed if item is not None]
+        return result
+
+
+def _has_all_options(question: QuizQuestion) -> bool:
+    return len(question.options) == QUIZ_OPTION_COUNT
+
+
+_FLASHCARDS = ('flashcards', Flashcard, FLASHCARD_ITEM_SCHEMA)
+_QUIZ = ('quiz', QuizQuestion, QUIZ_ITEM_SCHEMA)
+_CONCEPTS = ('learning_content', Concept, CONCEPT_ITEM_SCHEMA)
+_QUIZ_CHECKS = {'quiz': _has_all_options}
+
+RESPONSE_TYPES: Dict[str, ResponseType] = {
+    'flashcards': ResponseType('flashcards', {'flashcards': _FLASHCARDS}),
+    'quiz': ResponseType('quiz', {'quiz': _QUIZ}, _QUIZ_CHECKS),
+    'concepts': ResponseType('concepts', {'concepts': _CONCEPTS}),
+    # Flashcards, quiz questions and concepts from one completion
+    'study_pack': ResponseType(
+        'study_pack',
+        {'flashcards': _FLASHCARDS, 'quiz': _QUIZ, 'concepts': _CONCEPTS},
+        _QUIZ_CHECKS
+    )
+}
+
+
+def get_response_type(name: str) -> ResponseType:
+    try:
+        return RESPONSE_TYPES[name]
+    except KeyError:
+        raise ValueError(f"Unknown response type '{name}', expected one of: {', '.join(RESPONSE_TYPES)}")
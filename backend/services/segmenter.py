@@ -0,0 +1,149 @@
+import math
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from utils.metrics import SEGMENT, timed
+
+try:
+    from nltk.tokenize.punkt import PunktParameters, PunktSentenceTokenizer
+except ImportError:  # nltk is in requirements.txt, but segmenting should not depend on it
+    PunktSentenceTokenizer = None
+
+load_dotenv()
+
+SEGMENT_CHARS = 5000
+SEGMENT_OVERLAP = 1000
+MAX_GENERATION_SEGMENTS = int(os.getenv('MAX_GENERATION_SEGMENTS', 8))
+
+# Common abbreviations in course material that should not end a sentence
+ABBREVIATIONS = {'dr', 'mr', 'mrs', 'ms', 'prof', 'e.g', 'i.e', 'etc', 'vs', 'fig', 'eq', 'no', 'vol', 'u.s', 'approx'}
+
+_FALLBACK_SENTENCE = re.compile(r'\S.*?(?:[.!?]["\')\]]*(?=\s)|$)', re.S)
+
+
+def _build_tokenizer():
+    if PunktSentenceTokenizer is None:
+        return None
+    # The untrained Punkt model works offline, so no punkt data download is needed
+    parameters = PunktParameters()
+    parameters.abbrev_types = set(ABBREVIATIONS)
+    return PunktSentenceTokenizer(parameters)
+
+
+_tokenizer = _build_tokenizer()
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """Return (start, end) character spans of the sentences in text."""
+    if _tokenizer is not None:
+        return list(_tokenizer.span_tokenize(text))
+    return [match.span() for match in _FALLBACK_SENTENCE.finditer(text)]
+
+
+class Segment:
+    """A prompt-sized window of document text."""
+
+    def __init__(self, index: int, text: str, is_last: bool, window: int = None):
+        self.index = index
+        self.text = text
+        self.is_last = is_last
+        # Position among all windows of the document, before any sampling
+        self.window = index if window is None else window
+
+    @property
+    def is_whole_document(self) -> bool:
+        """True when the document fit into a single segment."""
+        return self.window == 0 and self.is_last
+
+
+class Segmenter:
+    """
+    Packs page text into overlapping, sentence-aligned segments as pages arrive.
+
+    Each window holds at most max_chars characters and ends on a sentence
+    boundary when one exists in its second half. The next window starts at
+    the first sentence boundary inside the last `overlap` characters, so ideas
+    that straddle a cut are seen whole by at least one window.
+
+    When max_segments caps the number of windows and the document length is
+    known (total_chars), windows are sampled evenly across the whole document
+    instead of only covering its beginning.
+    """
+
+    def __init__(self, max_chars: int = SEGMENT_CHARS, overlap: int = SEGMENT_OVERLAP,
+                 max_segments: Optional[int] = None, total_chars: Optional[int] = None):
+        if overlap >= max_chars:
+            raise ValueError("Segment overlap must be smaller than the segment size")
+        self.max_chars = max_chars
+        self.overlap = overlap
+        self.max_segments = max_segments
+        self.total_chars = total_chars
+        self.min_cut = max(max_chars // 2, overlap + 1)
+
+    def estimated_windows(self, total_chars: int) -> int:
+        """Approximate number of windows needed to cover total_chars characters."""
+        if total_chars <= self.max_chars:
+            return 1
+        return 1 + math.ceil((total_chars - self.max_chars) / (self.max_chars - self.overlap))
+
+    def _selected_windows(self) -> Optional[Set[int]]:
+        """Window numbers to emit when the document needs more windows than allowed."""
+        if self.max_segments is None or self.total_chars is None:
+            return None
+        window_count = self.estimated_windows(self.total_chars)
+        if window_count <= self.max_segments:
+            return None
+        if self.max_segments == 1:
+            return {0}
+        step = (window_count - 1) / (self.max_segments - 1)
+        return {round(k * step) for k in range(self.max_segments)}
+
+    def _cut(self, buffer: str) -> Tuple[int, int]:
+        """Return (end of this window, start of the next one) within buffer."""
+        spans = sentence_spans(buffer[:self.max_chars])
+        # The last span may be a sentence cut off by the window edge
+        complete_ends = [end for _, end in spans[:-1] if end >= self.min_cut]
+        end = complete_ends[-1] if complete_ends else self.max_chars
+
+        overlap_start = end - self.overlap
+        next_start = next((start for start, _ in spans if overlap_start <= start < end), overlap_start)
+        return end, next_start
+
+    def iter_segments(self, pages: Iterable[str]) -> Iterator[Segment]:
+        """
+        Yield segments from an iterable of page texts.
+
+        Args:
+            pages (Iterable[str]): Page texts in order; empty pages are skipped
+
+        Yields:
+            Segment: Windows of at most max_chars characters
+        """
+        selected = self._selected_windows()
+        buffer = ""
+        window = 0
+        emitted = 0
+        carried = 0  # Characters at the start of buffer that were already sent
+
+        for page in pages:
+            if not page:
+                continue
+            buffer = f"{buffer}\n{page}" if buffer else page.lstrip()
+
+            # Only cut a window once real text follows it
+            while len(buffer) > self.max_chars and len(buffer.rstrip()) > self.max_chars:
+                with timed(SEGMENT):
+                    end, next_start = self._cut(buffer)
+                if selected is None or window in selected:
+                    yield Segment(emitted, buffer[:end].rstrip(), False, window)
+                    emitted += 1
+                    if self.max_segments is not None and emitted >= self.max_segments:
+                        return
+                window += 1
+                buffer = buffer[next_start:]
+                carried = end - next_start
+
+        tail = buffer.rstrip()
+        if tail and (window == 0 or len(tail) > carried) and (selected is None or emitted < len(selected)):
+            yield Segment(emitted, tail, True, window)
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+from utils.deadline import DeadlineExceeded, current_deadline, run_with_deadline
+from utils.logger_config import setup_logger
+
+logger = setup_logger('single_flight', 'single_flight.log')
+
+T = TypeVar('T')
+
+
+class _Flight:
+    __slots__ = ('task', 'parent', 'waiters', 'followers', 'upstream_calls')
+
+    def __init__(self, parent: Optional['_Flight']):
+        self.task: Optional[asyncio.Task] = None
+        self.parent = parent
+        self.waiters = 0
+        self.followers = 0
+        self.upstream_calls = 0
+
+
+# The flight whose leader is running the current code, so upstream calls can be attributed to it
+_current_flight: contextvars.ContextVar[Optional[_Flight]] = contextvars.ContextVar('current_flight', default=None)
+
+
+def record_upstream_call():
+    """Count one real upstream LLM call against every flight the current code runs under."""
+    flight = _current_flight.get()
+    while flight is not None:
+        flight.upstream_calls += 1
+        flight = flight.parent
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work.
+
+    The first caller for a key starts the work; callers arriving with the
+    same key while it is in flight await the same result instead of
+    repeating it. The work keeps running as long as anyone still waits for
+    it, so one impatient client disconnecting does not fail the others.
+    Once it finishes the key is forgotten: this is not a cache.
+
+    Each caller waits under its own deadline. A follower whose deadline
+    passes gives up alone, and one whose leader ran out of time first
+    starts the work again if its own deadline still allows.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.upstream_calls_saved = 0
+
+    def _landed(self, key: Hashable, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            # Every follower would have made the same upstream calls as the leader
+            saved = flight.upstream_calls * flight.followers
+            self.upstream_calls_saved += saved
+        if saved:
+            logger.info(f"{self.name}: {flight.followers} coalesced callers saved {saved} upstream calls")
+
+    def _join(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> Tuple[_Flight, bool]:
+        """Return the flight for key, starting one if none is running, and whether this caller leads it."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._flights.get(key)
+            # Futures cannot be awaited across event loops; a finished flight may not have landed yet
+            if flight is not None and flight.task.get_loop() is loop and not flight.task.done():
+                flight.followers += 1
+                self.coalesced += 1
+                leading = False
+            else:
+                flight = _Flight(_current_flight.get())
+                context = contextvars.copy_context()
+                context.run(_current_flight.set, flight)
+                # The task copies the context it is created in
+                flight.task = context.run(loop.create_task, call())
+                flight.task.add_done_callback(lambda _, key=key, flight=flight: self._landed(key, flight))
+                self._flights[key] = flight
+                self.leaders += 1
+                leading = True
+            flight.waiters += 1
+        return flight, leading
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """
+        Run call() unless identical work is already in flight, and return its result.
+
+        Args:
+            key (Hashable): Identifies identical work
+            call (Callable[[], Awaitable[T]]): Starts the work
+            deadline (Optional[float]): time.monotonic() instant this caller waits until;
+                defaults to the deadline in effect
+
+        Returns:
+            T: The (shared) result
+
+        Raises:
+            DeadlineExceeded: If this caller's deadline passes first
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        while True:
+            flight, leading = self._join(key, call)
+            try:
+                return await run_with_deadline(asyncio.shield(flight.task), deadline)
+            except (asyncio.CancelledError, DeadlineExceeded) as e:
+                # Abandon the work only when nobody else is waiting for it
+                if flight.waiters == 1 and not flight.task.done():
+                    flight.task.cancel()
+                out_of_time = deadline is not None and time.monotonic() >= deadline
+                if leading or out_of_time or not isinstance(e, DeadlineExceeded) or not flight.task.done():
+                    raise
+                # The leader ran out of its own time; this caller still has some, so start over
+                logger.info(f"{self.name}: leader ran past its deadline, follower retrying")
+            finally:
+                flight.waiters -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'upstream_calls_saved': self.upstream_calls_saved
+            }
+
+
+# Whole generation requests, keyed on (document hash, task, chunk, cache bypass)
+generation_flights = SingleFlight('generation')
+# Individual LLM completions, keyed on the completion cache key
+completion_flights = SingleFlight('completion')
@@ -0,0 +1,75 @@
+from typing import Dict, List
+from services.copilot_service import copilot_client
+from services.response_types import ResultItem
+from utils.logger_config import setup_logger
+
+logger = setup_logger('study_pack_service', 'study_pack_service.log')
+
+FLASHCARD_COUNT = 10
+MIN_CONCEPTS = 3
+
+
+class StudyPackService:
+    """
+    Flashcards, quiz questions and learning concepts from one completion.
+
+    Requesting all three from the same call sends the source text to the
+    model once instead of three times, which roughly divides prompt tokens
+    and upstream requests by three for clients that want everything.
+    """
+
+    def __init__(self):
+        logger.info("Initialized StudyPackService")
+
+    def build_prompt(self, text: str, question_count: int) -> str:
+        return f"""Create a complete study pack from the following text. Provide:
+1. flashcards: exactly {FLASHCARD_COUNT} flashcards, each with a clear, concise question and a detailed, accurate answer
+2. quiz: {question_count} multiple choice questions, each with exactly 4 options labeled A, B, C and D,
+   the correct_answer (one of the options) and an explanation of why it is correct
+3. concepts: at least {MIN_CONCEPTS} key concepts, each with a concept name, a clear definition,
+   a real_world_application and a latest_insight (recent research or discovery, with a citation if possible)
+
+Cover different key concepts from the text in each section.
+
+Format the response as a JSON object with 'flashcards', 'quiz' and 'concepts' arrays.
+
+Text:
+{text}"""
+
+    async def generate_study_pack(self, text: str, question_count: int = 5) -> Dict[str, List[ResultItem]]:
+        """
+        Generate all three kinds of study material from the given text.
+
+        Args:
+            text (str): The text to generate from
+            question_count (int): Number of quiz questions to ask for
+
+        Returns:
+            Dict[str, List[ResultItem]]: The valid 'flashcards', 'quiz' and 'learning_content' items
+        """
+        try:
+            logger.info("Starting study pack generation")
+            logger.debug("Input text length: %d characters", len(text))
+
+            # Invalid items of each kind are dropped when the response is parsed
+            pack = await copilot_client.generate_chat_completion(
+                [{"content": self.build_prompt(text, question_count)}], 'study_pack'
+            )
+            if len(pack['flashcards']) < FLASHCARD_COUNT:
+                logger.warning(f"Received only {len(pack['flashcards'])} flashcards, expected {FLASHCARD_COUNT}")
+            if len(pack['learning_content']) < MIN_CONCEPTS:
+                logger.warning(f"Received only {len(pack['learning_content'])} valid concepts, "
+                               f"expected at least {MIN_CONCEPTS}")
+
+            logger.info(
+                f"Generated {len(pack['flashcards'])} flashcards, {len(pack['quiz'])} quiz questions "
+                f"and {len(pack['learning_content'])} concepts"
+            )
+            return pack
+
+        except Exception as e:
+            logger.error(f"Error generating study pack: {str(e)}", exc_info=True)
+            raise
+
+# Create a singleton instance
+study_pack_service = StudyPackService()
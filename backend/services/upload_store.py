@@ -0,0 +1,338 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Optional
+from dotenv import load_dotenv
+from services.document_store import DocumentSession, document_store
+from utils.logger_config import setup_logger
+
+logger = setup_logger('upload_store', 'upload_store.log')
+
+DEFAULT_UPLOAD_TTL = 60 * 60  # 1 hour since the last chunk
+DEFAULT_MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024  # Well under the per-request MAX_CONTENT_LENGTH
+WRITE_BLOCK_SIZE = 256 * 1024
+SWEEP_INTERVAL = 60
+
+_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadRangeError(ValueError):
+    """A chunk that does not continue the upload where it left off."""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+class UploadDigestError(ValueError):
+    """The assembled bytes do not hash to the SHA-256 the client declared."""
+
+
+class UploadAbortedError(ValueError):
+    """The upload was deleted or expired while a chunk was being written."""
+
+
+class UploadSession:
+    """A PDF arriving in byte ranges, hashed as each range is written."""
+
+    def __init__(self, upload_id: str, filename: str, size: int, declared_digest: Optional[str],
+                 filepath: Optional[str]):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.declared_digest = declared_digest
+        self.filepath = filepath
+        self.received = 0
+        self.hasher = hashlib.sha256()
+        self.document_id: Optional[str] = None
+        self.deduplicated = False
+        # Set once the upload leaves the store; its file is removed by whoever holds lock
+        self.aborted = False
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        # Held while a chunk is written; a second writer is turned away rather than queued
+        self.lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return self.document_id is not None
+
+    def to_dict(self, ttl: int) -> Dict:
+        response = {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'received': self.received,
+            'complete': self.complete,
+            'expires_in': max(0, int(self.last_access + ttl - time.time()))
+        }
+        if self.complete:
+            response['document_id'] = self.document_id
+            response['deduplicated'] = self.deduplicated
+        return response
+
+
+class UploadStore:
+    """
+    Resumable uploads assembled from byte ranges into document sessions.
+
+    Chunks must arrive in order; each is appended to a uniquely named file and
+    fed to a running SHA-256, so the digest is ready the moment the last byte
+    lands and the PDF is never read twice. A chunk that overlaps bytes already
+    received (a retry after a lost response) has the overlap skipped, and a
+    chunk cut off mid-transfer keeps the bytes that made it, so a client only
+    ever resends from the 'received' offset.
+
+    Early deduplication only happens when the client declares the file's
+    SHA-256 up front, and only against live document_store sessions: if one
+    already holds those bytes, the upload completes at once, before (or part
+    way through) the transfer, as a new session sharing them. Text in the
+    extraction cache alone does not skip the transfer, since a session must
+    keep the PDF to re-extract it; it is reused once the upload finishes.
+
+    Deleting an upload while a chunk is being written marks it aborted; the
+    writer then removes the file and fails instead of finishing it.
+    """
+
+    def __init__(self, directory: str = 'uploads', ttl: Optional[int] = None,
+                 max_bytes: Optional[int] = None, chunk_size: Optional[int] = None):
+        load_dotenv()
+        if ttl is None:
+            ttl = int(os.getenv('UPLOAD_SESSION_TTL', DEFAULT_UPLOAD_TTL))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('UPLOAD_MAX_BYTES', DEFAULT_MAX_UPLOAD_BYTES))
+        if chunk_size is None:
+            chunk_size = int(os.getenv('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._uploads: Dict[str, UploadSession] = {}
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+        self.bytes_skipped = 0
+        logger.info(f"Initialized UploadStore (ttl={self.ttl}s, max_bytes={self.max_bytes}, "
+                    f"chunk_size={self.chunk_size})")
+
+    def _remove(self, upload_id: str) -> Optional[UploadSession]:
+        """
+        Drop an upload and its partial file. Caller holds the lock.
+
+        If a chunk is being written, the writer owns the file: it sees the
+        upload is aborted and removes the file itself when it finishes.
+        """
+        upload = self._uploads.pop(upload_id, None)
+        if upload is None:
+            return None
+        upload.aborted = True
+        if upload.lock.acquire(blocking=False):
+            try:
+                self._remove_file(upload)
+            finally:
+                upload.lock.release()
+        return upload
+
+    @staticmethod
+    def _remove_file(upload: UploadSession):
+        if upload.filepath and os.path.exists(upload.filepath):
+            os.remove(upload.filepath)
+        upload.filepath = None
+
+    def _sweep(self):
+        """Expire idle uploads, finished or not. Caller holds the lock."""
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        expired = [upload_id for upload_id, upload in self._uploads.items()
+                   if now - upload.last_access > self.ttl and not upload.lock.locked()]
+        for upload_id in expired:
+            self._remove(upload_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} uploads")
+
+    def _deduplicate(self, upload: UploadSession) -> bool:
+        """Complete the upload from a live session with the declared digest, if there is one."""
+        if upload.declared_digest is None:
+            return False
+        existing = document_store.find_by_digest(upload.declared_digest)
+        if existing is None:
+            return False
+        try:
+            session = document_store.create(existing.pdf_bytes, upload.filename, existing.digest)
+        except ValueError:
+            # Store is full; let the transfer go on and report it when the upload finishes
+            return False
+        skipped = upload.size - upload.received
+        upload.document_id = session.document_id
+        upload.deduplicated = True
+        self._remove_file(upload)
+        with self._lock:
+            self.deduplicated += 1
+            self.bytes_skipped += skipped
+        logger.info(f"Upload {upload.upload_id} matched document {existing.document_id}, "
+                    f"skipped {skipped} of {upload.size} bytes")
+        return True
+
+    def create(self, filename: str, size: int, digest: Optional[str] = None) -> UploadSession:
+        """
+        Start an upload.
+
+        Args:
+            filename (str): Original (sanitized) filename
+            size (int): Total size of the PDF in bytes
+            digest (str, optional): SHA-256 hex digest of the whole file, checked on completion
+
+        Returns:
+            UploadSession: The new upload, already complete if the digest matched a live document
+
+        Raises:
+            ValueError: If the size or digest is invalid, or the file exceeds the upload limit
+        """
+        if size <= 0:
+            raise ValueError("size must be a positive number of bytes")
+        if size > self.max_bytes:
+            raise ValueError(f"File exceeds the {self.max_bytes} byte upload limit")
+        if digest is not None:
+            digest = digest.lower()
+            if not _SHA256_PATTERN.match(digest):
+                raise ValueError("sha256 must be 64 hexadecimal characters")
+
+        upload = UploadSession(uuid.uuid4().hex, filename, size, digest, None)
+        if self._deduplicate(upload):
+            logger.info(f"Created upload {upload.upload_id} for {filename}, complete without transfer")
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, upload.filepath = tempfile.mkstemp(prefix='upload-', suffix='.part', dir=self.directory)
+            os.close(fd)
+            logger.info(f"Created upload {upload.upload_id} for {filename} ({size} bytes)")
+        with self._lock:
+            self._sweep()
+            self._uploads[upload.upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        """Return a live upload and extend its TTL, or None if unknown or expired."""
+        with self._lock:
+            self._sweep()
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return None
+            if time.time() - upload.last_access > self.ttl and not upload.lock.locked():
+                self._remove(upload_id)
+                return None
+            upload.last_access = time.time()
+            return upload
+
+    def write(self, upload: UploadSession, start: int, total: int, stream: BinaryIO, length: int) -> Optional[DocumentSession]:
+        """
+        Append the byte range [start, start + length) read from stream.
+
+        Bytes before upload.received are read and discarded. If the stream ends
+        early, the bytes read so far are kept and the error is re-raised. Once
+        the last byte is written (or if it already was), the upload is turned
+        into a document session.
+
+        Args:
+            upload (UploadSession): The upload, from get()
+            start (int): Offset of the first byte in the body
+            total (int): Total file size the client claims, which must match the upload
+            stream (BinaryIO): Request body
+            length (int): Number of bytes in the body
+
+        Returns:
+            DocumentSession: The finished document, or None while bytes are missing
+
+        Raises:
+            UploadRangeError: If the range leaves a gap, the size differs, or another chunk is being written
+            UploadDigestError: If the finished file does not match the declared SHA-256
+            UploadAbortedError: If the upload was deleted or expired before or while the chunk was written
+            ValueError: If the document store is full
+        """
+        if total != upload.size or start + length > upload.size:
+            raise UploadRangeError(f"Range does not fit a {upload.size} byte upload", upload.received)
+        if not upload.lock.acquire(blocking=False):
+            raise UploadRangeError("Another chunk of this upload is being written", upload.received)
+        try:
+            if upload.complete:
+                return document_store.get(upload.document_id)
+            if upload.aborted:
+                raise UploadAbortedError("Upload was deleted")
+            if start > upload.received:
+                raise UploadRangeError(f"Expected a chunk starting at byte {upload.received}", upload.received)
+            if self._deduplicate(upload):
+                return document_store.get(upload.document_id)
+
+            skip = upload.received - start
+            remaining = length
+            with open(upload.filepath, 'ab') as part:
+                while remaining:
+                    block = stream.read(min(WRITE_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    if skip:
+                        overlap = min(skip, len(block))
+                        block = block[overlap:]
+                        skip -= overlap
+                    if block:
+                        part.write(block)
+                        upload.hasher.update(block)
+                        upload.received += len(block)
+            upload.last_access = time.time()
+
+            if upload.aborted:
+                raise UploadAbortedError("Upload was deleted while the chunk was written")
+            if upload.received < upload.size:
+                return None
+            return self._finish(upload)
+        finally:
+            # Under the store lock, so a concurrent _remove either sees the upload locked or removes the file itself
+            with self._lock:
+                if upload.aborted:
+                    self._remove_file(upload)
+                upload.lock.release()
+
+    def _finish(self, upload: UploadSession) -> DocumentSession:
+        """Turn a fully received upload into a document session. Caller holds upload.lock."""
+        digest = upload.hasher.copy().hexdigest()
+        if upload.declared_digest is not None and digest != upload.declared_digest:
+            with self._lock:
+                self._remove(upload.upload_id)
+            raise UploadDigestError(f"Upload does not match the declared sha256 (got {digest})")
+
+        with open(upload.filepath, 'rb') as part:
+            pdf_bytes = part.read()
+        # A full store raises here and leaves the file in place; resending the last chunk retries
+        session = document_store.create(pdf_bytes, upload.filename, digest)
+        if upload.aborted:
+            document_store.delete(session.document_id)
+            raise UploadAbortedError("Upload was deleted while it was being finished")
+        upload.document_id = session.document_id
+        self._remove_file(upload)
+        logger.info(f"Upload {upload.upload_id} complete as document {session.document_id}")
+        return session
+
+    def delete(self, upload_id: str) -> bool:
+        """Abort an upload and remove its partial file. Returns False if it did not exist."""
+        with self._lock:
+            return self._remove(upload_id) is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'active': sum(1 for upload in self._uploads.values() if not upload.complete),
+                'complete': sum(1 for upload in self._uploads.values() if upload.complete),
+                'bytes_pending': sum(upload.received for upload in self._uploads.values() if not upload.complete),
+                'deduplicated': self.deduplicated,
+                'bytes_skipped': self.bytes_skipped
+            }
+
+# Create a singleton instance
+upload_store = UploadStore()
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar('T')
+
+# time.monotonic() instant by which the work the current code belongs to must be done
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time before the work finished."""
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """The instant `seconds` from now, but never later than the deadline already in effect."""
+    inherited = _deadline.get()
+    if seconds is None:
+        return inherited
+    deadline = time.monotonic() + seconds
+    return deadline if inherited is None else min(inherited, deadline)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def time_remains(seconds: float) -> bool:
+    """True unless the current deadline is less than `seconds` away."""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+
+
+async def run_with_deadline(awaitable: Awaitable[T], deadline: Optional[float]) -> T:
+    """
+    Await awaitable under deadline, visible to every nested call.
+
+    Nested calls read the deadline to size their own timeouts and decide
+    whether a retry or a follow-up call still fits; the awaitable is also
+    cancelled outright if it runs past the deadline.
+
+    Raises:
+        DeadlineExceeded: If the deadline passes first
+    """
+    token = _deadline.set(deadline)
+    try:
+        if deadline is None:
+            return await awaitable
+        try:
+            # wait_for runs the awaitable in a task that copies this context, deadline included
+            return await asyncio.wait_for(awaitable, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError as e:
+            if time.monotonic() < deadline:
+                raise
+            raise DeadlineExceeded("Deadline exceeded") from e
+    finally:
+        _deadline.reset(token)
@@ -0,0 +1,152 @@
+import asyncio
+import atexit
+import contextvars
+import os
+import threading
+from concurrent.futures import Future
+from typing import AsyncIterator, Coroutine, Iterator, Optional, TypeVar
+from utils.logger_config import setup_logger
+
+logger = setup_logger('event_loop', 'event_loop.log')
+
+T = TypeVar('T')
+
+_EXHAUSTED = object()
+
+
+async def _next_item(iterator: AsyncIterator):
+    # StopAsyncIteration cannot cross a concurrent Future, so signal the end with a sentinel
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+class BackgroundLoop:
+    """
+    A long-lived asyncio event loop running in a daemon thread.
+
+    Async views and objects bound to an event loop (aiohttp sessions and their
+    connection pools) live here for the whole life of the process instead of
+    dying with a short-lived per-request loop, so every in-flight upstream
+    call in the process is multiplexed on one loop. The loop is started on
+    first use and started again in a child process after a fork.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                # After a fork the parent's loop thread does not exist in this process
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+                logger.info(f"Started background event loop {self.name} in process {self._pid}")
+            return self._loop
+
+    def is_current(self) -> bool:
+        """True when called from code running on this loop."""
+        try:
+            return asyncio.get_running_loop() is self._loop and self._pid == os.getpid()
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine, context: Optional[contextvars.Context] = None) -> Future:
+        """
+        Schedule a coroutine on the loop from any thread.
+
+        Args:
+            coro (Coroutine): The coroutine to run
+            context (Optional[contextvars.Context]): Context the task runs in, e.g. a
+                copy of the caller's so Flask's request context stays visible
+
+        Returns:
+            Future: Resolves with the coroutine's result; cancelling it cancels the task
+        """
+        loop = self.loop
+        future: Future = Future()
+
+        def start():
+            if not future.set_running_or_notify_cancel():
+                coro.close()
+                return
+            task = loop.create_task(coro)
+
+            def copy_result(done_task: asyncio.Task):
+                if done_task.cancelled():
+                    future.cancel()
+                elif done_task.exception() is not None:
+                    future.set_exception(done_task.exception())
+                else:
+                    future.set_result(done_task.result())
+
+            def cancel_task(done_future: Future):
+                if done_future.cancelled():
+                    loop.call_soon_threadsafe(task.cancel)
+
+            task.add_done_callback(copy_result)
+            future.add_done_callback(cancel_task)
+
+        # The task inherits the context the callback runs in
+        loop.call_soon_threadsafe(start, context=context or contextvars.copy_context())
+        return future
+
+    async def run(self, coro: Coroutine) -> T:
+        """Await a coroutine on this loop from any other event loop."""
+        if self.is_current():
+            return await coro
+        # Cancelling the caller cancels the task on the background loop too
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def call(self, coro: Coroutine, timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the loop, in the caller's context, and block the calling thread for its result."""
+        future = self.submit(coro, contextvars.copy_context())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, iterator: AsyncIterator[T], timeout: Optional[float] = None) -> Iterator[T]:
+        """
+        Consume an async iterator that lives on the loop from synchronous code.
+
+        Closing the returned generator (e.g. when a streaming client disconnects)
+        closes the async iterator on the loop, so its cleanup still runs.
+
+        Args:
+            iterator (AsyncIterator[T]): Async generator to drive on the loop
+            timeout (Optional[float]): Seconds to wait for each item
+        """
+        try:
+            while True:
+                item = self.call(_next_item(iterator), timeout)
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            aclose = getattr(iterator, 'aclose', None)
+            if aclose is not None:
+                try:
+                    self.call(aclose(), timeout=5)
+                except Exception as e:
+                    logger.warning(f"Error closing async iterator: {str(e)}")
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# Create a singleton instance
+shared_loop = BackgroundLoop('shared-loop')
+atexit.register(shared_loop.stop)
@@ -0,0 +1,44 @@
+import dataclasses
+import json
+from typing import Any, Union
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is in requirements.txt; the standard library is the slow fallback
+    orjson = None
+
+
+def _default(obj: Any):
+    if dataclasses.is_dataclass(obj):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text; result models (dataclasses) are serialized natively."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode('utf-8')
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, so jsonify() serializes result models without copying them to dicts."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj)
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
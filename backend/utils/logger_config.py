@@ -1,42 +1,198 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+DEFAULT_QUEUE_SIZE = 10000
+# Share of requests whose full prompts and responses are dumped at DEBUG level
+DEFAULT_PAYLOAD_SAMPLE_RATE = 0.01
+DEFAULT_PAYLOAD_MAX_CHARS = 4000
+
+FILE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the logging thread without ever blocking the caller.
+
+    The message is formatted here (so later changes to the arguments cannot
+    alter it), but all file and console I/O happens on the listener thread.
+    If the queue is full the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _FileRouter(logging.Handler):
+    """Writes each record to the log file of the logger that emitted it."""
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}  # logger name -> RotatingFileHandler
+
+    def handle(self, record: logging.LogRecord):
+        handler = self.files.get(record.name)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+
+    def flush(self):
+        for handler in self.files.values():
+            handler.flush()
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class _LogPipeline:
+    """
+    The process-wide logging backend: one queue, one listener thread, and
+    one file handler per log file, shared by every logger setup_logger made.
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self.queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+        self.queue_handler = _DroppingQueueHandler(self.queue)
+        self.router = _FileRouter()
+        self.console = logging.StreamHandler()
+        self.console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        self._file_handlers = {}  # log file -> RotatingFileHandler
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def file_handler(self, log_file: str, level: int) -> RotatingFileHandler:
+        handler = self._file_handlers.get(log_file)
+        if handler is None:
+            if not os.path.exists('logs'):
+                os.makedirs('logs')
+            handler = RotatingFileHandler(
+                f'logs/{log_file}',
+                maxBytes=10*1024*1024,  # 10MB
+                backupCount=5,
+                delay=True
+            )
+            handler.setFormatter(logging.Formatter(FILE_FORMAT))
+            self._file_handlers[log_file] = handler
+        handler.setLevel(min(handler.level or level, level))
+        return handler
+
+    def ensure_started(self):
+        """Start the listener thread if it is not running in this process."""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.console, self.router, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def after_fork(self):
+        """A forked child has the parent's queue and lock but not its listener thread."""
+        self._lock = threading.Lock()
+        if self._listener is None:
+            return
+        # Records still queued by the parent belong to the parent
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.queue_handler.queue = self.queue
+        self._listener = None
+        self.ensure_started()
+
+    def stop(self):
+        """Write out everything still queued; called at interpreter exit."""
+        with self._lock:
+            if self._listener is None or self._pid != os.getpid():
+                return
+            self._listener.stop()
+            self._listener = None
+        self.router.flush()
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'dropped': self.queue_handler.dropped}
+
+
+_pipeline = _LogPipeline()
+atexit.register(_pipeline.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_pipeline.after_fork)
+
+
+def _env_level(level):
+    name = os.getenv('LOG_LEVEL')
+    if not name:
+        return level
+    return logging.getLevelName(name.upper()) if not name.isdigit() else int(name)
+
 
 def setup_logger(name, log_file, level=logging.INFO):
-    """Set up a logger with file and console handlers."""
-    
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
+    """
+    Set up a logger whose file and console output is written by a background thread.
+
+    Safe to call repeatedly: a logger is only wired to the pipeline once.
+    LOG_LEVEL in the environment overrides level for every logger.
+    """
+    level = _env_level(level)
+
     # Create logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
-    # Create formatters
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    console_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s'
-    )
-    
-    # Create file handler
-    file_handler = RotatingFileHandler(
-        f'logs/{log_file}',
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(level)
-    file_handler.setFormatter(file_formatter)
-    
-    # Create console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    console_handler.setFormatter(console_formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger 
\ No newline at end of file
+    logger.propagate = False
+
+    _pipeline.router.files[name] = _pipeline.file_handler(log_file, level)
+    _pipeline.console.setLevel(min(_pipeline.console.level or level, level))
+    if _pipeline.queue_handler not in logger.handlers:
+        logger.addHandler(_pipeline.queue_handler)
+    _pipeline.ensure_started()
+
+    return logger
+
+
+def logging_stats():
+    """Records waiting to be written, and records dropped because the queue was full."""
+    return _pipeline.stats()
+
+
+def sample_payloads(logger, rate=None):
+    """
+    Whether to dump full request and response payloads for one call.
+
+    Only true at DEBUG level, and then for LOG_PAYLOAD_SAMPLE_RATE of calls, so
+    turning DEBUG on in production does not serialize every prompt.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    if rate is None:
+        rate = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', DEFAULT_PAYLOAD_SAMPLE_RATE))
+    return random.random() < rate
+
+
+class LazyJSON:
+    """A log argument that is serialized only if the record is actually emitted, and truncated."""
+
+    __slots__ = ('value', 'max_chars')
+
+    def __init__(self, value, max_chars=None):
+        self.value = value
+        self.max_chars = max_chars if max_chars is not None else int(
+            os.getenv('LOG_PAYLOAD_MAX_CHARS', DEFAULT_PAYLOAD_MAX_CHARS))
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, indent=2, default=str)
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... ({len(text) - self.max_chars} more chars)"
+        return text
@@ -0,0 +1,175 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Seconds; generation stages range from microseconds (parsing) to minutes (upstream calls)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stages
+UPLOAD = 'upload'
+HASH = 'hash'
+PDF_PARSE = 'pdf_parse'
+EXTRACT = 'extract'
+SEGMENT = 'segment'
+PROMPT = 'prompt'
+LLM_QUEUE = 'llm_queue'
+UPSTREAM = 'upstream'
+RETRY_BACKOFF = 'retry_backoff'
+PARSE = 'parse'
+SERIALIZE = 'serialize'
+
+
+class RequestTimings:
+    """Stage durations and counts of one HTTP request, for its Server-Timing header."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: Dict[str, List[float]] = {}  # stage -> [seconds, calls]
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def add_count(self, name: str, amount: int):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: one entry per stage, then the counts, then the total.
+
+        Stages run concurrently (segments are generated in parallel), so a stage's
+        duration is the sum over its calls and may exceed the request's total.
+        """
+        with self._lock:
+            entries = [
+                f'{stage};dur={seconds * 1000:.1f};desc="{calls}x"'
+                for stage, (seconds, calls) in self.stages.items()
+            ]
+            entries.extend(f'{name.replace("_", "-")};desc={amount}' for name, amount in self.counts.items())
+        entries.append(f'total;dur={(time.monotonic() - self.started) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+# The timings of the request the current code runs for; copied into tasks and threads started for it
+_request_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar('request_timings', default=None)
+
+
+def start_request() -> RequestTimings:
+    """Start collecting timings for a new request in the current context."""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def current_request() -> Optional[RequestTimings]:
+    return _request_timings.get()
+
+
+class Histogram:
+    """A Prometheus histogram with one label."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List] = {}  # label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(value, list(counts), total, count) for value, (counts, total, count) in self._series.items()]
+        for label_value, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound:g}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {count}'
+            yield f'{self.name}_sum{{{self.label}="{label_value}"}} {total:.6f}'
+            yield f'{self.name}_count{{{self.label}="{label_value}"}} {count}'
+
+
+class Counter:
+    """A Prometheus counter, optionally with one label, also added to the current request's counts."""
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None, request_name: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        # Name in the Server-Timing header; None keeps the counter out of it
+        self.request_name = request_name
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, label_value: str = ''):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+        timings = _request_timings.get()
+        if timings is not None and self.request_name is not None:
+            timings.add_count(self.request_name, amount)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_value, value in values:
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ''
+            yield f"{self.name}{labels} {value:g}"
+
+
+STAGE_SECONDS = Histogram('generation_stage_seconds', 'Time spent in each stage of request handling', 'stage')
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time until the response starts, by endpoint', 'endpoint')
+PROMPT_CHARS = Counter('llm_prompt_chars_total', 'Prompt characters sent to the LLM', request_name='prompt_chars')
+UPSTREAM_CALLS = Counter('llm_upstream_calls_total', 'HTTP calls made to the LLM, by outcome', 'outcome',
+                         request_name='upstream_calls')
+UPSTREAM_RETRIES = Counter('llm_upstream_retries_total', 'Upstream calls retried after a transient failure',
+                           request_name='retries')
+ITEMS_RETURNED = Counter('generated_items_total', 'Generated items returned to clients, by field', 'field',
+                         request_name='items')
+
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, PROMPT_CHARS, UPSTREAM_CALLS, UPSTREAM_RETRIES, ITEMS_RETURNED]
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record one run of a stage, globally and for the current request."""
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as one run of stage, whether or not it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def render_prometheus() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
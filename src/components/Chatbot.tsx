@@ -36,8 +36,8 @@ export const Chatbot: React.FC<ChatbotProps> = ({ isOpen, onClose }) => {
     try {
       const res = await fetch(`${process.env.REACT_APP_API_URL}/api/chat`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ messages: updatedMessages }),
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+        body: JSON.stringify({ messages: updatedMessages, stream: true }),
       });
 
       if (!res.ok) {
@@ -51,9 +51,47 @@ export const Chatbot: React.FC<ChatbotProps> = ({ isOpen, onClose }) => {
         throw new Error(errText);
       }
 
-      const data = await res.json();
+      if (!res.body) {
+        const data = await res.json();
+        setMessages([...updatedMessages, { role: "assistant", content: data.response }]);
+        return;
+      }
+
+      // Render the reply as Server-Sent Events arrive, token by token
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let reply = "";
+      setIsLoading(false);
+      setMessages([...updatedMessages, { role: "assistant", content: "" }]);
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
 
-      setMessages([...updatedMessages, { role: "assistant", content: data.response }]);
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf("\n\n");
+
+          let eventName = "message";
+          let data = "";
+          for (const line of rawEvent.split("\n")) {
+            if (line.startsWith("event: ")) eventName = line.slice(7);
+            else if (line.startsWith("data: ")) data += line.slice(6);
+          }
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (eventName === "error") {
+            throw new Error(payload.error || "The reply was interrupted");
+          }
+          reply = eventName === "done" ? payload.response : reply + payload.text;
+          setMessages([...updatedMessages, { role: "assistant", content: reply }]);
+        }
+      }
     } catch (err) {
       console.error(err);
       setMessages([
@@ -33,6 +33,22 @@ interface PDFUploaderProps {
 type ProcessingStatus = 'idle' | 'uploading' | 'processing' | 'generating_flashcards' | 'generating_learning' | 'generating_quiz' | 'complete' | 'error';
 
 const LARGE_FILE_THRESHOLD = 5 * 1024 * 1024; // 5MB in bytes
+const UPLOAD_RETRIES = 5;
+
+interface UploadedDocument {
+  document_id: string;
+  total_pages: number;
+}
+
+const uploadKey = (file: File) => `pdf-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+// SHA-256 lets the server skip the transfer when it already has the file. crypto.subtle
+// only exists in secure contexts, so over plain http the upload simply goes without it.
+const hashFile = async (file: File): Promise<string | undefined> => {
+  if (!window.crypto?.subtle) return undefined;
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
 
 export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) => {
   const { toast } = useToast();
@@ -47,8 +63,87 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
     setProgress(newProgress);
   };
 
+  // Upload a large PDF in byte ranges, resuming an earlier interrupted upload of the same file
+  const uploadLargeFile = async (file: File): Promise<UploadedDocument> => {
+    const apiUrl = process.env.REACT_APP_API_URL;
+    let upload: any = null;
+
+    const savedId = localStorage.getItem(uploadKey(file));
+    if (savedId) {
+      const statusResponse = await fetch(`${apiUrl}/api/uploads/${savedId}`);
+      if (statusResponse.ok) upload = await statusResponse.json();
+    }
+    if (!upload) {
+      const createResponse = await fetch(`${apiUrl}/api/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, sha256: await hashFile(file) }),
+      });
+      if (!createResponse.ok) {
+        throw new Error('Failed to start upload');
+      }
+      upload = await createResponse.json();
+      if (upload.upload_id && !upload.document_id) {
+        localStorage.setItem(uploadKey(file), upload.upload_id);
+      }
+    }
+
+    const chunkSize = upload.chunk_size || 4 * 1024 * 1024;
+    let received = upload.received || 0;
+    let retries = 0;
+    while (!upload.document_id) {
+      const end = Math.min(received + chunkSize, file.size);
+      updateProgress('uploading', 10 + (received / file.size) * 20);
+      let response: Response;
+      try {
+        response = await fetch(`${apiUrl}/api/uploads/${upload.upload_id}`, {
+          method: 'PUT',
+          body: file.slice(received, end),
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': `bytes ${received}-${end - 1}/${file.size}`,
+          },
+        });
+      } catch (networkError) {
+        // The server keeps whatever arrived; ask it where to carry on from
+        if (++retries > UPLOAD_RETRIES) throw networkError;
+        const statusResponse = await fetch(`${apiUrl}/api/uploads/${upload.upload_id}`).catch(() => null);
+        if (statusResponse?.ok) {
+          upload = await statusResponse.json();
+          received = upload.received;
+        }
+        continue;
+      }
+
+      const data = await response.json();
+      if (response.status === 409) {
+        if (++retries > UPLOAD_RETRIES) throw new Error(data.error || 'Upload out of sync');
+        received = data.received;
+        continue;
+      }
+      if (!response.ok) {
+        localStorage.removeItem(uploadKey(file));
+        throw new Error(data.error || 'Failed to upload PDF');
+      }
+      retries = 0;
+      upload = data;
+      received = data.received ?? file.size;
+    }
+
+    localStorage.removeItem(uploadKey(file));
+    if (upload.total_pages === undefined) {
+      // Resumed after completion: the upload status has the document_id but not its metadata
+      const documentResponse = await fetch(`${apiUrl}/api/documents/${upload.document_id}`);
+      if (!documentResponse.ok) {
+        throw new Error('Uploaded document has expired');
+      }
+      return documentResponse.json();
+    }
+    return upload;
+  };
+
   const processChunk = async (
-    formData: FormData,
+    documentId: string,
     endpoint: string,
     chunkNumber: number,
     totalChunks: number,
@@ -73,8 +168,9 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
     }`,
     {
       method: 'POST',
-      body: formData,
+      body: JSON.stringify({ document_id: documentId }),
       headers: {
+        'Content-Type': 'application/json',
         'Accept': 'application/json',
         'X-Chunk-Number': chunkNumber.toString(),
         'X-Total-Chunks': totalChunks.toString(),
@@ -89,19 +185,23 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
   };
 
   const processSmallFile = async (formData: FormData) => {
-    // Generate flashcards
+    // Flashcards, learning content and quiz questions come from one request
     updateProgress('generating_flashcards', 33);
-    const flashcardResponse = await fetch(`${process.env.REACT_APP_API_URL}/api/flashcards/generate`,  {
+    const studyPackResponse = await fetch(`${process.env.REACT_APP_API_URL}/api/study-pack`, {
       method: 'POST',
       body: formData,
+      headers: {
+        'Accept': 'application/json',
+      }
     });
 
-    if (!flashcardResponse.ok) {
+    if (!studyPackResponse.ok) {
       throw new Error('Failed to generate flashcards');
     }
 
-    const flashcardData = await flashcardResponse.json();
-    const validFlashcards = flashcardData.flashcards.filter((card: any) =>
+    updateProgress('generating_quiz', 90);
+    const studyPackData = await studyPackResponse.json();
+    const validFlashcards = (studyPackData.flashcards || []).filter((card: any) =>
       card && typeof card === 'object' &&
       typeof card.question === 'string' &&
       typeof card.answer === 'string' &&
@@ -109,54 +209,29 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
       card.answer.trim() !== ''
     );
 
-    // Generate learning content
-    updateProgress('generating_learning', 66);
-    const learningResponse = await fetch(`${process.env.REACT_APP_API_URL}/api/learning/enhanced`,{
-      method: 'POST',
-      body: formData,
-    });
-
-    let validLearningContent: LearningContent[] = [];
-    if (learningResponse.ok) {
-      const learningData = await learningResponse.json();
-      validLearningContent = learningData.learning_content.filter((content: any) =>
-        content &&
-        typeof content === 'object' &&
-        typeof content.concept === 'string' &&
-        typeof content.definition === 'string' &&
-        typeof content.real_world_application === 'string' &&
-        typeof content.latest_insight === 'string' &&
-        content.concept.trim() !== '' &&
-        content.definition.trim() !== ''
-      );
-    }
-
-    // Generate quiz questions
-    updateProgress('generating_quiz', 90);
-    const quizResponse = await fetch(`${process.env.REACT_APP_API_URL}/api/quiz/generate`, {
-      method: 'POST',
-      body: formData,
-      headers: {
-        'Accept': 'application/json',
-      }
-    });
+    const validLearningContent: LearningContent[] = (studyPackData.learning_content || []).filter((content: any) =>
+      content &&
+      typeof content === 'object' &&
+      typeof content.concept === 'string' &&
+      typeof content.definition === 'string' &&
+      typeof content.real_world_application === 'string' &&
+      typeof content.latest_insight === 'string' &&
+      content.concept.trim() !== '' &&
+      content.definition.trim() !== ''
+    );
 
-    let validQuizQuestions: QuizQuestion[] = [];
-    if (quizResponse.ok) {
-      const quizData = await quizResponse.json();
-      validQuizQuestions = quizData.quiz.filter((question: any) =>
-        question &&
-        typeof question === 'object' &&
-        typeof question.question === 'string' &&
-        Array.isArray(question.options) &&
-        question.options.length === 4 &&
-        typeof question.correct_answer === 'string' &&
-        typeof question.explanation === 'string' &&
-        question.question.trim() !== '' &&
-        question.correct_answer.trim() !== '' &&
-        question.explanation.trim() !== ''
-      );
-    }
+    const validQuizQuestions: QuizQuestion[] = (studyPackData.quiz || []).filter((question: any) =>
+      question &&
+      typeof question === 'object' &&
+      typeof question.question === 'string' &&
+      Array.isArray(question.options) &&
+      question.options.length === 4 &&
+      typeof question.correct_answer === 'string' &&
+      typeof question.explanation === 'string' &&
+      question.question.trim() !== '' &&
+      question.correct_answer.trim() !== '' &&
+      question.explanation.trim() !== ''
+    );
 
     return { validFlashcards, validLearningContent, validQuizQuestions };
   };
@@ -263,24 +338,15 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
 
       // Check if file is large enough to require chunking
       if (file.size > LARGE_FILE_THRESHOLD) {
-        // Get metadata for chunking
-        const metadataResponse = await fetch('http://192.168.31.10:5000/api/metadata', {
-          method: 'POST',
-          body: formData,
-        });
-
-        if (!metadataResponse.ok) {
-          throw new Error('Failed to get PDF metadata');
-        }
-
-        const metadata = await metadataResponse.json();
+        // Upload once; every chunk request then refers to the stored document
+        const metadata = await uploadLargeFile(file);
         const totalChunks = Math.ceil(metadata.total_pages / 5); // Assuming 5 pages per chunk
         setTotalChunks(totalChunks);
 
         // Process flashcards in chunks
         for (let i = 0; i < totalChunks; i++) {
           setCurrentChunk(i + 1);
-          const flashcardData = await processChunk(formData, 'flashcards/generate', i + 1, totalChunks, 'flashcards');
+          const flashcardData = await processChunk(metadata.document_id, 'flashcards/generate', i + 1, totalChunks, 'flashcards');
           const chunkFlashcards = flashcardData.flashcards.filter((card: any) =>
             card && typeof card === 'object' &&
             typeof card.question === 'string' &&
@@ -294,7 +360,7 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
         // Process learning content in chunks
         for (let i = 0; i < totalChunks; i++) {
           setCurrentChunk(i + 1);
-          const learningData = await processChunk(formData, 'learning/enhanced', i + 1, totalChunks, 'learning');
+          const learningData = await processChunk(metadata.document_id, 'learning/enhanced', i + 1, totalChunks, 'learning');
           const chunkLearningContent = learningData.learning_content.filter((content: any) =>
             content &&
             typeof content === 'object' &&
@@ -311,7 +377,7 @@ export const PDFUploader: React.FC<PDFUploaderProps> = ({ onUploadComplete }) =>
         // Process quiz questions in chunks
         for (let i = 0; i < totalChunks; i++) {
           setCurrentChunk(i + 1);
-          const quizData = await processChunk(formData, 'quiz/generate', i + 1, totalChunks, 'quiz');
+          const quizData = await processChunk(metadata.document_id, 'quiz/generate', i + 1, totalChunks, 'quiz');
           const chunkQuizQuestions = quizData.quiz.filter((question: any) =>
             question &&
             typeof question === 'object' &&